@@ -0,0 +1,106 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import crud
+import database
+import funnel
+import metrics
+import rollups
+from valuation_writer import ValuationWriter
+
+# Асинхронні обгортки над crud.py для виклику з обробників aiogram.
+# Запити виконуються у фонових потоках, тому повільний диск або заблокована БД
+# не зупиняють цикл подій (event loop) для інших користувачів.
+#
+# Читання виконується невеликим пулом потоків (кожен зі своїм постійним з'єднанням).
+# Записувачів два, кожен в одному власному потоці зі своїм з'єднанням:
+# - db-write (_write_executor) — користувачі, file_id сертифікатів та інші поодинокі
+#   записи; послідовна черга прибирає конкуренцію за блокування між обробниками;
+# - ValuationWriter — оцінки разом з агрегатами rollups, пакетами (group commit).
+# (Так само окремо пишуть funnel.FunnelRecorder і bot.fsm_storage.SQLiteStorage.)
+# SQLite у режимі WAL допускає одну транзакцію запису на всю БД, тож записувачі
+# по черзі беруть це блокування: інший потік чекає до busy_timeout (PRAGMA-профіль,
+# 5 с), а не отримує "database is locked". Транзакції короткі — один запис або один пакет.
+
+READ_WORKERS = 4
+
+_read_executor: Optional[ThreadPoolExecutor] = None
+_write_executor: Optional[ThreadPoolExecutor] = None
+valuation_writer = ValuationWriter()
+
+def _get_executors() -> tuple[ThreadPoolExecutor, ThreadPoolExecutor]:
+    global _read_executor, _write_executor
+    if _read_executor is None:
+        _read_executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="db-read")
+    if _write_executor is None:
+        _write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+    return _read_executor, _write_executor
+
+async def _run_read(func: Callable, *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    with metrics.span("db"):
+        return await loop.run_in_executor(_get_executors()[0], functools.partial(func, *args, **kwargs))
+
+async def _run_write(func: Callable, *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    with metrics.span("db"):
+        return await loop.run_in_executor(_get_executors()[1], functools.partial(func, *args, **kwargs))
+
+async def get_or_create_user(telegram_id: int, username: str) -> int:
+    """Асинхронна версія crud.get_or_create_user."""
+    return await _run_write(crud.get_or_create_user, telegram_id, username)
+
+async def save_valuation(user_id: int, category_id: int, base_price: float, currency_code: str, final_price: float, snapshot: dict) -> tuple[int, int]:
+    """Асинхронна версія crud.save_valuation (пакетний запис через valuation_writer)."""
+    with metrics.span("db"):
+        return await valuation_writer.save_valuation(user_id, category_id, base_price, currency_code, final_price, snapshot)
+
+async def get_valuation(val_id: int) -> Optional[Dict[str, Any]]:
+    """Асинхронна версія crud.get_valuation."""
+    return await _run_read(crud.get_valuation, val_id)
+
+async def get_valuation_page(telegram_id: int, before_id: Optional[int] = None, after_id: Optional[int] = None,
+                             limit: int = 5) -> Tuple[List[Dict[str, Any]], bool]:
+    """Асинхронна версія crud.get_valuation_page."""
+    return await _run_read(crud.get_valuation_page, telegram_id, before_id, after_id, limit)
+
+async def set_receipt_file_id(val_id: int, file_id: str) -> None:
+    """Асинхронна версія crud.set_receipt_file_id."""
+    await _run_write(crud.set_receipt_file_id, val_id, file_id)
+
+async def get_funnel_report(since: float) -> Dict[str, Any]:
+    """Асинхронна версія funnel.build_report (звіт воронки FSM з моменту since)."""
+    return await _run_read(funnel.build_report, since)
+
+async def get_rollup_report(since_day: str) -> List[Dict[str, Any]]:
+    """Асинхронна версія rollups.report (зведення з агрегатів з дня since_day)."""
+    return await _run_read(rollups.report, since_day)
+
+def _prime_connection(barrier: Optional[threading.Barrier] = None) -> None:
+    # Відкриває постійне з'єднання потоку (PRAGMA, кеш схеми) та підтягує сторінки таблиць у кеш
+    conn = database.get_connection()
+    conn.execute("SELECT COUNT(*) FROM categories").fetchone()
+    conn.execute("SELECT id FROM valuations ORDER BY id DESC LIMIT 1").fetchone()
+    if barrier is not None:
+        # Потік чекає на решту, тож кожне завдання пулу потрапляє в окремий потік
+        barrier.wait()
+
+async def warm_up() -> None:
+    """Відкриває з'єднання в усіх потоках читання та в потоці запису до надходження трафіку."""
+    barrier = threading.Barrier(READ_WORKERS, timeout=10)
+    await asyncio.gather(*(_run_read(_prime_connection, barrier) for _ in range(READ_WORKERS)))
+    await _run_write(_prime_connection)
+
+def shutdown() -> None:
+    """Дочікується завершення поставлених запитів та закриває з'єднання фонових потоків."""
+    global _read_executor, _write_executor
+    valuation_writer.stop()
+    funnel.recorder.stop()
+    for executor in (_read_executor, _write_executor):
+        if executor is not None:
+            executor.shutdown(wait=True)
+    _read_executor = _write_executor = None
+    database.close_connections()
@@ -0,0 +1,53 @@
+"""
+Мікробенчмарк накладних витрат на відкриття з'єднань SQLite.
+
+Порівнює старий підхід (sqlite3.connect + row_factory + close на кожен запит)
+з постійним з'єднанням потоку з database.get_connection().
+
+Запуск з кореня проєкту:
+    python -m benchmarks.bench_connections
+"""
+import os
+import sqlite3
+import tempfile
+import time
+
+import crud
+import database
+
+ITERATIONS = 20000
+
+def _per_call_connection(db_path: str, cat_id: int) -> dict:
+    """Відтворення старої реалізації crud.get_category_by_id."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name_ua, lifespan_months FROM categories WHERE id = ?", (cat_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def _measure(func, iterations: int) -> float:
+    """Повертає кількість операцій на секунду."""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i % 9 + 1)
+    return iterations / (time.perf_counter() - start)
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        database.init_db(db_path)
+        database.seed_db(db_path)
+        database.DB_PATH = db_path
+
+        per_call = _measure(lambda cat_id: _per_call_connection(db_path, cat_id), ITERATIONS)
+        pooled = _measure(crud.get_category_by_id, ITERATIONS)
+        database.close_connections()
+
+    print(f"connect на кожен запит:  {per_call:12,.0f} оп/с ({1e6 / per_call:8.1f} мкс/оп)")
+    print(f"постійне з'єднання:      {pooled:12,.0f} оп/с ({1e6 / pooled:8.1f} мкс/оп)")
+    print(f"прискорення:             x{pooled / per_call:.1f}")
+
+if __name__ == "__main__":
+    main()
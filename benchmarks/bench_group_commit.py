@@ -0,0 +1,64 @@
+"""
+Бенчмарк пропускної здатності запису оцінок: окрема транзакція на кожну
+оцінку (crud.save_valuation) проти групової фіксації (ValuationWriter).
+
+БД створюється у тимчасовій теці всередині --dir (за замовчуванням поточна
+тека), щоб fsync відповідав реальному диску, а не tmpfs.
+
+Запуск з кореня проєкту:
+    python -m benchmarks.bench_group_commit [--rows 2000] [--clients 200]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import crud
+import database
+from valuation_writer import ValuationWriter
+
+def _bench_per_row(rows: int, user_id: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rows):
+        crud.save_valuation(user_id, 1, 1000.0, "UAH", 250.0, {"item_name": "Телефон"})
+    return rows / (time.perf_counter() - start)
+
+async def _bench_group_commit(rows: int, clients: int, user_id: int) -> float:
+    writer = ValuationWriter()
+    writer.start()
+
+    async def client(count: int):
+        for _ in range(count):
+            await writer.save_valuation(user_id, 1, 1000.0, "UAH", 250.0, {"item_name": "Телефон"})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(rows // clients) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    writer.stop()
+    return (rows // clients * clients) / elapsed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=200, help="кількість одночасних обробників")
+    parser.add_argument("--dir", default=".")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        database.init_db(db_path)
+        database.seed_db(db_path)
+        database.DB_PATH = db_path
+        user_id = crud.get_or_create_user(1, "bench")
+
+        per_row = _bench_per_row(args.rows, user_id)
+        grouped = asyncio.run(_bench_group_commit(args.rows, args.clients, user_id))
+        database.close_connections()
+
+    print(f"транзакція на оцінку: {per_row:10,.0f} оцінок/с")
+    print(f"групова фіксація:     {grouped:10,.0f} оцінок/с ({args.clients} одночасних клієнтів)")
+    print(f"прискорення:          x{grouped / per_row:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Бенчмарк сторінок /history (crud.get_valuation_page) на таблиці з ~1 100 000 оцінок.
+
+Порівнює час першої та глибокої сторінки для користувача з 10 оцінками
+і користувача зі 100 000 оцінок: keyset-пагінація по (user_id, id)
+проти OFFSET з тим самим покриваючим індексом.
+
+Запуск з кореня проєкту:
+    python -m benchmarks.bench_history [--heavy 100000] [--background 1000000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import Tuple
+
+import crud
+import database
+
+PAGE_SIZE = 5
+ITERATIONS = 2000
+LIGHT_TELEGRAM_ID, HEAVY_TELEGRAM_ID = 1, 2
+
+def _fill(db_path: str, heavy_rows: int, background_rows: int) -> None:
+    """Легкий користувач (10 оцінок), важкий (heavy_rows) та фонові оцінки 1000 інших користувачів."""
+    conn = database.get_connection(db_path)
+    conn.executemany("INSERT INTO users (telegram_id, username) VALUES (?, ?)", ((i, f"user{i}") for i in range(1, 1003)))
+    user_ids = [LIGHT_TELEGRAM_ID] * 10 + [HEAVY_TELEGRAM_ID] * heavy_rows + [3 + i % 1000 for i in range(background_rows)]
+    # Оцінки різних користувачів перемішані в часі, як у реальній БД
+    random.Random(1).shuffle(user_ids)
+    conn.executemany(
+        "INSERT INTO valuations (user_id, category_id, base_price, currency_code, final_price, snapshot_json, user_report_num) "
+        "VALUES (?, 1, 1000, 'UAH', 250, '', ?)",
+        ((user_id, n) for n, user_id in enumerate(user_ids))
+    )
+    conn.commit()
+
+def _offset_page(telegram_id: int, offset: int) -> list:
+    """Та сама сторінка через OFFSET (для порівняння; рядки перетворюються на dict, як у crud)."""
+    return [dict(row) for row in database.get_connection().execute("""
+        SELECT id, user_report_num, created_at, category_id, final_price, currency_code FROM valuations
+        WHERE user_id = (SELECT id FROM users WHERE telegram_id = ?)
+        ORDER BY id DESC LIMIT ? OFFSET ?
+    """, (telegram_id, PAGE_SIZE + 1, offset)).fetchall()]
+
+def _timed(func, iterations: int = ITERATIONS) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+def _middle_cursor(telegram_id: int) -> Tuple[int, int]:
+    """id оцінки з середини історії користувача (курсор «глибокої» сторінки) та її зміщення."""
+    conn = database.get_connection()
+    count = conn.execute("SELECT COUNT(*) FROM valuations WHERE user_id = (SELECT id FROM users WHERE telegram_id = ?)", (telegram_id,)).fetchone()[0]
+    return conn.execute(
+        "SELECT id FROM valuations WHERE user_id = (SELECT id FROM users WHERE telegram_id = ?) ORDER BY id DESC LIMIT 1 OFFSET ?",
+        (telegram_id, count // 2)
+    ).fetchone()[0], count // 2
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--heavy", type=int, default=100_000, help="оцінок у важкого користувача")
+    parser.add_argument("--background", type=int, default=1_000_000, help="оцінок інших користувачів")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        database.init_db(db_path)
+        database.seed_db(db_path)
+        database.DB_PATH = db_path
+        start = time.perf_counter()
+        _fill(db_path, args.heavy, args.background)
+        print(f"Заповнено {10 + args.heavy + args.background:,} оцінок за {time.perf_counter() - start:.1f} с\n")
+
+        print(f"{'користувач':22} {'сторінка':10} {'keyset, мкс':>12} {'OFFSET, мкс':>12}")
+        for label, telegram_id in (("10 оцінок", LIGHT_TELEGRAM_ID), (f"{args.heavy:,} оцінок", HEAVY_TELEGRAM_ID)):
+            first = _timed(lambda: crud.get_valuation_page(telegram_id, limit=PAGE_SIZE))
+            first_offset = _timed(lambda: _offset_page(telegram_id, 0))
+            print(f"{label:22} {'перша':10} {first:12.1f} {first_offset:12.1f}")
+
+            cursor, offset = _middle_cursor(telegram_id)
+            deep = _timed(lambda: crud.get_valuation_page(telegram_id, before_id=cursor, limit=PAGE_SIZE))
+            deep_offset = _timed(lambda: _offset_page(telegram_id, offset), iterations=max(20, ITERATIONS // 100))
+            print(f"{label:22} {'середина':10} {deep:12.1f} {deep_offset:12.1f}")
+
+        database.close_connections()
+
+if __name__ == "__main__":
+    main()
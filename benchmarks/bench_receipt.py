@@ -0,0 +1,58 @@
+"""
+Бенчмарк рендерингу фото-сертифіката (bot/receipt.py).
+
+"До" — відтворення старої поведінки: шрифти та статичний шар будуються
+заново для кожного чека, PNG стискається з рівнем за замовчуванням (6).
+"Після" — кешовані шрифти, готовий шаблон і швидке стиснення PNG.
+
+Запуск з кореня проєкту:
+    python -m benchmarks.bench_receipt
+"""
+import time
+
+from bot import receipt
+
+ITERATIONS = 50
+
+SNAPSHOT = {
+    "user_report_num": 12,
+    "currency": "USD",
+    "base_price": 1500.0,
+    "item_name": "iPhone 13 Pro Max 256GB Sierra Blue",
+    "age_months": 24,
+    "age_multiplier": 0.61,
+    "phys_name": "Хороший (дрібні подряпини/потертості)", "phys_multiplier": 0.85,
+    "tech_name": "Повністю справний", "tech_multiplier": 1.0,
+    "comp_name": "Повний оригінальний комплект", "comp_multiplier": 1.0,
+    "warn_name": "Гарантія закінчилась", "warn_multiplier": 1.0,
+    "brand_name": "Ексклюзив / Apple", "brand_multiplier": 1.2,
+    "urgent_name": "Швидкий продаж (1-2 тижні)", "urgent_multiplier": 0.85,
+}
+
+def _render_uncached() -> None:
+    receipt.get_fonts.cache_clear()
+    receipt.get_template.cache_clear()
+    receipt.generate_receipt_image(SNAPSHOT, 640.5)
+
+def _measure(func, iterations: int) -> float:
+    """Повертає середній час одного рендерингу в мілісекундах."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+def main() -> None:
+    compress_level = receipt.PNG_COMPRESS_LEVEL
+    receipt.PNG_COMPRESS_LEVEL = 6
+    before = _measure(_render_uncached, ITERATIONS)
+    receipt.PNG_COMPRESS_LEVEL = compress_level
+
+    receipt.generate_receipt_image(SNAPSHOT, 640.5) # Прогрів кешів
+    after = _measure(lambda: receipt.generate_receipt_image(SNAPSHOT, 640.5), ITERATIONS)
+
+    print(f"до (без кешів, PNG level 6): {before:8.2f} мс/чек")
+    print(f"після (кеш + шаблон):        {after:8.2f} мс/чек")
+    print(f"прискорення:                 x{before / after:.2f}")
+
+if __name__ == "__main__":
+    main()
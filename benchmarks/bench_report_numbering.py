@@ -0,0 +1,88 @@
+"""
+Бенчмарк нумерації звітів у crud.save_valuation на таблиці з 1 000 000 оцінок.
+
+Порівнює старий спосіб (SELECT COUNT(*) по історії користувача, без індексу)
+з атомарним лічильником users.valuation_count.
+
+Запуск з кореня проєкту:
+    python -m benchmarks.bench_report_numbering [--rows 1000000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import crud
+import database
+
+USERS = 100
+ITERATIONS = 200
+
+def _fill(db_path: str, rows: int) -> None:
+    """Заповнює БД rows оцінками, рівномірно розподіленими між USERS користувачами."""
+    conn = database.get_connection(db_path)
+    conn.executemany("INSERT INTO users (telegram_id, username) VALUES (?, ?)", ((i, f"user{i}") for i in range(USERS)))
+    conn.executemany(
+        "INSERT INTO valuations (user_id, category_id, base_price, currency_code, final_price, snapshot_json, user_report_num) "
+        "VALUES (?, 1, 1000, 'UAH', 250, '{}', ?)",
+        ((i % USERS + 1, i // USERS + 1) for i in range(rows))
+    )
+    conn.execute("UPDATE users SET valuation_count = ?", (rows // USERS,))
+    conn.commit()
+
+# Старий підхід: у схемі до міграції не було жодного індексу з user_id на початку.
+# Теперішні індекси (idx_valuations_user_created, idx_valuations_user_history) вимикаються
+# через NOT INDEXED, а не видаленням: інакше новий індекс знову непомітно обслуговував би запит
+LEGACY_COUNT_SQL = "SELECT COUNT(*) FROM valuations NOT INDEXED WHERE user_id = ?"
+INDEXED_COUNT_SQL = "SELECT COUNT(*) FROM valuations WHERE user_id = ?"
+
+def _count(conn, sql: str, user_id: int) -> int:
+    return conn.execute(sql, (user_id,)).fetchone()[0] + 1
+
+def _plan(conn, sql: str) -> str:
+    return " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", (1,)))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        database.init_db(db_path)
+        database.seed_db(db_path)
+        database.DB_PATH = db_path
+
+        start = time.perf_counter()
+        _fill(db_path, args.rows)
+        print(f"Заповнено {args.rows:,} оцінок за {time.perf_counter() - start:.1f} с")
+
+        conn = database.get_connection()
+
+        legacy_plan, indexed_plan = _plan(conn, LEGACY_COUNT_SQL), _plan(conn, INDEXED_COUNT_SQL)
+        assert legacy_plan.startswith("SCAN") and "INDEX" not in legacy_plan, legacy_plan
+        assert "INDEX" in indexed_plan, indexed_plan
+
+        start = time.perf_counter()
+        for i in range(ITERATIONS):
+            _count(conn, LEGACY_COUNT_SQL, i % USERS + 1)
+        legacy_ms = (time.perf_counter() - start) / ITERATIONS * 1000
+
+        start = time.perf_counter()
+        for i in range(ITERATIONS):
+            _count(conn, INDEXED_COUNT_SQL, i % USERS + 1)
+        indexed_ms = (time.perf_counter() - start) / ITERATIONS * 1000
+
+        start = time.perf_counter()
+        for i in range(ITERATIONS):
+            crud.save_valuation(i % USERS + 1, 1, 1000.0, "UAH", 250.0, {})
+        save_ms = (time.perf_counter() - start) / ITERATIONS * 1000
+
+        database.close_connections()
+
+    print(f"COUNT(*) без індексу:            {legacy_ms:8.3f} мс/номер  ({legacy_plan})")
+    print(f"COUNT(*) з індексом:             {indexed_ms:8.3f} мс/номер  ({indexed_plan})")
+    print(f"save_valuation з лічильником:    {save_ms:8.3f} мс/оцінка (номер + INSERT + COMMIT)")
+
+if __name__ == "__main__":
+    main()
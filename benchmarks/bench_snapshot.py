@@ -0,0 +1,104 @@
+"""
+Бенчмарк компактного формату знімка оцінки (snapshot_codec) на таблиці з 200 000 оцінок.
+
+Заповнює БД знімками у старому форматі (повний JSON з назвами), вимірює розмір
+файлу БД та час читання оцінок, після чого виконує міграцію з database.init_db,
+очищення snapshot_json (database.compact_snapshots) і повторює виміри.
+
+Запуск з кореня проєкту:
+    python -m benchmarks.bench_snapshot [--rows 200000]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import catalog
+import crud
+import database
+import snapshot_codec
+from benchmarks.suite import SNAPSHOT
+
+READS = 5000
+
+def _legacy_snapshots(rows: int):
+    """Різноманітні знімки у старому форматі (як state.get_data() обробника)."""
+    snapshot_catalog = catalog.get_catalog()
+    rng = random.Random(1)
+    for i in range(rows):
+        category = rng.choice(snapshot_catalog.categories)
+        snapshot = dict(SNAPSHOT)
+        snapshot.update({
+            "category_id": category["id"], "category_name": category["name_ua"],
+            "lifespan_months": category["lifespan_months"],
+            "item_name": category["name_ua"] if i % 3 else f"Товар {i}",
+            "base_price": float(rng.randint(500, 90000)), "age_months": rng.randint(0, 120),
+            "age_multiplier": rng.random(), "user_report_num": i // 100 + 1,
+        })
+        for factor in snapshot_codec.FACTORS:
+            coeff = rng.choice(snapshot_catalog.coefficients_by_type[factor])
+            snapshot.update({f"{factor}_code": coeff["code"], f"{factor}_multiplier": coeff["multiplier"], f"{factor}_name": coeff["name_ua"]})
+        yield (i % 100 + 1, category["id"], snapshot["base_price"], json.dumps(snapshot, ensure_ascii=False), snapshot["user_report_num"])
+
+def _measure_reads(rows: int, decode) -> float:
+    rng = random.Random(2)
+    ids = [rng.randint(1, rows) for _ in range(READS)]
+    start = time.perf_counter()
+    for val_id in ids:
+        decode(crud.get_valuation(val_id))
+    return (time.perf_counter() - start) / READS * 1_000_000
+
+def _size_mb(db_path: str) -> float:
+    return os.path.getsize(db_path) / 1024 / 1024
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        database.init_db(db_path)
+        database.seed_db(db_path)
+        database.DB_PATH = db_path
+        catalog.load()
+
+        conn = database.get_connection()
+        conn.executemany(
+            "INSERT INTO valuations (user_id, category_id, base_price, currency_code, final_price, snapshot_json, user_report_num) "
+            "VALUES (?, ?, ?, 'UAH', 1000, ?, ?)",
+            _legacy_snapshots(args.rows)
+        )
+        # БД як до компактних знімків: наступний init_db виконає міграцію
+        conn.execute("PRAGMA user_version = 0")
+        conn.commit()
+        conn.execute("VACUUM")
+        database.close_connections()
+
+        legacy_size = _size_mb(db_path)
+        legacy_read = _measure_reads(args.rows, lambda v: json.loads(v["snapshot_json"]))
+        database.close_connections()
+
+        start = time.perf_counter()
+        database.init_db(db_path)
+        migration_s = time.perf_counter() - start
+        start = time.perf_counter()
+        database.compact_snapshots(db_path)
+        compact_s = time.perf_counter() - start
+
+        compact_size = _size_mb(db_path)
+        snapshot_catalog = catalog.get_catalog()
+        lazy_read = _measure_reads(args.rows, lambda v: v)
+        compact_read = _measure_reads(args.rows, lambda v: snapshot_codec.load_snapshot(v, snapshot_catalog))
+        database.close_connections()
+
+    print(f"Оцінок: {args.rows:,}, міграція: {migration_s:.1f} с, очищення snapshot_json: {compact_s:.1f} с")
+    print(f"Розмір БД:            {legacy_size:8.1f} МБ -> {compact_size:8.1f} МБ ({compact_size / legacy_size:.0%})")
+    print(f"get_valuation + JSON: {legacy_read:8.1f} мкс")
+    print(f"get_valuation (BLOB): {lazy_read:8.1f} мкс (без розкодування)")
+    print(f"get_valuation + decode: {compact_read:6.1f} мкс")
+
+if __name__ == "__main__":
+    main()
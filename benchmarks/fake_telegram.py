@@ -0,0 +1,156 @@
+"""
+Фейкова сесія Telegram Bot API для офлайн-бенчмарків та тестів.
+
+FakeSession не виконує мережевих запитів: кожен виклик методу фіксується,
+а у відповідь повертається мінімальний правдоподібний результат
+(Message для send*/edit*, True для решти).
+
+FakeTelegramServer — локальний HTTP-сервер з тим самим протоколом, що й
+api.telegram.org, для перевірки справжньої AiohttpSession (ліміти, 429).
+"""
+import datetime
+import itertools
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import CallbackQuery, Chat, Message, PhotoSize, Update, User
+
+BOT_USER = User(id=123456, is_bot=True, first_name="EVS Bot", username="evs_bot")
+
+def _chat(user_id: int) -> Chat:
+    return Chat(id=user_id, type="private")
+
+def _user(user_id: int) -> User:
+    return User(id=user_id, is_bot=False, first_name="Bench", username=f"user{user_id}")
+
+def message_update(update_id: int, user_id: int, text: str) -> Update:
+    """Update з текстовим повідомленням від користувача."""
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id,
+        date=datetime.datetime.now(),
+        chat=_chat(user_id),
+        from_user=_user(user_id),
+        text=text,
+    ))
+
+def callback_update(update_id: int, user_id: int, data: str, message_id: int = 1) -> Update:
+    """Update з натисканням інлайн-кнопки під повідомленням бота."""
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id),
+        from_user=_user(user_id),
+        chat_instance=str(user_id),
+        data=data,
+        message=Message(
+            message_id=message_id,
+            date=datetime.datetime.now(),
+            chat=_chat(user_id),
+            from_user=BOT_USER,
+            text="...",
+        ),
+    ))
+
+class FakeSession(BaseSession):
+    """Сесія, що відповідає на виклики Bot API локально, без мережі."""
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.requests: List[TelegramMethod] = []
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.requests.append(method)
+        if getattr(method, "__returning__", None) is bool:
+            return True
+
+        chat_id = getattr(method, "chat_id", None) or 0
+        fields: Dict[str, Any] = {}
+        if hasattr(method, "photo"):
+            file_id = f"fake-file-{next(self._file_ids)}"
+            fields["photo"] = [PhotoSize(file_id=file_id, file_unique_id=file_id, width=750, height=950)]
+            fields["caption"] = getattr(method, "caption", None)
+        else:
+            fields["text"] = getattr(method, "text", None)
+
+        return Message(
+            message_id=getattr(method, "message_id", None) or next(self._message_ids),
+            date=datetime.datetime.now(),
+            chat=Chat(id=chat_id, type="private"),
+            from_user=BOT_USER,
+            **fields,
+        ).as_(bot)
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        # Файли у фейковому Bot API порожні: потік без жодного фрагмента
+        for chunk in ():
+            yield chunk
+
+    async def close(self) -> None:
+        pass
+
+    def count_text(self, fragment: str) -> int:
+        """Кількість надісланих/відредагованих повідомлень, текст яких містить fragment."""
+        return sum(1 for method in self.requests if fragment in (getattr(method, "text", None) or ""))
+
+class FakeTelegramServer:
+    """
+    Локальний Bot API: приймає POST /bot{token}/{method}, фіксує (час, метод, поля)
+    у self.calls і відповідає Message або True. Для перевірки flood control
+    flood_chats[chat_id] = retry_after змушує відповісти 429 на наступний запит у чат.
+
+        server = FakeTelegramServer(); await server.start()
+        bot = Bot(token, session=AiohttpSession(api=TelegramAPIServer.from_base(server.base_url)))
+    """
+
+    def __init__(self):
+        self.calls: List[Tuple[float, str, Dict[str, str]]] = []
+        self.flood_chats: Dict[str, int] = {}
+        self._message_ids = itertools.count(1000)
+        self._runner = None
+        self.base_url = ""
+
+    async def start(self, host: str = "127.0.0.1") -> None:
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, 0).start()
+        self.base_url = f"http://{host}:{self._runner.addresses[0][1]}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def calls_to(self, method: str) -> List[Tuple[float, Dict[str, str]]]:
+        return [(ts, fields) for ts, name, fields in self.calls if name.lower() == method.lower()]
+
+    async def _handle(self, request):
+        from aiohttp import web
+
+        method = request.match_info["method"]
+        fields = {key: value for key, value in (await request.post()).items() if isinstance(value, str)}
+        chat_id = fields.get("chat_id")
+        retry_after = self.flood_chats.pop(chat_id, None) if chat_id else None
+        if retry_after is not None:
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            })
+        self.calls.append((time.monotonic(), method, fields))
+
+        if not method.lower().startswith(("send", "edit")):
+            return web.json_response({"ok": True, "result": True})
+        return web.json_response({"ok": True, "result": {
+            "message_id": int(fields.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "private"},
+            "from": BOT_USER.model_dump(mode="json", exclude_none=True),
+            "text": fields.get("text", ""),
+        }})
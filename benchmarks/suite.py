@@ -0,0 +1,272 @@
+"""
+Набір бенчмарків EVS Bot: рушій оцінки, збереження в БД, рендеринг
+фото-сертифіката та повний сценарій FSM (/evaluate -> терміновість).
+
+Працює офлайн: БД створюється у тимчасовій теці, а Telegram Bot API
+підміняється фейковою сесією, тож сценарій FSM проходить через справжній
+router з bot/handlers.py без мережі. Для кожного шару виводиться пропускна
+здатність та p50/p95/p99; результати зберігаються у JSON для порівняння між комітами.
+
+Запуск з кореня проєкту:
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --only engine storage --compare bench.json
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import catalog
+import database
+
+LAYERS = ("engine", "storage", "rendering", "fsm")
+
+def summarize(samples: List[float], elapsed: float) -> Dict[str, float]:
+    """Статистика за вибіркою тривалостей окремих операцій (у секундах)."""
+    q = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+    return {
+        "count": len(samples),
+        "throughput_per_s": len(samples) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": q[49] * 1000,
+        "p95_ms": q[94] * 1000,
+        "p99_ms": q[98] * 1000,
+    }
+
+def measure(func: Callable[[int], Any], iterations: int, warmup: int = 10) -> Dict[str, float]:
+    """Вимірює синхронну функцію func(i) iterations разів."""
+    for i in range(warmup):
+        func(i)
+    samples = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - t)
+    return summarize(samples, time.perf_counter() - start)
+
+async def measure_async(func: Callable[[int], Any], iterations: int, warmup: int = 3) -> Dict[str, float]:
+    """Вимірює корутинну функцію func(i) iterations разів."""
+    for i in range(warmup):
+        await func(i)
+    samples = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        await func(i)
+        samples.append(time.perf_counter() - t)
+    return summarize(samples, time.perf_counter() - start)
+
+SNAPSHOT = {
+    "category_id": 1,
+    "category_name": "📱 Гаджети (смартфони, планшети, розумні годинники)",
+    "lifespan_months": 60,
+    "item_name": "iPhone 13 Pro",
+    "currency": "UAH",
+    "base_price": 35000.0,
+    "age_months": 24,
+    "age_multiplier": 0.61,
+    "phys_code": "good", "phys_name": "Хороший (дрібні подряпини/потертості)", "phys_multiplier": 0.85,
+    "tech_code": "perfect", "tech_name": "Повністю справний", "tech_multiplier": 1.0,
+    "comp_code": "full", "comp_name": "Повний оригінальний комплект", "comp_multiplier": 1.0,
+    "warn_code": "expired", "warn_name": "Гарантія закінчилась", "warn_multiplier": 1.0,
+    "brand_code": "apple", "brand_name": "Apple", "brand_multiplier": 1.15,
+    "urgent_code": "fast", "urgent_name": "Швидкий продаж (1-2 тижні)", "urgent_multiplier": 0.85,
+}
+
+# --- Шари ---
+
+def bench_engine(iterations: int) -> Dict[str, Any]:
+    from engine import ValuationEngine
+
+    ages = [i % 240 for i in range(iterations)]
+    lifespans = [(60, 84, 120, 180, 240, 360)[i % 6] for i in range(iterations)]
+
+    def scalar(i: int) -> None:
+        ValuationEngine.calculate_price(35000.0, ages[i], lifespans[i], 0.85, 1.0, 1.0, 1.0, 1.15, 0.85, "good")
+
+    start = time.perf_counter()
+    ValuationEngine.calculate_price_batch(35000.0, ages, lifespans, 0.85, 1.0, 1.0, 1.0, 1.15, 0.85, "good")
+    batch_elapsed = time.perf_counter() - start
+
+    return {
+        "calculate_price": measure(scalar, iterations),
+        "calculate_price_batch": {"count": iterations, "throughput_per_s": iterations / batch_elapsed},
+    }
+
+def bench_storage(iterations: int) -> Dict[str, Any]:
+    import crud
+    import async_crud
+
+    user_id = crud.get_or_create_user(1, "bench")
+    sync_stats = measure(lambda i: crud.save_valuation(user_id, 1, 35000.0, "UAH", 20000.0, dict(SNAPSHOT)), iterations)
+    read_stats = measure(lambda i: crud.get_valuation(i % iterations + 1), iterations)
+
+    async def concurrent_saves() -> Dict[str, float]:
+        # Одночасні збереження через групову фіксацію (як під навантаженням у боті)
+        samples = []
+        async def one():
+            t = time.perf_counter()
+            await async_crud.save_valuation(user_id, 1, 35000.0, "UAH", 20000.0, dict(SNAPSHOT))
+            samples.append(time.perf_counter() - t)
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(iterations)))
+        return summarize(samples, time.perf_counter() - start)
+
+    grouped_stats = asyncio.run(concurrent_saves())
+    async_crud.shutdown()
+    return {"save_valuation": sync_stats, "get_valuation": read_stats, "save_valuation_concurrent": grouped_stats}
+
+def bench_rendering(iterations: int) -> Dict[str, Any]:
+    from bot import receipt
+
+    return {"generate_receipt_image": measure(lambda i: receipt.generate_receipt_image(SNAPSHOT, 20000.0 + i), iterations, warmup=3)}
+
+def bench_fsm(iterations: int) -> Dict[str, Any]:
+    from benchmarks.fake_telegram import FakeSession, callback_update, message_update
+
+    from aiogram import Bot, Dispatcher
+    from bot.handlers import router
+    import async_crud
+
+    async def run() -> Dict[str, Any]:
+        session = FakeSession()
+        bot = Bot(token="123456:BENCHMARK", session=session)
+        dp = Dispatcher()
+        dp.include_router(router)
+        category_id = catalog.get_categories()[0]["id"]
+
+        steps = [
+            ("message", "/evaluate"),
+            ("callback", f"cat_{category_id}"),
+            ("callback", "skip_name"),
+            ("callback", "curr_UAH"),
+            ("message", "35000"),
+            ("callback", "age_24"),
+            ("callback", "factor_phys_good"),
+            ("callback", "factor_tech_perfect"),
+            ("callback", "factor_comp_full"),
+            ("callback", "factor_warn_expired"),
+            ("callback", "factor_brand_premium"),
+            ("callback", "factor_urgent_fast"),
+        ]
+        update_ids = itertools.count(1)
+        step_samples: List[float] = []
+
+        async def flow(i: int) -> None:
+            user_id = 1000 + i
+            for kind, payload in steps:
+                if kind == "message":
+                    update = message_update(next(update_ids), user_id, payload)
+                else:
+                    update = callback_update(next(update_ids), user_id, payload)
+                t = time.perf_counter()
+                await dp.feed_update(bot, update)
+                step_samples.append(time.perf_counter() - t)
+
+        # Прогрів окремо від вимірювання: ні його звіти, ні час кроків не потрапляють у результат
+        for i in range(3):
+            await flow(iterations + i)
+        step_samples.clear()
+        reports_before = session.count_text("Звіт про оцінку")
+        flow_stats = await measure_async(flow, iterations, warmup=0)
+        completed = session.count_text("Звіт про оцінку") - reports_before
+        await bot.session.close()
+        async_crud.shutdown()
+
+        return {
+            "full_flow": flow_stats,
+            "per_update": summarize(step_samples, sum(step_samples)),
+            "completed_flows": completed,
+        }
+
+    return asyncio.run(run())
+
+BENCHMARKS: Dict[str, Callable[[int], Dict[str, Any]]] = {
+    "engine": bench_engine,
+    "storage": bench_storage,
+    "rendering": bench_rendering,
+    "fsm": bench_fsm,
+}
+
+DEFAULT_ITERATIONS = {"engine": 100_000, "storage": 2000, "rendering": 50, "fsm": 200}
+
+# --- Запуск та звіт ---
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _print_results(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    for layer, metrics in results.items():
+        print(f"\n[{layer}]")
+        for name, stats in metrics.items():
+            if not isinstance(stats, dict):
+                print(f"  {name:28} {stats}")
+                continue
+            line = f"  {name:28} {stats['throughput_per_s']:>12,.1f} оп/с"
+            if "p50_ms" in stats:
+                line += f"  p50 {stats['p50_ms']:8.3f}  p95 {stats['p95_ms']:8.3f}  p99 {stats['p99_ms']:8.3f} мс"
+            old = baseline.get(layer, {}).get(name)
+            if isinstance(old, dict) and old.get("throughput_per_s"):
+                line += f"  ({stats['throughput_per_s'] / old['throughput_per_s'] - 1:+.1%} до базового)"
+            print(line)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=LAYERS, default=list(LAYERS), help="які шари вимірювати")
+    parser.add_argument("--scale", type=float, default=1.0, help="множник кількості ітерацій")
+    parser.add_argument("--output", help="шлях до JSON з результатами")
+    parser.add_argument("--compare", help="JSON попереднього запуску для порівняння")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        database.init_db(db_path)
+        database.seed_db(db_path)
+        database.DB_PATH = db_path
+        catalog.load()
+
+        for layer in args.only:
+            iterations = max(1, int(DEFAULT_ITERATIONS[layer] * args.scale))
+            print(f"Вимірювання: {layer} ({iterations} ітерацій)...", file=sys.stderr)
+            results[layer] = BENCHMARKS[layer](iterations)
+
+        database.close_connections()
+
+    _print_results(results, baseline)
+
+    if args.output:
+        report = {
+            "meta": {
+                "revision": _git_revision(),
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "scale": args.scale,
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультати збережено у {args.output}")
+
+if __name__ == "__main__":
+    main()
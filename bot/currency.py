@@ -1,5 +1,11 @@
+import asyncio
 import aiohttp
 import logging
+import os
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -10,26 +16,127 @@ FALLBACK_RATES = {
     "UAH": 1.0
 }
 
+NBU_URL = "https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange?valcode={currency_code}&json"
+
+# Курс НБУ змінюється раз на добу, тому година кешу не впливає на точність оцінки.
+# Модуль імпортується ліниво (після load_dotenv у main.py), тож значення з .env діють
+RATE_TTL_SECONDS = float(os.getenv("NBU_RATE_TTL", "3600"))
+REQUEST_TIMEOUT_SECONDS = 5
+# Після невдалого оновлення (у т.ч. коли віддано FALLBACK_RATES) курс вважається
+# свіжим ще стільки секунд: користувачі не чекають на недоступне API, а наступна
+# спроба виконується у фоні
+FAILURE_RETRY_SECONDS = float(os.getenv("NBU_FAILURE_TTL", "60"))
+# Максимум одночасних з'єднань у спільному пулі HTTP-сесії
+CONNECTION_POOL_LIMIT = 10
+
+class RateCache:
+    """
+    Кеш курсів НБУ на рівні процесу.
+
+    - Один довгоживучий aiohttp.ClientSession з пулом з'єднань.
+    - Single-flight: одночасні запити однієї валюти чекають на один запит до НБУ.
+    - Stale-while-revalidate: прострочений курс віддається одразу, а оновлення
+      виконується у фоні. Мережу чекає лише найперший запит валюти
+      (його можна зробити заздалегідь через prefetch()).
+    """
+
+    def __init__(self, ttl: float = RATE_TTL_SECONDS, url_template: str = NBU_URL,
+                 failure_ttl: float = FAILURE_RETRY_SECONDS):
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.url_template = url_template
+        self._rates: Dict[str, Tuple[float, float]] = {} # currency_code -> (rate, fetched_at)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.upstream_requests = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get_rate(self, currency_code: str) -> float:
+        """Повертає курс валюти до UAH, звертаючись до НБУ лише за потреби."""
+        if currency_code == "UAH":
+            return 1.0
+
+        entry = self._rates.get(currency_code)
+        if entry is not None:
+            rate, fetched_at = entry
+            self.hits += 1
+            if time.monotonic() - fetched_at >= self.ttl:
+                # Курс прострочений: віддаємо старе значення, оновлюємо у фоні
+                self._start_fetch(currency_code)
+            return rate
+
+        self.misses += 1
+        # asyncio.shield: скасування одного обробника не скасовує спільний запит
+        return await asyncio.shield(self._start_fetch(currency_code))
+
+    async def prefetch(self, currency_codes: Iterable[str]) -> None:
+        """Заздалегідь завантажує курси (наприклад, під час старту бота)."""
+        await asyncio.gather(*(self.get_rate(code) for code in currency_codes))
+
+    async def close(self) -> None:
+        """Скасовує фонові оновлення та закриває HTTP-сесію."""
+        for task in list(self._inflight.values()):
+            task.cancel()
+        self._inflight.clear()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _start_fetch(self, currency_code: str) -> asyncio.Task:
+        """Запускає запит до НБУ або повертає вже запущений для цієї валюти."""
+        task = self._inflight.get(currency_code)
+        if task is None:
+            task = asyncio.create_task(self._fetch(currency_code))
+            self._inflight[currency_code] = task
+            task.add_done_callback(lambda _: self._inflight.pop(currency_code, None))
+        return task
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=CONNECTION_POOL_LIMIT, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+            )
+        return self._session
+
+    async def _fetch(self, currency_code: str) -> float:
+        url = self.url_template.format(currency_code=currency_code)
+        self.upstream_requests += 1
+        try:
+            with metrics.span("nbu"):
+                session = await self._get_session()
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        data = await response.json(content_type=None)
+                        if data and len(data) > 0:
+                            rate = float(data[0]["rate"])
+                            self._rates[currency_code] = (rate, time.monotonic())
+                            logger.info(f"Отримано курс НБУ для {currency_code}: {rate}")
+                            return rate
+        except Exception as e:
+            logger.error(f"Помилка при отриманні курсу {currency_code} від НБУ: {e}")
+
+        entry = self._rates.get(currency_code)
+        if entry is not None:
+            logger.warning(f"API НБУ недоступне. Використовуємо останній відомий курс для {currency_code}")
+            rate = entry[0]
+        else:
+            logger.warning(f"API НБУ недоступне. Використовуємо fallback курс для {currency_code}")
+            rate = FALLBACK_RATES.get(currency_code, 1.0)
+        # Кешуємо на failure_ttl: до наступної (фонової) спроби запити не чекають на мережу
+        self._rates[currency_code] = (rate, time.monotonic() - self.ttl + self.failure_ttl)
+        return rate
+
+rate_cache = RateCache()
+
 async def get_nbu_rate(currency_code: str) -> float:
     """
     Отримує курс валюти по відношенню до гривні (UAH) від НБУ.
     Повертає множник (наприклад, 1 USD = 40.0 UAH).
     """
-    if currency_code == "UAH":
-        return 1.0
-        
-    url = f"https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange?valcode={currency_code}&json"
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=5) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data and len(data) > 0:
-                        rate = float(data[0]["rate"])
-                        logger.info(f"Отримано курс НБУ для {currency_code}: {rate}")
-                        return rate
-    except Exception as e:
-        logger.error(f"Помилка при отриманні курсу {currency_code} від НБУ: {e}")
-        
-    logger.warning(f"API НБУ недоступне. Використовуємо fallback курс для {currency_code}")
-    return FALLBACK_RATES.get(currency_code, 1.0)
+    return await rate_cache.get_rate(currency_code)
+
+async def close() -> None:
+    """Закриває спільну HTTP-сесію (при зупинці бота)."""
+    await rate_cache.close()
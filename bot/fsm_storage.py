@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Скільки станів користувачів тримати в пам'яті (решта читається з БД за потреби)
+CACHE_SIZE = 10_000
+# Зміни скидаються в БД пакетом раз на FLUSH_INTERVAL_SECONDS або щойно набралось FLUSH_ROWS ключів
+FLUSH_INTERVAL_SECONDS = 0.5
+FLUSH_ROWS = 500
+# Незавершені оцінки, яких не чіпали довше за цей час, не відновлюються після перезапуску
+STATE_TTL_SECONDS = 7 * 24 * 3600
+
+# (state, data) одного ключа; (None, {}) — порожній запис (рядок у БД видаляється)
+Record = Tuple[Optional[str], Dict[str, Any]]
+
+def _encode_key(key: StorageKey) -> str:
+    return json.dumps([key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny])
+
+def _decode_key(raw: str) -> StorageKey:
+    return StorageKey(*json.loads(raw))
+
+class _Miss:
+    """Промах кешу одного ключа: спільне читання з БД і лічильник змін ключа, поки на нього чекають."""
+
+    __slots__ = ("waiters", "changes", "future", "issued_at")
+
+    def __init__(self):
+        self.waiters = 0
+        self.changes = 0
+        self.future: Optional[asyncio.Future] = None
+        # Значення changes на момент початку читання
+        self.issued_at = 0
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-сховище aiogram у таблиці fsm_storage з кешем у пам'яті.
+
+    - Гарячі стани живуть в LRU-кеші (до cache_size ключів), тож натискання
+      кнопок обслуговуються з пам'яті.
+    - Запис — write-behind: зміна лише позначає ключ «брудним», а фонове завдання
+      записує всі накопичені ключі однією транзакцією в окремому потоці.
+      Кілька натискань одного користувача між скиданнями дають один UPSERT.
+    - restore() при старті відновлює незавершені оцінки; close() дописує зміни.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, cache_size: int = CACHE_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL_SECONDS, flush_rows: int = FLUSH_ROWS,
+                 state_ttl: float = STATE_TTL_SECONDS):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.state_ttl = state_ttl
+        self._cache: "OrderedDict[StorageKey, Record]" = OrderedDict()
+        self._dirty: Dict[StorageKey, Record] = {}
+        self._misses: Dict[StorageKey, _Miss] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-storage")
+        self._flush_wakeup: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    # --- Життєвий цикл ---
+
+    async def restore(self) -> int:
+        """Завантажує в кеш збережені стани (найсвіжіші — до cache_size). Повертає кількість ключів."""
+        rows = await self._run(self._load_recent)
+        for raw_key, state, data in reversed(rows):
+            self._cache[_decode_key(raw_key)] = (state, json.loads(data))
+        logger.info(f"Відновлено станів FSM з БД: {len(rows)}")
+        return len(rows)
+
+    async def close(self) -> None:
+        """Зупиняє фонове скидання та записує всі незбережені зміни."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._flush_task is not None:
+            # Без cancel(): перерване скидання могло б загубити вже вилучений пакет
+            self._flush_wakeup.set()
+            await self._flush_task
+        await self.flush()
+        self._executor.shutdown(wait=True)
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = await self._get(key)
+        self._put(key, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        state, _ = await self._get(key)
+        self._put(key, (state, dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._get(key))[1])
+
+    # --- Кеш ---
+
+    async def _get(self, key: StorageKey) -> Record:
+        record = self._cache.get(key)
+        if record is not None:
+            self._cache.move_to_end(key)
+            metrics.registry.inc("evs_fsm_storage_cache_total", {"result": "hit"})
+            return record
+
+        record = self._dirty.get(key)
+        if record is None:
+            record = await self._load(key)
+        self._remember(key, record)
+        return record
+
+    async def _load(self, key: StorageKey) -> Record:
+        """
+        Промах кешу: читання з БД у потоці сховища. Пакет, поставлений на запис
+        раніше, виконується в тому ж потоці першим, тож прочитане значення актуальне
+        на момент початку читання. Одночасні промахи одного ключа чекають на одне читання.
+        """
+        miss = self._misses.get(key)
+        if miss is None:
+            miss = self._misses[key] = _Miss()
+        miss.waiters += 1
+        try:
+            while True:
+                if miss.future is None:
+                    metrics.registry.inc("evs_fsm_storage_cache_total", {"result": "miss"})
+                    miss.issued_at = miss.changes
+                    miss.future = asyncio.ensure_future(self._run(self._load_one, _encode_key(key)))
+                future, issued_at = miss.future, miss.issued_at
+                try:
+                    loaded = await asyncio.shield(future)
+                except Exception:
+                    if miss.future is future:
+                        miss.future = None
+                    raise
+                # Поки йшло читання, ключ міг бути змінений іншим апдейтом — новіше значення в пам'яті
+                record = self._cache.get(key) or self._dirty.get(key)
+                if record is not None:
+                    return record
+                if miss.changes == issued_at:
+                    return loaded
+                # Зміну вже витіснено з кешу й передано на запис — прочитане застаріло,
+                # читаємо ще раз (після пакета з цією зміною)
+                if miss.future is future:
+                    miss.future = None
+        finally:
+            miss.waiters -= 1
+            if not miss.waiters:
+                del self._misses[key]
+
+    def _put(self, key: StorageKey, record: Record) -> None:
+        miss = self._misses.get(key)
+        if miss is not None:
+            miss.changes += 1
+        self._remember(key, record)
+        self._dirty[key] = record
+        self._ensure_flusher()
+        if len(self._dirty) >= self.flush_rows:
+            self._flush_wakeup.set()
+
+    def _remember(self, key: StorageKey, record: Record) -> None:
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            # Витіснення безпечне: незаписані зміни лежать у self._dirty до скидання
+            self._cache.popitem(last=False)
+
+    # --- Запис у БД ---
+
+    def _ensure_flusher(self) -> None:
+        if self._flush_task is None and not self._closed:
+            self._flush_wakeup = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Помилка запису станів FSM у БД: {e}")
+
+    async def flush(self) -> int:
+        """Записує всі змінені ключі однією транзакцією. Повертає кількість ключів."""
+        if not self._dirty:
+            return 0
+        batch, self._dirty = self._dirty, {}
+        try:
+            await self._run(self._write_batch, [(_encode_key(key), state, data) for key, (state, data) in batch.items()])
+        except Exception:
+            # Повертаємо невдалий пакет, не перезаписуючи новіші зміни тих самих ключів
+            for key, record in batch.items():
+                self._dirty.setdefault(key, record)
+            raise
+        metrics.registry.inc("evs_fsm_storage_flushes_total")
+        metrics.registry.inc("evs_fsm_storage_rows_total", value=len(batch))
+        return len(batch)
+
+    async def _run(self, func, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # Методи нижче виконуються в потоці сховища
+
+    def _write_batch(self, rows: List[Tuple[str, Optional[str], Dict[str, Any]]]) -> None:
+        now = time.time()
+        upserts = [(key, state, json.dumps(data, ensure_ascii=False), now) for key, state, data in rows if state is not None or data]
+        deletes = [(key,) for key, state, data in rows if state is None and not data]
+        with database.transaction(self.db_path) as conn:
+            if upserts:
+                conn.executemany("""
+                    INSERT INTO fsm_storage (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+                """, upserts)
+            if deletes:
+                conn.executemany("DELETE FROM fsm_storage WHERE key = ?", deletes)
+
+    def _load_one(self, raw_key: str) -> Record:
+        row = database.get_connection(self.db_path).execute("SELECT state, data FROM fsm_storage WHERE key = ?", (raw_key,)).fetchone()
+        return (row["state"], json.loads(row["data"])) if row else (None, {})
+
+    def _load_recent(self) -> List[tuple]:
+        with database.transaction(self.db_path) as conn:
+            conn.execute("DELETE FROM fsm_storage WHERE updated_at < ?", (time.time() - self.state_ttl,))
+            return conn.execute(
+                "SELECT key, state, data FROM fsm_storage ORDER BY updated_at DESC LIMIT ?", (self.cache_size,)
+            ).fetchall()
@@ -1,18 +1,23 @@
+import datetime
+import os
 import re
-import json
 import logging
+import time
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, BufferedInputFile
-from aiogram.filters import CommandStart, Command
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State
-from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.exceptions import TelegramBadRequest
 
 from bot.states import ValuationFSM
 from bot import keyboards
-from bot import currency
-from bot import receipt
-import crud
+from bot.receipt_cache import receipt_cache
+import async_crud
+import catalog
+import funnel
+import metrics
+import snapshot_codec
 from engine import ValuationEngine
 
 logger = logging.getLogger(__name__)
@@ -41,10 +46,154 @@ async def cmd_evaluate(message: Message, state: FSMContext):
     )
     await state.set_state(ValuationFSM.choosing_category)
 
+HISTORY_PAGE_SIZE = 5
+
+def format_history(rows: list) -> str:
+    """Текст сторінки /history. Назва категорії береться з довідника в пам'яті."""
+    lines = ["🗂 <b>Історія оцінок</b>\n"]
+    for row in rows:
+        category = catalog.get_category_by_id(row["category_id"])
+        category_name = category["name_ua"] if category else "Невідома категорія"
+        lines.append(
+            f"<b>#{row['user_report_num'] or row['id']}</b> · {str(row['created_at'])[:16]}\n"
+            f"{category_name}\n"
+            f"💰 <code>{row['final_price']:,.2f} {row['currency_code']}</code>\n"
+        )
+    return "\n".join(lines)
+
+async def _show_history_page(telegram_id: int, before_id=None, after_id=None):
+    rows, has_more = await async_crud.get_valuation_page(telegram_id, before_id, after_id, HISTORY_PAGE_SIZE)
+    if not rows:
+        return None, None
+    # У напрямку гортання наявність записів показує has_more, у протилежному — сам факт гортання
+    has_older = has_more if after_id is None else True
+    has_newer = has_more if after_id is not None else before_id is not None
+    return format_history(rows), keyboards.get_history_kb(rows, has_newer, has_older)
+
+@router.message(Command("history"))
+async def cmd_history(message: Message):
+    text, markup = await _show_history_page(message.from_user.id)
+    if text is None:
+        await message.answer("У вас ще немає збережених оцінок. Розпочніть з /evaluate")
+        return
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
+
+@router.callback_query(F.data.startswith("hist_"))
+async def process_history_page(callback: CallbackQuery):
+    _, direction, cursor = callback.data.split("_")
+    cursor = int(cursor)
+    if direction == "older":
+        text, markup = await _show_history_page(callback.from_user.id, before_id=cursor)
+    else:
+        text, markup = await _show_history_page(callback.from_user.id, after_id=cursor)
+
+    if text is None:
+        await callback.answer("Більше оцінок немає.")
+        return
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+    await callback.answer()
+
+def is_admin(telegram_id: int) -> bool:
+    """Адміністратори задаються у .env: ADMIN_IDS=111,222 (Telegram ID через кому)."""
+    admin_ids = {part.strip() for part in os.getenv("ADMIN_IDS", "").split(",") if part.strip()}
+    return str(telegram_id) in admin_ids
+
+def format_stats() -> str:
+    """Текст відповіді на /stats: затримки обробників та підзапитів з реєстру метрик."""
+    lines = ["📈 <b>Метрики обробників</b>", "<pre>"]
+    lines.append(f"{'обробник':32} {'викл.':>6} {'пом.':>5} {'сер.мс':>7} {'p95мс':>7}")
+    for row in metrics.registry.handler_summary():
+        lines.append(f"{row['handler'][:32]:32} {row['calls']:>6} {row['errors']:>5} {row['avg_ms']:>7.1f} {row['p95_ms']:>7.1f}")
+    lines.append("</pre>")
+    lines.append("⏱ <b>Підзапити</b>")
+    lines.append("<pre>")
+    for row in metrics.registry.span_summary():
+        lines.append(f"{row['span']:8} {row['calls']:>6} {row['errors']:>5} {row['avg_ms']:>7.1f} {row['p95_ms']:>7.1f}")
+    lines.append("</pre>")
+    kb = keyboards.registry.build_stats()
+    lines.append(
+        f"⌨️ Клавіатури: {kb['keyboards']} шт. за {kb['total_ms']:.1f} мс "
+        f"(версія довідників {kb['catalog_version']}, перебудов: {kb['rebuilds']})"
+    )
+    cache = receipt_cache.stats()
+    lines.append(
+        f"🧾 Кеш чеків: file_id {cache['file_id_hits']}, диск {cache['disk_hits']}, рендер {cache['misses']}, "
+        f"витіснено {cache['evictions']}; {cache['entries']} файлів, {cache['bytes'] / 1024 / 1024:.1f} МБ"
+    )
+    return "\n".join(lines)
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    if not is_admin(message.from_user.id):
+        logger.warning(f"User {message.from_user.id} requested /stats without admin rights.")
+        return
+    await message.answer(format_stats(), parse_mode="HTML")
+
+def format_funnel(report: dict, hours: float) -> str:
+    """Текст відповіді на /funnel: час на кроках та відмови за останні hours годин."""
+    lines = [
+        f"🔻 <b>Воронка оцінки за {hours:g} год</b>",
+        f"Розпочато: {report['started']}, завершено: {report['completed']}, з помилкою: {report['failed']}",
+        "<pre>",
+        f"{'крок':20} {'входів':>6} {'p50с':>6} {'p90с':>6} {'назад':>5} {'відмов':>6}",
+    ]
+    for row in report["steps"]:
+        lines.append(
+            f"{row['step']:20} {row['entered']:>6} {row['p50_s']:>6.1f} {row['p90_s']:>6.1f} "
+            f"{row['backs']:>5} {row['abandon_rate']:>6.0%}"
+        )
+    lines.append("</pre>")
+    return "\n".join(lines)
+
+@router.message(Command("funnel"))
+async def cmd_funnel(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        logger.warning(f"User {message.from_user.id} requested /funnel without admin rights.")
+        return
+    try:
+        hours = float(command.args) if command.args else 24.0
+    except ValueError:
+        await message.answer("Використання: /funnel [кількість годин], наприклад /funnel 24")
+        return
+    report = await async_crud.get_funnel_report(time.time() - hours * 3600)
+    await message.answer(format_funnel(report, hours), parse_mode="HTML")
+
+def format_analytics(rows: list, days: int) -> str:
+    """Текст відповіді на /analytics: зведення з агрегатів по категоріях і валютах."""
+    lines = [f"📊 <b>Аналітика оцінок за {days} дн.</b>\n"]
+    for row in rows:
+        category = catalog.get_category_by_id(row["category_id"])
+        category_name = category["name_ua"] if category else f"Категорія #{row['category_id']}"
+        lines.append(
+            f"<b>{category_name}</b> ({row['currency_code']})\n"
+            f"Оцінок: {row['count']}, середня ціна: {row['avg_final_price']:,.0f} "
+            f"(медіана ≈ {row['median_final_price']:,.0f}), нова: {row['avg_base_price']:,.0f}\n"
+            f"Термінові продажі: {row['urgent_share']:.0%}\n"
+        )
+    if not rows:
+        lines.append("Оцінок за цей період немає.")
+    return "\n".join(lines)
+
+@router.message(Command("analytics"))
+async def cmd_analytics(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        logger.warning(f"User {message.from_user.id} requested /analytics without admin rights.")
+        return
+    try:
+        days = int(command.args) if command.args else 7
+    except ValueError:
+        days = 0
+    if days <= 0:
+        await message.answer("Використання: /analytics [кількість днів], наприклад /analytics 30")
+        return
+    since_day = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    rows = await async_crud.get_rollup_report(since_day)
+    await message.answer(format_analytics(rows, days), parse_mode="HTML")
+
 @router.callback_query(ValuationFSM.choosing_category, F.data.startswith("cat_"))
 async def process_category(callback: CallbackQuery, state: FSMContext):
     cat_id = int(callback.data.split("_")[1])
-    category = crud.get_category_by_id(cat_id)
+    category = catalog.get_category_by_id(cat_id)
     
     if not category:
         logger.warning(f"User {callback.from_user.id} clicked invalid category: {cat_id}")
@@ -59,15 +208,12 @@ async def process_category(callback: CallbackQuery, state: FSMContext):
         lifespan_months=category["lifespan_months"]
     )
     
-    builder = InlineKeyboardBuilder()
-    builder.button(text="➡️ Пропустити", callback_data="skip_name")
-    
     await callback.message.edit_text(
         f"✅ Обрано: <b>{category['name_ua']}</b>\n\n"
         "📝 <b>Крок 1.5/9: Введіть назву товару (Опціонально)</b>\n"
         "Введіть точну назву (наприклад, <i>iPhone 13 Pro</i> або <i>Диван IKEA</i>), щоб вона відображалась у звіті.\n"
         "Або натисніть «Пропустити».",
-        reply_markup=builder.as_markup(),
+        reply_markup=keyboards.get_skip_name_kb(),
         parse_mode="HTML"
     )
     await state.set_state(ValuationFSM.entering_item_name)
@@ -178,14 +324,9 @@ async def process_age_text(message: Message, state: FSMContext):
     if not is_years and not is_months:
         await state.update_data(pending_age_num=num)
         
-        builder = InlineKeyboardBuilder()
-        builder.button(text="Років", callback_data="age_unit_years")
-        builder.button(text="Місяців", callback_data="age_unit_months")
-        builder.adjust(2)
-        
         await message.answer(
             f"Ви ввели число <b>{num}</b>. Це роки чи місяці?", 
-            reply_markup=builder.as_markup(),
+            reply_markup=keyboards.get_age_unit_kb(),
             parse_mode="HTML"
         )
         return
@@ -223,7 +364,9 @@ async def _proceed_to_phys_state(message: Message, state: FSMContext, age_months
     
     try:
         await message.edit_text(text, reply_markup=keyboards.get_factor_kb("phys"), parse_mode="HTML")
-    except:
+    except TelegramBadRequest:
+        # Повідомлення користувача редагувати не можна — надсилаємо нове.
+        # 429 сюди не потрапляє: його повторює планувальник bot/outbound.py
         await message.answer(text, reply_markup=keyboards.get_factor_kb("phys"), parse_mode="HTML")
         
     await state.set_state(ValuationFSM.choosing_phys)
@@ -235,7 +378,7 @@ async def process_factor(callback: CallbackQuery, state: FSMContext, factor_type
     prefix = f"factor_{factor_type}_"
     code = callback.data[len(prefix):]
     
-    coeff = crud.get_coefficient_by_code(factor_type, code)
+    coeff = catalog.get_coefficient_by_code(factor_type, code)
     
     if not coeff:
         logger.error(f"User {callback.from_user.id} clicked missing coefficient: {factor_type}_{code}")
@@ -250,24 +393,25 @@ async def process_factor(callback: CallbackQuery, state: FSMContext, factor_type
         f"{factor_type}_name": coeff["name_ua"]
     })
     
-    # Додаємо кнопку "⬅️ Назад" до клавіатури наступного кроку
-    builder = InlineKeyboardBuilder()
-    if next_factor:
-        coeffs = crud.get_coefficients(next_factor)
-        for c in coeffs:
-            builder.button(text=c['name_ua'], callback_data=f"factor_{next_factor}_{c['code']}")
-    builder.button(text="⬅️ Назад", callback_data=f"back_to_{factor_type}")
-    builder.adjust(1)
-    
+    # Клавіатура наступного кроку з кнопкою "⬅️ Назад"
     await callback.message.edit_text(
         f"✅ Обрано: <b>{coeff['name_ua']}</b>\n\n"
         f"🔎 <b>Крок {next_step_num}/9: {next_step_name}</b>\n",
-        reply_markup=builder.as_markup(),
+        reply_markup=keyboards.get_factor_kb(next_factor, back_to=factor_type),
         parse_mode="HTML"
     )
     await state.set_state(next_state)
 
 
+# Кроки, на які можна повернутися кнопкою "⬅️ Назад" (крім phys):
+# фактор -> (стан FSM, номер кроку, назва кроку, ключ назви попереднього вибору)
+BACK_STEPS = {
+    "tech": (ValuationFSM.choosing_tech, 6, "Технічний стан (справність)", "phys_name"),
+    "comp": (ValuationFSM.choosing_comp, 7, "Комплектація (коробка, аксесуари)", "tech_name"),
+    "warn": (ValuationFSM.choosing_warn, 8, "Гарантія", "comp_name"),
+    "brand": (ValuationFSM.choosing_brand, 9, "Ліквідність бренду", "warn_name"),
+}
+
 @router.callback_query(F.data.startswith("back_to_"))
 async def process_back_button(callback: CallbackQuery, state: FSMContext):
     target = callback.data.split("_")[2]
@@ -283,68 +427,14 @@ async def process_back_button(callback: CallbackQuery, state: FSMContext):
             reply_markup=keyboards.get_factor_kb("phys"),
             parse_mode="HTML"
         )
-    elif target == "tech":
-        await state.set_state(ValuationFSM.choosing_tech)
+    elif target in BACK_STEPS:
+        target_state, step_num, step_name, prev_name_key = BACK_STEPS[target]
+        await state.set_state(target_state)
         data = await state.get_data()
-        builder = InlineKeyboardBuilder()
-        coeffs = crud.get_coefficients("tech")
-        for c in coeffs:
-            builder.button(text=c['name_ua'], callback_data=f"factor_tech_{c['code']}")
-        builder.button(text="⬅️ Назад", callback_data="back_to_phys")
-        builder.adjust(1)
-        
         await callback.message.edit_text(
-            f"✅ Обрано: <b>{data.get('phys_name', '')}</b>\n\n"
-            f"🔎 <b>Крок 6/9: Технічний стан (справність)</b>\n",
-            reply_markup=builder.as_markup(),
-            parse_mode="HTML"
-        )
-    elif target == "comp":
-        await state.set_state(ValuationFSM.choosing_comp)
-        data = await state.get_data()
-        builder = InlineKeyboardBuilder()
-        coeffs = crud.get_coefficients("comp")
-        for c in coeffs:
-            builder.button(text=c['name_ua'], callback_data=f"factor_comp_{c['code']}")
-        builder.button(text="⬅️ Назад", callback_data="back_to_tech")
-        builder.adjust(1)
-        
-        await callback.message.edit_text(
-            f"✅ Обрано: <b>{data.get('tech_name', '')}</b>\n\n"
-            f"🔎 <b>Крок 7/9: Комплектація (коробка, аксесуари)</b>\n",
-            reply_markup=builder.as_markup(),
-            parse_mode="HTML"
-        )
-    elif target == "warn":
-        await state.set_state(ValuationFSM.choosing_warn)
-        data = await state.get_data()
-        builder = InlineKeyboardBuilder()
-        coeffs = crud.get_coefficients("warn")
-        for c in coeffs:
-            builder.button(text=c['name_ua'], callback_data=f"factor_warn_{c['code']}")
-        builder.button(text="⬅️ Назад", callback_data="back_to_comp")
-        builder.adjust(1)
-        
-        await callback.message.edit_text(
-            f"✅ Обрано: <b>{data.get('comp_name', '')}</b>\n\n"
-            f"🔎 <b>Крок 8/9: Гарантія</b>\n",
-            reply_markup=builder.as_markup(),
-            parse_mode="HTML"
-        )
-    elif target == "brand":
-        await state.set_state(ValuationFSM.choosing_brand)
-        data = await state.get_data()
-        builder = InlineKeyboardBuilder()
-        coeffs = crud.get_coefficients("brand")
-        for c in coeffs:
-            builder.button(text=c['name_ua'], callback_data=f"factor_brand_{c['code']}")
-        builder.button(text="⬅️ Назад", callback_data="back_to_warn")
-        builder.adjust(1)
-        
-        await callback.message.edit_text(
-            f"✅ Обрано: <b>{data.get('warn_name', '')}</b>\n\n"
-            f"🔎 <b>Крок 9/9: Ліквідність бренду</b>\n",
-            reply_markup=builder.as_markup(),
+            f"✅ Обрано: <b>{data.get(prev_name_key, '')}</b>\n\n"
+            f"🔎 <b>Крок {step_num}/9: {step_name}</b>\n",
+            reply_markup=keyboards.get_factor_kb(target, back_to=keyboards.BACK_TARGETS[target]),
             parse_mode="HTML"
         )
 
@@ -367,7 +457,7 @@ async def process_warn(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(ValuationFSM.choosing_brand, F.data.startswith("factor_brand_"))
 async def process_brand(callback: CallbackQuery, state: FSMContext):
     code = callback.data.split("_")[2]
-    coeff = crud.get_coefficient_by_code("brand", code)
+    coeff = catalog.get_coefficient_by_code("brand", code)
     
     if not coeff:
         logger.error(f"User {callback.from_user.id} clicked missing brand: {code}")
@@ -393,7 +483,7 @@ async def process_urgent_and_calculate(callback: CallbackQuery, state: FSMContex
     prefix = "factor_urgent_"
     code = callback.data[len(prefix):]
     
-    coeff = crud.get_coefficient_by_code("urgent", code)
+    coeff = catalog.get_coefficient_by_code("urgent", code)
     
     if not coeff:
         logger.error(f"User {callback.from_user.id} clicked missing urgent code: {code}")
@@ -433,17 +523,18 @@ async def process_urgent_and_calculate(callback: CallbackQuery, state: FSMContex
 
         nbu_info = ""
         if snapshot["currency"] != "UAH":
+            from bot import currency # клієнт НБУ потрібен лише для іноземних валют — імпорт при першому використанні
             rate = await currency.get_nbu_rate(snapshot["currency"])
             final_price_uah = final_price * rate
             nbu_info = f"\n🔄 <i>(~ {final_price_uah:,.2f} UAH за курсом НБУ)</i>"
 
         # 2. Збереження
-        user_id = crud.get_or_create_user(
+        user_id = await async_crud.get_or_create_user(
             telegram_id=callback.from_user.id,
             username=callback.from_user.username or "unknown"
         )
         
-        val_id, user_report_num = crud.save_valuation(
+        val_id, user_report_num = await async_crud.save_valuation(
             user_id=user_id,
             category_id=snapshot["category_id"],
             base_price=snapshot["base_price"],
@@ -476,6 +567,8 @@ async def process_urgent_and_calculate(callback: CallbackQuery, state: FSMContex
         )
     except Exception as e:
         logger.error(f"Error calculating price: {e}", exc_info=True)
+        # Перед очищенням стану: у воронці оцінка має бути невдалою, а не завершеною
+        funnel.recorder.record(callback.from_user.id, "failed")
         await callback.message.answer(f"❌ Виникла помилка при розрахунку: {e}")
         
     await state.clear()
@@ -483,7 +576,7 @@ async def process_urgent_and_calculate(callback: CallbackQuery, state: FSMContex
 @router.callback_query(F.data.startswith("receipt_img_"))
 async def process_receipt_image(callback: CallbackQuery):
     val_id = int(callback.data.split("_")[2])
-    valuation = crud.get_valuation(val_id)
+    valuation = await async_crud.get_valuation(val_id)
     
     if not valuation:
         logger.warning(f"User {callback.from_user.id} requested missing receipt #{val_id}")
@@ -493,18 +586,24 @@ async def process_receipt_image(callback: CallbackQuery):
     await callback.answer("Генерую фото-сертифікат... ⏳")
     logger.info(f"User {callback.from_user.id} generated image receipt for valuation #{val_id}")
     
-    snapshot = json.loads(valuation["snapshot_json"])
     final_price = valuation["final_price"]
-    
-    img_io = receipt.generate_receipt_image(snapshot, final_price)
-    
-    photo = BufferedInputFile(img_io.read(), filename=f"evs_receipt_{val_id}.png")
-    
-    user_report_num = snapshot.get("user_report_num", val_id)
-    await callback.message.answer_photo(
-        photo=photo,
-        caption=f"📸 Ваш сертифікат оцінки #{user_report_num}."
-    )
+    user_report_num = valuation.get("user_report_num") or val_id
+    caption = f"📸 Ваш сертифікат оцінки #{user_report_num}."
+
+    # Знімок оцінки незмінний: якщо фото вже надсилалось, повторно використовуємо file_id Telegram
+    if valuation.get("receipt_file_id"):
+        receipt_cache.record_file_id_hit()
+        await callback.message.answer_photo(photo=valuation["receipt_file_id"], caption=caption)
+        return
+
+    # Знімок розкодовується лише тут — коли чек справді треба рендерити
+    snapshot = snapshot_codec.load_snapshot(valuation, catalog.get_catalog())
+    png = await receipt_cache.get_png(snapshot, final_price)
+    photo = BufferedInputFile(png, filename=f"evs_receipt_{val_id}.png")
+
+    sent = await callback.message.answer_photo(photo=photo, caption=caption)
+    if sent.photo:
+        await async_crud.set_receipt_file_id(val_id, sent.photo[-1].file_id)
 
 @router.callback_query()
 async def process_unknown_callback(callback: CallbackQuery):
@@ -1,20 +1,31 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-import crud
+import catalog
+import metrics
 
-def get_categories_kb() -> InlineKeyboardMarkup:
-    """Генерує інлайн-клавіатуру з усіма доступними категоріями."""
+logger = logging.getLogger(__name__)
+
+# Порядок кроків вибору коефіцієнтів у FSM
+FACTOR_ORDER = ("phys", "tech", "comp", "warn", "brand", "urgent")
+
+# Для кожного фактору — фактор попереднього кроку, на який веде кнопка "⬅️ Назад"
+BACK_TARGETS = {current: previous for previous, current in zip(FACTOR_ORDER, FACTOR_ORDER[1:])}
+
+# --- Побудова клавіатур ---
+
+def _build_categories_kb() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
-    categories = crud.get_categories()
-    
-    for cat in categories:
+    for cat in catalog.get_categories():
         builder.button(text=cat['name_ua'], callback_data=f"cat_{cat['id']}")
-        
     builder.adjust(1) # По одній кнопці в ряд
     return builder.as_markup()
 
-def get_currency_kb() -> InlineKeyboardMarkup:
-    """Генерує клавіатуру для вибору валюти."""
+def _build_currency_kb() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text="🇺🇦 UAH (Гривня)", callback_data="curr_UAH")
     builder.button(text="🇺🇸 USD (Долар)", callback_data="curr_USD")
@@ -22,16 +33,9 @@ def get_currency_kb() -> InlineKeyboardMarkup:
     builder.adjust(1)
     return builder.as_markup()
 
-def get_receipt_actions_kb(val_id: int) -> InlineKeyboardMarkup:
-    """Генерує клавіатуру дій після розрахунку."""
+def _build_age_presets_kb() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
-    builder.button(text="📸 Отримати фото-сертифікат", callback_data=f"receipt_img_{val_id}")
-    return builder.as_markup()
 
-def get_age_presets_kb() -> InlineKeyboardMarkup:
-    """Генерує клавіатуру з пресетами для віку."""
-    builder = InlineKeyboardBuilder()
-    
     # Значення callback_data - це кількість місяців
     presets = [
         ("Менше місяця", "age_0"),
@@ -42,20 +46,160 @@ def get_age_presets_kb() -> InlineKeyboardMarkup:
         ("5 років", "age_60"),
         ("Ввести вручну ✍️", "age_manual")
     ]
-    
+
     for text, cb_data in presets:
         builder.button(text=text, callback_data=cb_data)
-        
+
     builder.adjust(2) # По дві кнопки в ряд
     return builder.as_markup()
 
-def get_factor_kb(factor_type: str) -> InlineKeyboardMarkup:
-    """Генерує клавіатуру для вибору коефіцієнтів (фізичний стан, комплектація тощо)."""
+def _build_age_unit_kb() -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    builder.button(text="Років", callback_data="age_unit_years")
+    builder.button(text="Місяців", callback_data="age_unit_months")
+    builder.adjust(2)
+    return builder.as_markup()
+
+def _build_skip_name_kb() -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    builder.button(text="➡️ Пропустити", callback_data="skip_name")
+    return builder.as_markup()
+
+def _build_factor_kb(factor_type: str, back_to: Optional[str] = None) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
-    coeffs = crud.get_coefficients(factor_type)
-    
-    for coeff in coeffs:
+    for coeff in catalog.get_coefficients(factor_type):
         builder.button(text=coeff['name_ua'], callback_data=f"factor_{factor_type}_{coeff['code']}")
-        
+    if back_to:
+        builder.button(text="⬅️ Назад", callback_data=f"back_to_{back_to}")
     builder.adjust(1)
     return builder.as_markup()
+
+def _all_builders() -> Dict[Tuple, Callable[[], InlineKeyboardMarkup]]:
+    """Усі клавіатури, що будуються заздалегідь: ключ реєстру -> функція побудови."""
+    builders: Dict[Tuple, Callable[[], InlineKeyboardMarkup]] = {
+        ("categories",): _build_categories_kb,
+        ("currency",): _build_currency_kb,
+        ("age_presets",): _build_age_presets_kb,
+        ("age_unit",): _build_age_unit_kb,
+        ("skip_name",): _build_skip_name_kb,
+    }
+    for factor_type in FACTOR_ORDER:
+        builders[("factor", factor_type, None)] = lambda ft=factor_type: _build_factor_kb(ft)
+    for factor_type, back_to in BACK_TARGETS.items():
+        builders[("factor", factor_type, back_to)] = lambda ft=factor_type, bt=back_to: _build_factor_kb(ft, bt)
+    return builders
+
+class KeyboardRegistry:
+    """
+    Реєстр готових інлайн-клавіатур. Усі клавіатури будуються один раз і
+    перебудовуються лише при зміні версії довідників (catalog.version()).
+    Видані об'єкти спільні для всіх користувачів — їх не можна змінювати.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._markups: Dict[Tuple, InlineKeyboardMarkup] = {}
+        self._build_times: Dict[Tuple, float] = {}
+        self.rebuilds = 0
+
+    def get(self, key: Tuple) -> InlineKeyboardMarkup:
+        """Повертає клавіатуру за ключем реєстру, за потреби перебудовуючи весь набір."""
+        if self._version != catalog.version():
+            self.rebuild()
+        markup = self._markups.get(key)
+        if markup is None:
+            raise KeyError(f"Клавіатуру {key} не зареєстровано")
+        return markup
+
+    def rebuild(self) -> None:
+        """Будує всі клавіатури для поточної версії довідників."""
+        with self._lock:
+            version = catalog.version()
+            if self._version == version:
+                return
+
+            markups, build_times = {}, {}
+            for key, build in _all_builders().items():
+                start = time.perf_counter()
+                markups[key] = build()
+                build_times[key] = time.perf_counter() - start
+
+            self._markups, self._build_times = markups, build_times
+            self._version = version
+            self.rebuilds += 1
+            self._export()
+            total_ms = sum(build_times.values()) * 1000
+            logger.info(f"Клавіатури побудовано (версія довідників {version}): {len(markups)} шт. за {total_ms:.2f} мс.")
+
+    def _export(self) -> None:
+        """Час побудови клавіатур і кількість перебудов — у реєстр метрик (/metrics)."""
+        metrics.registry.inc("evs_keyboard_rebuilds_total")
+        metrics.registry.set_gauge("evs_keyboard_catalog_version", self._version)
+        for name, build_ms in self.build_stats()["build_ms"].items():
+            metrics.registry.set_gauge("evs_keyboard_build_seconds", build_ms / 1000, {"keyboard": name})
+
+    def build_stats(self) -> Dict[str, object]:
+        """Статистика побудови: версія довідників, кількість перебудов та час побудови кожної клавіатури (мс)."""
+        return {
+            "catalog_version": self._version,
+            "rebuilds": self.rebuilds,
+            "keyboards": len(self._markups),
+            "total_ms": sum(self._build_times.values()) * 1000,
+            "build_ms": {":".join(str(part) for part in key if part): t * 1000 for key, t in self._build_times.items()},
+        }
+
+registry = KeyboardRegistry()
+
+# --- Публічні функції (повертають клавіатури з реєстру) ---
+
+def get_categories_kb() -> InlineKeyboardMarkup:
+    """Інлайн-клавіатура з усіма доступними категоріями."""
+    return registry.get(("categories",))
+
+def get_currency_kb() -> InlineKeyboardMarkup:
+    """Клавіатура для вибору валюти."""
+    return registry.get(("currency",))
+
+def get_age_presets_kb() -> InlineKeyboardMarkup:
+    """Клавіатура з пресетами для віку."""
+    return registry.get(("age_presets",))
+
+def get_age_unit_kb() -> InlineKeyboardMarkup:
+    """Клавіатура уточнення одиниць віку (роки/місяці)."""
+    return registry.get(("age_unit",))
+
+def get_skip_name_kb() -> InlineKeyboardMarkup:
+    """Клавіатура пропуску введення назви товару."""
+    return registry.get(("skip_name",))
+
+def get_factor_kb(factor_type: str, back_to: Optional[str] = None) -> InlineKeyboardMarkup:
+    """
+    Клавіатура для вибору коефіцієнтів (фізичний стан, комплектація тощо).
+    Якщо вказано back_to, додається кнопка "⬅️ Назад" до кроку back_to.
+    """
+    return registry.get(("factor", factor_type, back_to))
+
+def get_receipt_actions_kb(val_id: int) -> InlineKeyboardMarkup:
+    """Генерує клавіатуру дій після розрахунку (залежить від val_id, тому не кешується)."""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="📸 Отримати фото-сертифікат", callback_data=f"receipt_img_{val_id}")
+    return builder.as_markup()
+
+def get_history_kb(rows: list, has_newer: bool, has_older: bool) -> InlineKeyboardMarkup:
+    """
+    Клавіатура сторінки /history: фото-сертифікат для кожної оцінки та гортання.
+    Курсори сторінок — id крайніх оцінок (keyset-пагінація), тому клавіатура не кешується.
+    """
+    builder = InlineKeyboardBuilder()
+    for row in rows:
+        builder.button(text=f"📸 #{row['user_report_num'] or row['id']}", callback_data=f"receipt_img_{row['id']}")
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton(text="⬅️ Новіші", callback_data=f"hist_newer_{rows[0]['id']}"))
+    if has_older:
+        nav.append(InlineKeyboardButton(text="Старіші ➡️", callback_data=f"hist_older_{rows[-1]['id']}"))
+    builder.adjust(len(rows) or 1)
+    if nav:
+        builder.row(*nav)
+    return builder.as_markup()
@@ -0,0 +1,195 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, TelegramObject
+
+import funnel
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Ключ у data, через який внутрішній middleware передає назву обробника зовнішньому
+LABELS_KEY = "metrics_labels"
+UNHANDLED_LABEL = "unhandled"
+
+# Ліміт подій одного користувача: у середньому THROTTLE_RATE за секунду, пачкою до THROTTLE_BURST
+THROTTLE_RATE = 2.0
+THROTTLE_BURST = 5
+# Відро користувача, який не надсилав подій довше, видаляється (він знову починає з повним відром)
+THROTTLE_IDLE_SECONDS = 600
+THROTTLED_CALLBACK_TEXT = "⏳ Забагато натискань, зачекайте секунду."
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Зовнішній (outer) middleware: вимірює повну тривалість обробки події
+    (фільтри + обробник) та рахує виклики й винятки по кожному обробнику.
+
+    Обробник обирається вже після outer-middleware, тому його назву записує
+    HandlerNameMiddleware (inner) у спільний словник міток з data.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        labels = {"handler": UNHANDLED_LABEL}
+        data[LABELS_KEY] = labels
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.registry.inc("evs_handler_errors_total", labels)
+            raise
+        finally:
+            metrics.registry.inc("evs_handler_calls_total", labels)
+            metrics.registry.observe("evs_handler_latency_seconds", time.perf_counter() - start, labels)
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Внутрішній (inner) middleware: записує назву обраного обробника у мітки метрик."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        labels = data.get(LABELS_KEY)
+        handler_object = data.get("handler")
+        if labels is not None and handler_object is not None:
+            labels["handler"] = getattr(handler_object.callback, "__name__", UNHANDLED_LABEL)
+        return await handler(event, data)
+
+class FunnelMiddleware(BaseMiddleware):
+    """
+    Зовнішній middleware воронки: порівнює стан FSM до та після обробки події
+    і фіксує перехід у funnel.recorder (лише буфер у пам'яті, без запиту до БД).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        state: FSMContext = data.get("state")
+        user = data.get("event_from_user")
+        if state is None or user is None:
+            return await handler(event, data)
+
+        before = await state.get_state()
+        try:
+            return await handler(event, data)
+        finally:
+            after = await state.get_state()
+            if after != before:
+                funnel.recorder.record(user.id, funnel.step_name(after))
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Зовнішній middleware: token bucket на кожного користувача.
+
+    Подія понад ліміт відкидається до фільтрів та обробника (без запитів до БД
+    і Telegram). На перший відкинутий callback у серії відповідаємо коротким
+    повідомленням, щоб у клієнті зник годинник; решта відкидається мовчки.
+
+    Один екземпляр реєструється і на повідомлення, і на callback-запити, тож
+    ліміт спільний для всіх подій користувача. Стан — [токени, час, попереджено]
+    на активного користувача в OrderedDict за часом останньої події, тому
+    простоюючі відра видаляються з початку словника за O(1) на подію.
+    """
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: int = THROTTLE_BURST,
+                 idle_seconds: float = THROTTLE_IDLE_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self._buckets: "OrderedDict[int, List]" = OrderedDict()
+
+    @property
+    def active_users(self) -> int:
+        return len(self._buckets)
+
+    def allow(self, user_id: int) -> Optional[bool]:
+        """
+        Списує токен користувача. True — подію пропущено; False — відкинуто вперше
+        в серії (варто попередити); None — відкинуто повторно.
+        """
+        now = self.clock()
+        self._evict_idle(now)
+        bucket = self._buckets.pop(user_id, None)
+        if bucket is None:
+            bucket = [float(self.burst), now, False]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        self._buckets[user_id] = bucket
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            return True
+        if bucket[2]:
+            return None
+        bucket[2] = True
+        return False
+
+    def _evict_idle(self, now: float) -> None:
+        while self._buckets:
+            user_id, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < self.idle_seconds:
+                break
+            del self._buckets[user_id]
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        allowed = self.allow(user.id)
+        metrics.registry.set_gauge("evs_throttle_active_users", len(self._buckets))
+        if allowed:
+            return await handler(event, data)
+
+        event_type = "callback_query" if isinstance(event, CallbackQuery) else "message"
+        metrics.registry.inc("evs_throttle_dropped_total", {"event": event_type})
+        if allowed is False:
+            logger.info(f"User {user.id} перевищив ліміт подій, події відкидаються")
+            if isinstance(event, CallbackQuery):
+                try:
+                    await event.answer(THROTTLED_CALLBACK_TEXT)
+                except Exception as e:
+                    logger.warning(f"Не вдалося відповісти на відкинутий callback: {e}")
+        return None
+
+def setup_throttling(router: Router, rate: float = THROTTLE_RATE, burst: int = THROTTLE_BURST) -> ThrottlingMiddleware:
+    """
+    Підключає обмеження частоти подій на користувача. Реєструйте першим, до
+    setup_metrics/setup_funnel, щоб відкинуті події не доходили до інших middleware.
+    """
+    throttling = ThrottlingMiddleware(rate, burst)
+    for observer in (router.message, router.callback_query):
+        observer.outer_middleware(throttling)
+    return throttling
+
+def setup_metrics(router: Router) -> None:
+    """Підключає збір метрик до повідомлень та callback-запитів роутера."""
+    for observer in (router.message, router.callback_query):
+        observer.outer_middleware(MetricsMiddleware())
+        observer.middleware(HandlerNameMiddleware())
+
+def setup_funnel(router: Router) -> None:
+    """Підключає запис переходів ValuationFSM до повідомлень та callback-запитів роутера."""
+    for observer in (router.message, router.callback_query):
+        observer.outer_middleware(FunnelMiddleware())
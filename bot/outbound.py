@@ -0,0 +1,206 @@
+"""
+Планувальник вихідних запитів до Telegram Bot API з урахуванням flood control.
+
+Підключається як middleware сесії бота (bot.session.middleware(...)), тож через
+нього проходять усі answer/edit_text/answer_photo обробників:
+
+- глобальний ліміт (~30 повідомлень/с на бота) та ліміт на чат (~1/с з невеликою
+  пачкою) — token bucket з резервуванням: запит чекає свого слоту, а не отримує 429;
+- edit_text (та edit_reply_markup) того самого повідомлення, що ще чекає слоту,
+  замінюється новішим: у Telegram іде лише останнє редагування, а всі виклики
+  отримують його результат;
+- на 429 чат блокується на retry_after (+ випадкова затримка, що зростає з кожною
+  спробою), після чого запит повторюється до max_retries разів;
+- час очікування в черзі пишеться в гістограму evs_outbound_wait_seconds{method}.
+
+Запити без chat_id (answerCallbackQuery, getMe, setWebhook...) ідуть одразу.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageReplyMarkup, EditMessageText, TelegramMethod
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Ліміти Telegram: ~30 повідомлень/с на бота, ~1/с в один чат (див. Bots FAQ)
+GLOBAL_RATE = 30.0
+GLOBAL_BURST = 5
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+MAX_RETRIES = 3
+# Випадкова добавка до retry_after: до RETRY_JITTER_SECONDS * 2^спроба
+RETRY_JITTER_SECONDS = 0.5
+# Відро чату, до якого не надсилали запитів довше, видаляється
+CHAT_IDLE_SECONDS = 60
+
+# Редагування, які можна замінити новішим того ж типу для того ж повідомлення
+COALESCED_METHODS = (EditMessageText, EditMessageReplyMarkup)
+
+class _Bucket:
+    """Token bucket з резервуванням: reserve() списує токен і повертає, скільки чекати на нього."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "lock")
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+        # Запити одного чату резервують слоти по черзі (зберігається порядок повідомлень)
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def defer(self, now: float, seconds: float) -> None:
+        """Слот використано на seconds пізніше, ніж зарезервовано: цей час не поповнює відро."""
+        self._refill(now)
+        self.tokens -= seconds * self.rate
+
+    def block(self, now: float, seconds: float) -> None:
+        """Жоден слот не звільниться раніше ніж через seconds (після 429)."""
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+class _PendingEdit:
+    __slots__ = ("method", "future")
+
+    def __init__(self, method: TelegramMethod, future: asyncio.Future):
+        self.method = method
+        self.future = future
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Middleware сесії aiogram, що розподіляє вихідні запити в межах лімітів Telegram."""
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, global_burst: int = GLOBAL_BURST,
+                 chat_rate: float = CHAT_RATE, chat_burst: int = CHAT_BURST, max_retries: int = MAX_RETRIES,
+                 retry_jitter: float = RETRY_JITTER_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.retry_jitter = retry_jitter
+        self.clock = clock
+        self._global = _Bucket(global_rate, global_burst, clock())
+        self._chats: "OrderedDict[Hashable, _Bucket]" = OrderedDict()
+        self._pending_edits: Dict[tuple, _PendingEdit] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._waiting = 0
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Any:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        key = self._coalesce_key(method, chat_id)
+        if key is None:
+            return await self._send(make_request, bot, method, chat_id)
+
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            # Попереднє редагування ще чекає слоту — надішлемо замість нього це
+            pending.method = method
+            metrics.registry.inc("evs_outbound_coalesced_total", {"method": type(method).__name__})
+        else:
+            pending = self._pending_edits[key] = _PendingEdit(method, asyncio.get_running_loop().create_future())
+            # Окреме завдання: скасування одного з викликів не скасовує спільне редагування
+            task = asyncio.create_task(self._send_edit(make_request, bot, key, pending, chat_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(pending.future)
+
+    @staticmethod
+    def _coalesce_key(method: TelegramMethod, chat_id: Any) -> Optional[tuple]:
+        if isinstance(method, COALESCED_METHODS) and method.message_id is not None:
+            return type(method).__name__, chat_id, method.message_id
+        return None
+
+    async def _send_edit(self, make_request: NextRequestMiddlewareType, bot: Bot, key: tuple,
+                         pending: _PendingEdit, chat_id: Any) -> None:
+        try:
+            try:
+                await self._wait_for_slot(chat_id, type(pending.method).__name__)
+            finally:
+                # З цього моменту нові редагування ставляться в чергу окремо
+                del self._pending_edits[key]
+            result = await self._send(make_request, bot, pending.method, chat_id, slot_taken=True)
+        except Exception as e:
+            pending.future.set_exception(e)
+        else:
+            pending.future.set_result(result)
+        finally:
+            # Завдання скасовано (зупинка бота тощо): усі, хто чекає на спільне
+            # редагування, отримують CancelledError, а не висять назавжди
+            if not pending.future.done():
+                pending.future.cancel()
+
+    async def _send(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod,
+                    chat_id: Any, slot_taken: bool = False) -> Any:
+        method_name = type(method).__name__
+        for attempt in range(self.max_retries + 1):
+            if not slot_taken:
+                await self._wait_for_slot(chat_id, method_name)
+            slot_taken = False
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = e.retry_after + random.uniform(0, self.retry_jitter * 2 ** attempt)
+                self._chat_bucket(chat_id, self.clock()).block(self.clock(), delay)
+                metrics.registry.inc("evs_outbound_retries_total", {"method": method_name})
+                logger.warning(f"Flood control для чату {chat_id} ({method_name}): повтор через {delay:.1f} с")
+
+    async def _wait_for_slot(self, chat_id: Any, method_name: str) -> None:
+        start = self.clock()
+        self._waiting += 1
+        metrics.registry.set_gauge("evs_outbound_waiting", self._waiting)
+        bucket = self._chat_bucket(chat_id, start)
+        try:
+            async with bucket.lock:
+                # Спершу слот чату, потім глобальний: глобальний слот не резервується,
+                # поки запит однаково чекає на свій чат
+                delay = bucket.reserve(self.clock())
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                delay = self._global.reserve(self.clock())
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    # Інакше наступний запит чату отримав би слот раніше за 1/chat_rate від цього
+                    bucket.defer(self.clock(), delay)
+        finally:
+            self._waiting -= 1
+            metrics.registry.set_gauge("evs_outbound_waiting", self._waiting)
+            metrics.registry.observe("evs_outbound_wait_seconds", self.clock() - start, {"method": method_name})
+
+    def _chat_bucket(self, chat_id: Any, now: float) -> _Bucket:
+        bucket = self._chats.pop(chat_id, None)
+        if bucket is None:
+            bucket = _Bucket(self.chat_rate, self.chat_burst, now)
+        self._chats[chat_id] = bucket
+        while self._chats:
+            oldest = next(iter(self._chats.values()))
+            if now - oldest.updated < CHAT_IDLE_SECONDS or oldest.lock.locked():
+                break
+            self._chats.popitem(last=False)
+        return bucket
+
+def setup_outbound(bot: Bot, **kwargs: Any) -> OutboundScheduler:
+    """Підключає планувальник до сесії бота (параметри — як у OutboundScheduler)."""
+    scheduler = OutboundScheduler(**kwargs)
+    bot.session.middleware(scheduler)
+    return scheduler
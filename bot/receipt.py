@@ -1,119 +1,190 @@
 from PIL import Image, ImageDraw, ImageFont
+import asyncio
+import functools
 import io
 import os
 import re
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import metrics
+
+# Версія макета чека: збільшуйте при будь-якій зміні зовнішнього вигляду,
+# щоб кеш готових зображень (bot/receipt_cache.py) не віддавав старі PNG
+RENDER_VERSION = 1
+
+WIDTH, HEIGHT = 750, 950
+BACKGROUND_COLOR = (24, 24, 27) # Темний преміальний фон
+LABEL_COLOR = (150, 150, 150)
+VALUE_COLOR = (255, 255, 255)
+SUBTITLE_COLOR = (200, 200, 200)
+LINE_COLOR = (100, 100, 100)
+PRICE_COLOR = (16, 185, 129) # Смарагдовий зелений
+
+FACTOR_LINE_HEIGHT = 45
+
+# Рівень стиснення PNG: чек складається з великих однотонних ділянок,
+# тому швидке стиснення дає майже той самий розмір файлу за значно менший час
+PNG_COMPRESS_LEVEL = 1
+
+# Рендеринг виконується у фонових потоках, щоб не блокувати цикл подій бота
+RENDER_WORKERS = 2
+
+# Фактори у порядку відображення: (підпис, префікс ключів у snapshot)
+FACTORS = (
+    ("Фізичний стан", "phys"),
+    ("Технічний стан", "tech"),
+    ("Комплектація", "comp"),
+    ("Гарантія", "warn"),
+    ("Бренд", "brand"),
+    ("Терміновість", "urgent"),
+)
+
+_render_executor: Optional[ThreadPoolExecutor] = None
 
 def clean_factor_name(name: str) -> str:
     """Видаляє текст у дужках (включаючи самі дужки) для чистого відображення у чеку."""
     return re.sub(r'\s*\(.*?\)', '', str(name)).strip()
 
-def generate_receipt_image(snapshot: dict, final_price: float) -> io.BytesIO:
-    """Генерує PNG-зображення з красивим чеком/сертифікатом оцінки."""
-    width, height = 750, 950
-    # Темний преміальний фон
-    img = Image.new('RGB', (width, height), color=(24, 24, 27))
-    draw = ImageDraw.Draw(img)
-    
+@functools.lru_cache(maxsize=1)
+def get_fonts() -> Dict[str, ImageFont.ImageFont]:
+    """Завантажує шрифти один раз на процес."""
     try:
         font_path_reg = os.path.join("assets", "Roboto-Regular.ttf")
         font_path_bold = os.path.join("assets", "Roboto-Bold.ttf")
-        
+
         # Намагаємось використати завантажені шрифти Roboto
-        font_title = ImageFont.truetype(font_path_bold, 42)
-        font_subtitle = ImageFont.truetype(font_path_reg, 32)
-        font_text = ImageFont.truetype(font_path_reg, 26)
-        font_bold = ImageFont.truetype(font_path_bold, 28)
-        font_price = ImageFont.truetype(font_path_bold, 52)
+        return {
+            "title": ImageFont.truetype(font_path_bold, 42),
+            "subtitle": ImageFont.truetype(font_path_reg, 32),
+            "text": ImageFont.truetype(font_path_reg, 26),
+            "bold": ImageFont.truetype(font_path_bold, 28),
+            "price": ImageFont.truetype(font_path_bold, 52),
+        }
     except IOError:
         # Fallback якщо шрифти не знайдено
-        font_title = ImageFont.load_default()
-        font_subtitle = ImageFont.load_default()
-        font_text = ImageFont.load_default()
-        font_bold = ImageFont.load_default()
-        font_price = ImageFont.load_default()
+        default = ImageFont.load_default()
+        return {name: default for name in ("title", "subtitle", "text", "bold", "price")}
+
+def _factor_rows(snapshot: dict) -> list:
+    """Фактори, які потрапляють у чек: (підпис, назва, множник)."""
+    rows = []
+    for label, key in FACTORS:
+        name, mult = snapshot.get(f'{key}_name'), snapshot.get(f'{key}_multiplier')
+        if name and mult is not None:
+            rows.append((label, name, mult))
+    return rows
+
+@functools.lru_cache(maxsize=32)
+def get_template(name_lines: int, factor_labels: Tuple[str, ...]) -> Image.Image:
+    """
+    Статичний шар чека (фон, лінії та підписи) для заданої кількості рядків назви
+    товару і набору факторів. Будується один раз; для кожного чека лише копіюється.
+    """
+    fonts = get_fonts()
+    img = Image.new('RGB', (WIDTH, HEIGHT), color=BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(img)
+
+    draw.line((50, 110, 700, 110), fill=LINE_COLOR, width=2)
+
+    y = 140
+    draw.text((50, y), "Товар:", fill=LABEL_COLOR, font=fonts["text"])
+    y += 40 * name_lines + 10
+    draw.text((50, y), "Новий коштує:", fill=LABEL_COLOR, font=fonts["text"])
+    y += 50
+    draw.text((50, y), "Вік:", fill=LABEL_COLOR, font=fonts["text"])
+    y += 50
+    draw.line((50, y, 700, y), fill=LINE_COLOR, width=1)
+
+    y += 30
+    draw.text((50, y), "Деталі оцінки (фактори зносу):", fill=SUBTITLE_COLOR, font=fonts["subtitle"])
+    y += 60
+    for label in factor_labels:
+        draw.text((50, y), f"{label}:", fill=LABEL_COLOR, font=fonts["text"])
+        y += FACTOR_LINE_HEIGHT
+
+    y -= 15
+    draw.line((50, y+30, 700, y+30), fill=LINE_COLOR, width=2)
+    y += 60
+    draw.text((50, y), "СПРАВЕДЛИВА РИНКОВА ВАРТІСТЬ", fill=SUBTITLE_COLOR, font=fonts["subtitle"])
+    return img
+
+def generate_receipt_image(snapshot: dict, final_price: float) -> io.BytesIO:
+    """Генерує PNG-зображення з красивим чеком/сертифікатом оцінки."""
+    fonts = get_fonts()
+
+    # Отримуємо назву товару і робимо перенесення рядків (wrap)
+    item_name = snapshot.get('item_name', snapshot.get('category_name', 'Невідомо'))
+    wrapped_name = textwrap.wrap(item_name, width=32)
+    factors = _factor_rows(snapshot)
+
+    # Статичний шар береться з кешу, поверх малюються лише динамічні значення
+    img = get_template(len(wrapped_name), tuple(label for label, _, _ in factors)).copy()
+    draw = ImageDraw.Draw(img)
 
     # Заголовок
     report_num = snapshot.get('user_report_num', '')
     title_text = f"EVS Bot: Сертифікат Оцінки #{report_num}" if report_num else "EVS Bot: Сертифікат Оцінки"
-    draw.text((50, 50), title_text, fill=(255, 255, 255), font=font_title)
-    draw.line((50, 110, 700, 110), fill=(100, 100, 100), width=2)
+    draw.text((50, 50), title_text, fill=VALUE_COLOR, font=fonts["title"])
 
     # Базова інформація
     currency = snapshot.get('currency', 'UAH')
     base_price = snapshot.get('base_price', 0)
-    
+
     y = 140
-    # Отримуємо назву товару і робимо перенесення рядків (wrap)
-    item_name = snapshot.get('item_name', snapshot.get('category_name', 'Невідомо'))
-    wrapped_name = textwrap.wrap(item_name, width=32)
-    
-    draw.text((50, y), "Товар:", fill=(150, 150, 150), font=font_text)
     for line in wrapped_name:
-        draw.text((250, y), line, fill=(255, 255, 255), font=font_bold)
+        draw.text((250, y), line, fill=VALUE_COLOR, font=fonts["bold"])
         y += 40
-        
+
     y += 10
-    draw.text((50, y), "Новий коштує:", fill=(150, 150, 150), font=font_text)
-    draw.text((250, y), f"{base_price:,.2f} {currency}", fill=(255, 255, 255), font=font_bold)
-    
+    draw.text((250, y), f"{base_price:,.2f} {currency}", fill=VALUE_COLOR, font=fonts["bold"])
+
     y += 50
-    draw.text((50, y), "Вік:", fill=(150, 150, 150), font=font_text)
     k_age = snapshot.get('age_multiplier', 1.0)
-    draw.text((250, y), f"{snapshot.get('age_months', 0)} міс.", fill=(255, 255, 255), font=font_bold)
-    draw.text((620, y), f"x{k_age:.2f}", fill=(200, 200, 200), font=font_bold) # Множник віку
+    draw.text((250, y), f"{snapshot.get('age_months', 0)} міс.", fill=VALUE_COLOR, font=fonts["bold"])
+    draw.text((620, y), f"x{k_age:.2f}", fill=SUBTITLE_COLOR, font=fonts["bold"]) # Множник віку
 
-    y += 50
-    draw.line((50, y, 700, y), fill=(100, 100, 100), width=1)
-    
     # Фактори
-    y += 30
-    draw.text((50, y), "Деталі оцінки (фактори зносу):", fill=(200, 200, 200), font=font_subtitle)
-    
-    y += 60
-    line_height = 45
-    
-    def format_multiplier(m: float) -> str:
-        color = (255, 80, 80) if m < 1.0 else (80, 255, 80) if m > 1.0 else (200, 200, 200)
-        return f"x{m:.2f}", color
-
-    factors = [
-        ("Фізичний стан", snapshot.get('phys_name'), snapshot.get('phys_multiplier')),
-        ("Технічний стан", snapshot.get('tech_name'), snapshot.get('tech_multiplier')),
-        ("Комплектація", snapshot.get('comp_name'), snapshot.get('comp_multiplier')),
-        ("Гарантія", snapshot.get('warn_name'), snapshot.get('warn_multiplier')),
-        ("Бренд", snapshot.get('brand_name'), snapshot.get('brand_multiplier')),
-        ("Терміновість", snapshot.get('urgent_name'), snapshot.get('urgent_multiplier')),
-    ]
-    
-    for label, name, mult in factors:
-        if name and mult is not None:
-            # Назва фактору
-            draw.text((50, y), f"{label}:", fill=(150, 150, 150), font=font_text)
-            
-            # Чиста назва без дужок
-            clean_name = clean_factor_name(name)
-            if len(clean_name) > 23:
-                clean_name = clean_name[:20] + "..."
-            draw.text((270, y), clean_name, fill=(255, 255, 255), font=font_text)
-            
-            # Множник вирівнюємо жорстко по правій стороні
-            mult_str, color = format_multiplier(mult)
-            draw.text((620, y), mult_str, fill=color, font=font_bold)
-            y += line_height
+    y += 140
+    for _, name, mult in factors:
+        # Чиста назва без дужок
+        clean_name = clean_factor_name(name)
+        if len(clean_name) > 23:
+            clean_name = clean_name[:20] + "..."
+        draw.text((270, y), clean_name, fill=VALUE_COLOR, font=fonts["text"])
+
+        # Множник вирівнюємо жорстко по правій стороні
+        color = (255, 80, 80) if mult < 1.0 else (80, 255, 80) if mult > 1.0 else SUBTITLE_COLOR
+        draw.text((620, y), f"x{mult:.2f}", fill=color, font=fonts["bold"])
+        y += FACTOR_LINE_HEIGHT
 
-    y -= 15
-    draw.line((50, y+30, 700, y+30), fill=(100, 100, 100), width=2)
-    
     # Фінальна ціна
-    y += 60
-    draw.text((50, y), "СПРАВЕДЛИВА РИНКОВА ВАРТІСТЬ", fill=(200, 200, 200), font=font_subtitle)
-    
-    y += 60
-    draw.text((50, y), f"{final_price:,.2f} {currency}", fill=(16, 185, 129), font=font_price) # Смарагдовий зелений
+    y += 105
+    draw.text((50, y), f"{final_price:,.2f} {currency}", fill=PRICE_COLOR, font=fonts["price"])
 
     # Зберігаємо в BytesIO
     bio = io.BytesIO()
-    img.save(bio, format='PNG')
+    img.save(bio, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
     bio.seek(0)
     return bio
+
+async def run_in_render_pool(func: Callable, *args) -> Any:
+    """Виконує func в обмеженому пулі потоків рендерингу, не блокуючи цикл подій."""
+    global _render_executor
+    if _render_executor is None:
+        _render_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="receipt")
+    loop = asyncio.get_running_loop()
+    with metrics.span("render"):
+        return await loop.run_in_executor(_render_executor, func, *args)
+
+async def render_receipt(snapshot: dict, final_price: float) -> io.BytesIO:
+    """Асинхронно генерує чек у пулі потоків рендерингу."""
+    return await run_in_render_pool(generate_receipt_image, snapshot, final_price)
+
+def shutdown() -> None:
+    """Зупиняє пул рендерингу (при зупинці бота)."""
+    global _render_executor
+    if _render_executor is not None:
+        _render_executor.shutdown(wait=True)
+        _render_executor = None
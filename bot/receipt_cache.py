@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join("cache", "receipts")
+# Максимальний сумарний розмір закешованих PNG на диску
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+class ReceiptCache:
+    """
+    Дисковий кеш готових PNG-чеків з адресацією за вмістом та LRU-витісненням.
+
+    Ключ — SHA-256 від усіх вхідних даних рендерингу (snapshot, фінальна ціна,
+    версія макета), тож однаковий чек ніколи не рендериться двічі, а зміна
+    макета (receipt.RENDER_VERSION) автоматично робить старі файли недосяжними.
+
+    bot.receipt (а з ним PIL) імпортується лише при першому запиті чека,
+    тож старт бота та скрипти, що не рендерять чеки, за нього не платять.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict() # ключ -> розмір файлу (від найстарішого)
+        self._total_bytes = 0
+        self._loaded = False
+        self.counters: Dict[str, int] = {"file_id_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(snapshot: dict, final_price: float) -> str:
+        from bot import receipt
+        payload = json.dumps(
+            {"v": receipt.RENDER_VERSION, "price": final_price, "snapshot": snapshot},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_or_render(self, snapshot: dict, final_price: float) -> bytes:
+        """Повертає PNG з кешу або рендерить і зберігає його (синхронно, для пулу рендерингу)."""
+        key = self.make_key(snapshot, final_price)
+        data = self._read(key)
+        if data is not None:
+            self._count("disk_hits")
+            return data
+
+        self._count("misses")
+        from bot import receipt
+        data = receipt.generate_receipt_image(snapshot, final_price).getvalue()
+        self._write(key, data)
+        return data
+
+    async def get_png(self, snapshot: dict, final_price: float) -> bytes:
+        """Асинхронна версія get_or_render: дискові операції та рендеринг виконуються поза циклом подій."""
+        from bot import receipt
+        return await receipt.run_in_render_pool(self.get_or_render, snapshot, final_price)
+
+    def record_file_id_hit(self) -> None:
+        """Фіксує повторну відправку за file_id Telegram (без рендерингу та завантаження)."""
+        self._count("file_id_hits")
+
+    def stats(self) -> Dict[str, int]:
+        """Лічильники влучань/промахів та поточний розмір кешу."""
+        with self._lock:
+            return {**self.counters, "entries": len(self._entries), "bytes": self._total_bytes}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+        metrics.registry.inc("evs_receipt_cache_total", {"event": name})
+
+    def _export_size(self) -> None:
+        # Викликається під self._lock
+        metrics.registry.set_gauge("evs_receipt_cache_entries", len(self._entries))
+        metrics.registry.set_gauge("evs_receipt_cache_bytes", self._total_bytes)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    def _load_index(self) -> None:
+        """Відновлює індекс з диску (порядок LRU — за часом останнього доступу)."""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".png"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._loaded = True
+        self._export_size()
+
+    def _read(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if not self._loaded:
+                self._load_index()
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key)) # Оновлюємо час доступу для LRU після перезапуску
+            return data
+        except OSError:
+            with self._lock:
+                self._total_bytes -= self._entries.pop(key, 0)
+                self._export_size()
+            return None
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Не вдалося зберегти чек у кеш: {e}")
+            return
+
+        with self._lock:
+            self._total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+                self.counters["evictions"] += 1
+                metrics.registry.inc("evs_receipt_cache_total", {"event": "evictions"})
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+            self._export_size()
+
+receipt_cache = ReceiptCache()
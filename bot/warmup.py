@@ -0,0 +1,91 @@
+"""
+Прогрів бота перед прийомом апдейтів (main.py викликає warm_up() до start_polling).
+
+Усе, за що інакше заплатили б перші користувачі після перезапуску, виконується
+заздалегідь: з'єднання з БД у потоках пулу, довідники, клавіатури, шрифти та
+шаблон чека, курси НБУ. Лише після цього emit_ready() пише в лог READY_MARKER
+(його чекає gui.py) і виставляє метрику evs_ready=1 (GET /ready на сервері метрик).
+
+Збій необов'язкового кроку (рендеринг, курси) лише логується: бот однаково
+стає готовим, а крок виконається ліниво при першому запиті.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable
+
+import async_crud
+import catalog
+import metrics
+from bot import keyboards
+from startup_profile import READY_MARKER
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_CURRENCIES = ("USD", "EUR")
+# Скільки чекати НБУ під час прогріву; далі курс оновиться у фоні, а до того діє запасний
+RATES_TIMEOUT_SECONDS = 5.0
+
+def _sample_snapshot() -> dict:
+    """Типовий знімок оцінки з довідника: той самий шаблон чека, що й у більшості реальних."""
+    category = catalog.get_categories()[0]
+    snapshot = {
+        "category_name": category["name_ua"], "item_name": category["name_ua"],
+        "currency": "UAH", "base_price": 10000.0, "age_months": 12, "age_multiplier": 1.0,
+    }
+    from bot import receipt
+    for _, factor in receipt.FACTORS:
+        coeff = catalog.get_coefficients(factor)[0]
+        snapshot[f"{factor}_name"] = coeff["name_ua"]
+        snapshot[f"{factor}_multiplier"] = coeff["multiplier"]
+    return snapshot
+
+def _prerender_receipt(snapshot: dict) -> None:
+    from bot import receipt
+    # Повний рендер завантажує PIL і шрифти та прогріває кодування PNG;
+    # шаблони з усіма факторами — для назв в один і два рядки
+    receipt.generate_receipt_image(snapshot, 1000.0)
+    for name_lines in (1, 2):
+        receipt.get_template(name_lines, tuple(label for label, _ in receipt.FACTORS))
+
+async def _prerender() -> None:
+    from bot import receipt
+    await receipt.run_in_render_pool(_prerender_receipt, _sample_snapshot())
+
+async def _prefetch_rates(currencies: Iterable[str]) -> None:
+    from bot import currency
+    await asyncio.wait_for(currency.rate_cache.prefetch(currencies), timeout=RATES_TIMEOUT_SECONDS)
+
+async def warm_up(currencies: Iterable[str] = PREFETCH_CURRENCIES) -> Dict[str, float]:
+    """Виконує кроки прогріву по черзі; повертає тривалість кожного кроку в секундах."""
+    async def load_catalog() -> None:
+        catalog.load()
+
+    async def build_keyboards() -> None:
+        keyboards.registry.rebuild()
+
+    steps = (
+        ("db", async_crud.warm_up, True),
+        ("catalog", load_catalog, True),
+        ("keyboards", build_keyboards, True),
+        ("receipt", _prerender, False),
+        ("rates", lambda: _prefetch_rates(currencies), False),
+    )
+    timings: Dict[str, float] = {}
+    for name, step, required in steps:
+        start = time.perf_counter()
+        try:
+            await step()
+        except Exception as e:
+            if required:
+                raise
+            logger.warning(f"Прогрів: крок {name} не вдався ({e!r}), виконається при першому запиті")
+        timings[name] = time.perf_counter() - start
+        metrics.registry.set_gauge("evs_warmup_seconds", timings[name], {"step": name})
+    return timings
+
+def emit_ready(timings: Dict[str, float]) -> None:
+    """Сигнал готовності: рядок з READY_MARKER у лозі та evs_ready=1."""
+    metrics.registry.set_gauge("evs_ready", 1)
+    details = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in timings.items())
+    logger.info(f"{READY_MARKER} Бот EVS прогрітий і готовий до роботи ({details}).")
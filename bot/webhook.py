@@ -0,0 +1,200 @@
+"""
+Режим webhook: Telegram надсилає апдейти POST-запитами на локальний aiohttp-сервер.
+
+Запит лише кладе апдейт в обмежену чергу і одразу отримує 200, а обробку виконують
+max_in_flight воркерів паралельно — повільний апдейт не затримує решту.
+Коли черга заповнена, запит чекає на місце до ENQUEUE_TIMEOUT_SECONDS (Telegram не
+надсилає нових апдейтів, поки зайняті всі max_connections з'єднань), після чого
+отримує 503 і Telegram повторить доставку пізніше.
+Під час зупинки черга дообробляється не довше DRAIN_TIMEOUT_SECONDS, потім воркери
+скасовуються: завислий обробник не блокує завершення бота.
+
+Локальна перевірка без Telegram — відтворення записаних апдейтів (JSON Lines, один Update на рядок):
+    python -m bot.webhook updates.jsonl --url http://127.0.0.1:8080/webhook [--secret ...]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import secrets
+import time
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+import aiohttp
+from aiohttp import web
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/webhook"
+MAX_IN_FLIGHT = 32
+QUEUE_SIZE = 1000
+# Скільки запит Telegram чекає місця в повній черзі, перш ніж отримати 503
+ENQUEUE_TIMEOUT_SECONDS = 5.0
+# Скільки під час зупинки чекати дообробки черги, перш ніж скасувати воркери
+DRAIN_TIMEOUT_SECONDS = 30.0
+# Заголовок, у якому Telegram передає secret_token з setWebhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer:
+    """
+    aiohttp-сервер webhook з обмеженою чергою апдейтів та пулом воркерів.
+
+    Метрики: глибина черги та кількість апдейтів в обробці (gauge), прийняті
+    й відхилені запити, час очікування апдейту в черзі.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH, secret_token: Optional[str] = None,
+                 max_in_flight: int = MAX_IN_FLIGHT, queue_size: int = QUEUE_SIZE,
+                 enqueue_timeout: float = ENQUEUE_TIMEOUT_SECONDS, drain_timeout: float = DRAIN_TIMEOUT_SECONDS):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self.max_in_flight = max_in_flight
+        self.enqueue_timeout = enqueue_timeout
+        self.drain_timeout = drain_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._workers: List[asyncio.Task] = []
+        self._in_flight = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _update_gauges(self) -> None:
+        metrics.registry.set_gauge("evs_webhook_queue_depth", self._queue.qsize())
+        metrics.registry.set_gauge("evs_webhook_in_flight", self._in_flight)
+
+    # --- HTTP ---
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret_token and not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret_token):
+            metrics.registry.inc("evs_webhook_requests_total", {"result": "unauthorized"})
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"Некоректний апдейт у webhook: {e}")
+            metrics.registry.inc("evs_webhook_requests_total", {"result": "invalid"})
+            return web.Response(status=400)
+
+        try:
+            await asyncio.wait_for(self._queue.put((time.perf_counter(), update)), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Черга webhook заповнена ({self._queue.maxsize}), апдейт {update.update_id} відхилено")
+            metrics.registry.inc("evs_webhook_requests_total", {"result": "rejected"})
+            return web.Response(status=503)
+        metrics.registry.inc("evs_webhook_requests_total", {"result": "accepted"})
+        self._update_gauges()
+        return web.Response()
+
+    # --- Воркери ---
+
+    async def _worker(self) -> None:
+        while True:
+            enqueued_at, update = await self._queue.get()
+            metrics.registry.observe("evs_webhook_queue_wait_seconds", time.perf_counter() - enqueued_at)
+            self._in_flight += 1
+            self._update_gauges()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                # Винятки обробників aiogram уже логує; сюди потрапляє лише збій самого диспетчера
+                logger.error(f"Помилка обробки апдейту {update.update_id}: {e}")
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+                self._update_gauges()
+
+    # --- Життєвий цикл ---
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        """Запускає воркери та HTTP-сервер (port=0 — довільний вільний порт, див. self.port)."""
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_in_flight)]
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self._update_gauges()
+        logger.info(f"Webhook слухає http://{host}:{self.port}{self.path} (паралельно: {self.max_in_flight}, черга: {self._queue.maxsize})")
+
+    @property
+    def port(self) -> Optional[int]:
+        if self._runner is None or not self._runner.addresses:
+            return None
+        return self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        """Припиняє приймати запити, дообробляє чергу (не довше drain_timeout) та зупиняє воркери."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Черга webhook не дообробилась за {self.drain_timeout:.0f} с: скасовано "
+                           f"{self._in_flight} апдейтів в обробці, відкинуто {self._queue.qsize()} з черги")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+async def run_webhook(dp: Dispatcher, bot: Bot, url: str, host: str, port: int, path: str = WEBHOOK_PATH,
+                      secret_token: Optional[str] = None, max_in_flight: int = MAX_IN_FLIGHT,
+                      queue_size: int = QUEUE_SIZE, drain_timeout: float = DRAIN_TIMEOUT_SECONDS) -> None:
+    """Аналог dp.start_polling для режиму webhook: працює до скасування (Ctrl+C)."""
+    server = WebhookServer(dp, bot, path, secret_token, max_in_flight, queue_size, drain_timeout=drain_timeout)
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    await dp.emit_startup(bot=bot, **workflow_data)
+    await server.start(host, port)
+    try:
+        await bot.set_webhook(
+            # Telegram допускає від 1 до 100 одночасних з'єднань на webhook
+            url, secret_token=secret_token, max_connections=min(max_in_flight, 100),
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        await bot.session.close()
+
+async def replay(path: str, url: str, secret_token: Optional[str] = None, concurrency: int = 10) -> None:
+    """Надсилає записані апдейти (JSON Lines) на локальний webhook і друкує статуси відповідей."""
+    with open(path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    headers = {SECRET_HEADER: secret_token} if secret_token else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses: dict = {}
+
+    async def post(session: aiohttp.ClientSession, update: dict) -> None:
+        async with semaphore:
+            async with session.post(url, json=update, headers=headers) as response:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(post(session, update) for update in updates))
+    print(f"Надіслано {len(updates)} апдейтів за {time.perf_counter() - start:.2f} с, статуси: {statuses}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("updates", help="файл з апдейтами Telegram (JSON Lines)")
+    parser.add_argument("--url", default=f"http://127.0.0.1:8080{WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=None, help="WEBHOOK_SECRET бота")
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(replay(args.updates, args.url, args.secret, args.concurrency))
+
+if __name__ == "__main__":
+    main()
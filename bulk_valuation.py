@@ -0,0 +1,292 @@
+"""
+Пакетна оцінка товарів з файлу партнера (CSV або JSONL).
+
+Кожен рядок описує один товар:
+    category     — id або назва категорії (без урахування регістру та емодзі)
+    base_price   — початкова ціна (> 0)
+    age_months   — вік у місяцях (ціле, >= 0)
+    phys, tech, comp, warn, brand, urgent — коди коефіцієнтів з довідника
+    currency     — опціонально, за замовчуванням UAH
+
+Решта колонок (артикул, назва тощо) переноситься у результат без змін.
+Довідники читаються з БД один раз; рядки оцінюються пачками в пулі процесів
+і записуються у вихідний файл у порядку вхідного, тож пам'ять не залежить
+від розміру файлу. Рядки з помилками (невідомий код, некоректна ціна)
+пропускаються та потрапляють у звіт помилок (CSV).
+
+Запуск з кореня проєкту:
+    python bulk_valuation.py inventory.csv -o valued.jsonl --errors errors.csv
+"""
+import argparse
+import csv
+import json
+import logging
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+import catalog
+import database
+from engine import ValuationEngine
+
+logger = logging.getLogger(__name__)
+
+FACTOR_COLUMNS = ("phys", "tech", "comp", "warn", "brand", "urgent")
+DEFAULT_CURRENCY = "UAH"
+CHUNK_SIZE = 2000
+# Скільки пачок на один процес може одночасно бути в роботі (обмежує пам'ять)
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+ERROR_FIELDS = ("line", "column", "value", "error")
+
+class RowError(ValueError):
+    """Помилка в конкретному полі рядка вхідного файлу."""
+
+    def __init__(self, column: str, value: Any, message: str):
+        super().__init__(message)
+        self.column = column
+        self.value = value
+
+# --- Довідники (один раз на процес) ---
+
+def build_lookups(snapshot: catalog.Catalog) -> Dict[str, Dict]:
+    """Компактні таблиці пошуку для воркерів: ключ категорії -> (id, термін служби), (тип, код) -> множник."""
+    categories: Dict[str, Tuple[int, int]] = {}
+    for cat in snapshot.categories:
+        value = (cat["id"], cat["lifespan_months"])
+        categories[str(cat["id"])] = value
+        categories[_normalize_name(cat["name_ua"])] = value
+    multipliers = {key: coeff["multiplier"] for key, coeff in snapshot.coefficients_by_code.items()}
+    return {"categories": categories, "multipliers": multipliers}
+
+def _normalize_name(name: str) -> str:
+    """'📱 Гаджети (смартфони...)' -> 'гаджети (смартфони...)'."""
+    name = name.strip()
+    start = 0
+    while start < len(name) and not name[start].isalnum():
+        start += 1
+    return name[start:].casefold()
+
+_lookups: Dict[str, Dict] = {}
+
+def _init_worker(lookups: Dict[str, Dict]) -> None:
+    global _lookups
+    _lookups = lookups
+
+# --- Оцінка пачки (виконується у воркері) ---
+
+def _resolve_row(row: Dict[str, Any]) -> Tuple[int, int, float, int, Dict[str, float], str]:
+    """Перевіряє рядок і повертає (id категорії, термін служби, ціна, вік, множники, код фіз. стану)."""
+    category_key = str(row.get("category") or "").strip()
+    category = _lookups["categories"].get(category_key) or _lookups["categories"].get(_normalize_name(category_key))
+    if category is None:
+        raise RowError("category", category_key, "невідома категорія")
+
+    raw_price = row.get("base_price")
+    try:
+        base_price = float(str(raw_price).replace(" ", "").replace(",", "."))
+    except ValueError:
+        raise RowError("base_price", raw_price, "ціна не є числом")
+    # float() приймає "inf" та "nan", а в JSONL такі ціни дали б невалідний Infinity/NaN
+    if not math.isfinite(base_price):
+        raise RowError("base_price", raw_price, "ціна не є скінченним числом")
+    if not base_price > 0:
+        raise RowError("base_price", raw_price, "ціна повинна бути більшою за 0")
+
+    raw_age = row.get("age_months")
+    try:
+        age = float(str(raw_age).strip())
+    except ValueError:
+        age = -0.5
+    if not age.is_integer():
+        raise RowError("age_months", raw_age, "вік не є цілим числом місяців")
+    age_months = int(age)
+    if age_months < 0:
+        raise RowError("age_months", raw_age, "вік не може бути від'ємним")
+
+    factors, codes = {}, {}
+    for factor in FACTOR_COLUMNS:
+        code = codes[factor] = str(row.get(factor) or "").strip()
+        multiplier = _lookups["multipliers"].get((factor, code))
+        if multiplier is None:
+            raise RowError(factor, code, f"невідомий код коефіцієнта {factor}")
+        factors[factor] = multiplier
+    return category[0], category[1], base_price, age_months, factors, codes["phys"]
+
+def value_chunk(rows: List[Dict[str, Any]]) -> List[Tuple[Optional[Dict[str, Any]], Optional[Tuple[str, Any, str]]]]:
+    """
+    Оцінює пачку рядків. Для кожного рядка повертає (результат, None) або
+    (None, (колонка, значення, помилка)) у тому ж порядку, що й rows.
+    """
+    outcomes: List[Any] = [None] * len(rows)
+    valid_indexes, resolved = [], []
+    for i, row in enumerate(rows):
+        if "__error__" in row:
+            # Рядок не вдалося розібрати ще при читанні файлу
+            outcomes[i] = (None, ("", "", row["__error__"]))
+            continue
+        try:
+            resolved.append(_resolve_row(row))
+        except RowError as e:
+            outcomes[i] = (None, (e.column, e.value, str(e)))
+        else:
+            valid_indexes.append(i)
+
+    if resolved:
+        category_ids, lifespans, prices, ages, factors, phys_codes = zip(*resolved)
+        k_ages = ValuationEngine.calculate_k_age_batch(
+            ages, lifespans,
+            is_sealed=[code == "sealed" for code in phys_codes],
+            brand_multiplier=[f["brand"] for f in factors]
+        )
+        final_prices = ValuationEngine.calculate_price_batch(
+            prices, ages, lifespans,
+            k_phys=[f["phys"] for f in factors], k_tech=[f["tech"] for f in factors],
+            k_comp=[f["comp"] for f in factors], k_warn=[f["warn"] for f in factors],
+            k_brand=[f["brand"] for f in factors], k_urgent=[f["urgent"] for f in factors],
+            phys_code=phys_codes, k_age=k_ages
+        )
+        for i, category_id, k_age, final_price in zip(valid_indexes, category_ids, k_ages, final_prices):
+            outcomes[i] = ({
+                "category_id": category_id,
+                "currency": str(rows[i].get("currency") or DEFAULT_CURRENCY).strip().upper(),
+                "age_multiplier": round(k_age, 4),
+                "final_price": round(final_price, 2),
+            }, None)
+    return outcomes
+
+# --- Читання та запис файлів ---
+
+def _file_format(path: str) -> str:
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+def read_rows(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Потоково читає рядки файлу: (номер рядка у файлі, словник полів)."""
+    if fmt == "jsonl":
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                row = {"__error__": f"некоректний JSON: {e.msg}"}
+            yield line_no, row if isinstance(row, dict) else {"__error__": "рядок не є JSON-об'єктом"}
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+
+class ResultWriter:
+    """Записує оцінені рядки у CSV або JSONL (заголовок CSV — за першим рядком)."""
+
+    def __init__(self, stream: TextIO, fmt: str):
+        self.stream = stream
+        self.fmt = fmt
+        self._csv: Optional[csv.DictWriter] = None
+
+    def write(self, row: Dict[str, Any]) -> None:
+        if self.fmt == "jsonl":
+            self.stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+            return
+        if self._csv is None:
+            self._csv = csv.DictWriter(self.stream, fieldnames=list(row), extrasaction="ignore")
+            self._csv.writeheader()
+        self._csv.writerow(row)
+
+def _chunks(rows: Iterable[Tuple[int, Dict[str, Any]]], size: int) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# --- Запуск ---
+
+def run(input_path: str, output_path: str, errors_path: Optional[str] = None, workers: Optional[int] = None,
+        chunk_size: int = CHUNK_SIZE, progress: Optional[TextIO] = sys.stderr) -> Dict[str, Any]:
+    """
+    Оцінює всі рядки input_path і записує результати в output_path.
+    workers=0 — оцінка в поточному процесі (без пулу). Повертає підсумкову статистику.
+    """
+    lookups = build_lookups(catalog.load())
+    if workers is None:
+        workers = os.cpu_count() or 1
+    errors_path = errors_path or os.path.splitext(output_path)[0] + ".errors.csv"
+
+    stats = {"rows": 0, "valued": 0, "errors": 0}
+    start = last_report = time.perf_counter()
+
+    with open(input_path, encoding="utf-8-sig", newline="") as src, \
+         open(output_path, "w", encoding="utf-8", newline="") as dst, \
+         open(errors_path, "w", encoding="utf-8", newline="") as err:
+        writer = ResultWriter(dst, _file_format(output_path))
+        error_writer = csv.writer(err)
+        error_writer.writerow(ERROR_FIELDS)
+
+        def collect(chunk: List[Tuple[int, Dict[str, Any]]], outcomes: List[Any]) -> None:
+            nonlocal last_report
+            for (line_no, row), (result, error) in zip(chunk, outcomes):
+                stats["rows"] += 1
+                if error is None:
+                    stats["valued"] += 1
+                    writer.write({**row, **result})
+                else:
+                    stats["errors"] += 1
+                    error_writer.writerow((line_no, *error))
+            now = time.perf_counter()
+            if progress is not None and now - last_report >= PROGRESS_INTERVAL_SECONDS:
+                last_report = now
+                print(f"\r{stats['rows']:,} рядків, {stats['rows'] / (now - start):,.0f} рядків/с, помилок: {stats['errors']}", end="", file=progress)
+
+        chunks = _chunks(read_rows(src, _file_format(input_path)), chunk_size)
+        if workers == 0:
+            _init_worker(lookups)
+            for chunk in chunks:
+                collect(chunk, value_chunk([row for _, row in chunk]))
+        else:
+            # Обмежена кількість пачок у роботі: читання не випереджає запис
+            in_flight: "deque[Tuple[list, Future]]" = deque()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(lookups,)) as pool:
+                for chunk in chunks:
+                    if len(in_flight) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                        done_chunk, future = in_flight.popleft()
+                        collect(done_chunk, future.result())
+                    in_flight.append((chunk, pool.submit(value_chunk, [row for _, row in chunk])))
+                while in_flight:
+                    done_chunk, future = in_flight.popleft()
+                    collect(done_chunk, future.result())
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    stats["errors_path"] = errors_path
+    if progress is not None:
+        print(f"\rГотово: {stats['rows']:,} рядків за {stats['seconds']:.1f} с "
+              f"({stats['rows_per_second']:,.0f} рядків/с), оцінено {stats['valued']:,}, помилок {stats['errors']:,}", file=progress)
+    return stats
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="вхідний файл (.csv або .jsonl)")
+    parser.add_argument("-o", "--output", required=True, help="файл результатів (.csv або .jsonl)")
+    parser.add_argument("--errors", help="CSV зі звітом про помилки (за замовчуванням <output>.errors.csv)")
+    parser.add_argument("--workers", type=int, default=None, help="кількість процесів (0 — без пулу; за замовчуванням — кількість ядер)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="рядків у пачці для одного процесу")
+    parser.add_argument("--db", default=database.DB_PATH, help="шлях до БД з довідниками")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    database.DB_PATH = args.db
+    stats = run(args.input, args.output, args.errors, args.workers, args.chunk_size)
+    if stats["errors"]:
+        print(f"Звіт про помилки: {stats['errors_path']}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
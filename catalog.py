@@ -0,0 +1,123 @@
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import crud
+import database
+from engine import ValuationEngine
+
+logger = logging.getLogger(__name__)
+
+# Як часто (у секундах) перевіряти, чи не змінилися довідники в БД.
+# Між перевірками всі звернення обслуговуються лише зі словників у пам'яті.
+CHECK_INTERVAL = 1.0
+
+class Catalog:
+    """
+    Незмінний знімок довідників (категорії та коефіцієнти) з O(1) пошуком.
+    Повернуті словники спільні для всіх викликів — їх не можна змінювати.
+    """
+
+    def __init__(self, version: int, categories: List[Dict[str, Any]], coefficients: List[Dict[str, Any]]):
+        self.version = version
+        self.categories = categories
+        self.categories_by_id: Dict[int, Dict[str, Any]] = {cat["id"]: cat for cat in categories}
+        self.coefficients_by_type: Dict[str, List[Dict[str, Any]]] = {}
+        self.coefficients_by_code: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+        for row in coefficients:
+            coeff = {"code": row["code"], "name_ua": row["name_ua"], "multiplier": row["multiplier"]}
+            self.coefficients_by_type.setdefault(row["factor_type"], []).append(coeff)
+            self.coefficients_by_code[(row["factor_type"], row["code"])] = coeff
+
+class _CatalogState:
+    """Поточний знімок довідників та дані для перевірки його актуальності."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.catalog: Optional[Catalog] = None
+        self.db_path: Optional[str] = None
+        # Окреме з'єднання лише для PRAGMA data_version: значення змінюється,
+        # коли будь-яке інше з'єднання фіксує транзакцію в цій БД.
+        self.watch_conn: Optional[sqlite3.Connection] = None
+        self.data_version: Optional[int] = None
+        self.checked_at = 0.0
+
+_state = _CatalogState()
+
+def load() -> Catalog:
+    """Примусово (пере)завантажує довідники з БД. Викликається при старті бота."""
+    with _state.lock:
+        return _reload()
+
+def get_catalog() -> Catalog:
+    """Повертає актуальний знімок довідників, перечитуючи БД лише після зміни версії."""
+    catalog = _state.catalog
+    if (
+        catalog is not None
+        and _state.db_path == database.DB_PATH
+        and time.monotonic() - _state.checked_at < CHECK_INTERVAL
+    ):
+        return catalog
+
+    with _state.lock:
+        if _state.catalog is None or _state.db_path != database.DB_PATH:
+            return _reload()
+
+        _state.checked_at = time.monotonic()
+        data_version = _state.watch_conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != _state.data_version:
+            _state.data_version = data_version
+            # Інші з'єднання щось записали (можливо, лише оцінки) — звіряємо версію довідників
+            if crud.get_catalog_version() != _state.catalog.version:
+                return _reload()
+        return _state.catalog
+
+def invalidate() -> None:
+    """Скидає кеш; наступне звернення завантажить довідники заново."""
+    with _state.lock:
+        _state.catalog = None
+
+def version() -> int:
+    """Версія довідників, з якої побудовано поточний знімок."""
+    return get_catalog().version
+
+def get_categories() -> List[Dict[str, Any]]:
+    """Повертає всі категорії, відсортовані за sort_order."""
+    return get_catalog().categories
+
+def get_category_by_id(cat_id: int) -> Optional[Dict[str, Any]]:
+    """Повертає категорію за її ID."""
+    return get_catalog().categories_by_id.get(cat_id)
+
+def get_coefficients(factor_type: str) -> List[Dict[str, Any]]:
+    """Повертає коефіцієнти певного типу, відсортовані за sort_order."""
+    return get_catalog().coefficients_by_type.get(factor_type, [])
+
+def get_coefficient_by_code(factor_type: str, code: str) -> Optional[Dict[str, Any]]:
+    """Повертає конкретний коефіцієнт за його типом та кодом."""
+    return get_catalog().coefficients_by_code.get((factor_type, code))
+
+def _reload() -> Catalog:
+    """Читає довідники з БД (викликається під _state.lock)."""
+    if _state.db_path != database.DB_PATH or _state.watch_conn is None:
+        if _state.watch_conn is not None:
+            _state.watch_conn.close()
+        _state.db_path = database.DB_PATH
+        _state.watch_conn = database.open_connection(_state.db_path)
+
+    _state.data_version = _state.watch_conn.execute("PRAGMA data_version").fetchone()[0]
+    _state.checked_at = time.monotonic()
+
+    catalog = Catalog(crud.get_catalog_version(), crud.get_categories(), crud.get_all_coefficients())
+    previous = _state.catalog
+    _state.catalog = catalog
+
+    # Коефіцієнти могли змінитися — кешовані криві старіння більше не актуальні
+    if previous is not None:
+        ValuationEngine.clear_curve_cache()
+
+    logger.info(f"Довідники завантажено (версія {catalog.version}): {len(catalog.categories)} категорій, {len(catalog.coefficients_by_code)} коефіцієнтів.")
+    return catalog
@@ -1,91 +1,126 @@
 import sqlite3
-import json
-from typing import List, Dict, Any, Optional
-from database import DB_PATH
+from typing import List, Dict, Any, Optional, Tuple
+from database import get_connection, transaction
+import rollups
+import snapshot_codec
+
+# Усі функції працюють через постійне з'єднання поточного потоку (database.get_connection),
+# тому SQL-вирази компілюються один раз і перевикористовуються з кешу з'єднання.
 
 def get_categories() -> List[Dict[str, Any]]:
     """Повертає всі категорії, відсортовані за sort_order."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name_ua, lifespan_months FROM categories ORDER BY sort_order")
-    categories = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return categories
+    cursor = get_connection().execute("SELECT id, name_ua, lifespan_months FROM categories ORDER BY sort_order")
+    return [dict(row) for row in cursor.fetchall()]
 
 def get_category_by_id(cat_id: int) -> Optional[Dict[str, Any]]:
     """Повертає категорію за її ID."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name_ua, lifespan_months FROM categories WHERE id = ?", (cat_id,))
+    cursor = get_connection().execute("SELECT id, name_ua, lifespan_months FROM categories WHERE id = ?", (cat_id,))
     row = cursor.fetchone()
-    conn.close()
     return dict(row) if row else None
 
 def get_coefficients(factor_type: str) -> List[Dict[str, Any]]:
     """Повертає коефіцієнти певного типу (напр., 'phys', 'tech'), відсортовані за sort_order."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT code, name_ua, multiplier FROM coefficients WHERE factor_type = ? ORDER BY sort_order", (factor_type,))
-    coeffs = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return coeffs
+    cursor = get_connection().execute("SELECT code, name_ua, multiplier FROM coefficients WHERE factor_type = ? ORDER BY sort_order", (factor_type,))
+    return [dict(row) for row in cursor.fetchall()]
 
 def get_coefficient_by_code(factor_type: str, code: str) -> Optional[Dict[str, Any]]:
     """Повертає конкретний коефіцієнт за його типом та кодом."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT code, name_ua, multiplier FROM coefficients WHERE factor_type = ? AND code = ?", (factor_type, code))
+    cursor = get_connection().execute("SELECT code, name_ua, multiplier FROM coefficients WHERE factor_type = ? AND code = ?", (factor_type, code))
     row = cursor.fetchone()
-    conn.close()
     return dict(row) if row else None
 
+def get_all_coefficients() -> List[Dict[str, Any]]:
+    """Повертає всі коефіцієнти (з factor_type), відсортовані за типом та sort_order."""
+    cursor = get_connection().execute("SELECT factor_type, code, name_ua, multiplier FROM coefficients ORDER BY factor_type, sort_order")
+    return [dict(row) for row in cursor.fetchall()]
+
+def get_catalog_version() -> int:
+    """Повертає поточну версію довідників (збільшується тригерами при кожній зміні)."""
+    row = get_connection().execute("SELECT version FROM catalog_meta WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
 def get_or_create_user(telegram_id: int, username: str) -> int:
     """Знаходить користувача за telegram_id або створює нового. Повертає внутрішній id."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
-    row = cursor.fetchone()
-    if row:
-        user_id = row[0]
-    else:
-        cursor.execute("INSERT INTO users (telegram_id, username) VALUES (?, ?)", (telegram_id, username))
-        user_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return user_id
+    with transaction() as conn:
+        row = conn.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,)).fetchone()
+        if row:
+            return row[0]
+        cursor = conn.execute("INSERT INTO users (telegram_id, username) VALUES (?, ?)", (telegram_id, username))
+        return cursor.lastrowid
 
 def save_valuation(user_id: int, category_id: int, base_price: float, currency_code: str, final_price: float, snapshot: dict) -> tuple[int, int]:
     """Зберігає розрахунок у базу даних та повертає id запису та порядковий номер звіту для цього користувача."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Визначаємо порядковий номер звіту для користувача
-    cursor.execute("SELECT COUNT(*) FROM valuations WHERE user_id = ?", (user_id,))
-    user_report_num = cursor.fetchone()[0] + 1
-    
+    with transaction() as conn:
+        return insert_valuation(conn, user_id, category_id, base_price, currency_code, final_price, snapshot)
+
+def insert_valuation(conn: sqlite3.Connection, user_id: int, category_id: int, base_price: float, currency_code: str, final_price: float, snapshot: dict) -> tuple[int, int]:
+    """
+    Вставляє оцінку в межах уже відкритої транзакції (без commit).
+    Використовується save_valuation та пакетним записувачем valuation_writer.
+    """
+    # Визначаємо порядковий номер звіту для користувача: атомарний інкремент лічильника
+    # у тій самій транзакції (без COUNT(*) по історії та без гонок між записами)
+    cursor = conn.execute("UPDATE users SET valuation_count = valuation_count + 1 WHERE id = ?", (user_id,))
+    if cursor.rowcount:
+        user_report_num = conn.execute("SELECT valuation_count FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+    else:
+        # Користувача немає в таблиці users — рахуємо за історією, як раніше
+        user_report_num = conn.execute("SELECT COUNT(*) FROM valuations WHERE user_id = ?", (user_id,)).fetchone()[0] + 1
+
     # Зберігаємо номер у snapshot для генерації квитанцій
     snapshot['user_report_num'] = user_report_num
-    snapshot_json = json.dumps(snapshot, ensure_ascii=False)
-    
-    cursor.execute("""
-        INSERT INTO valuations (user_id, category_id, base_price, currency_code, final_price, snapshot_json)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (user_id, category_id, base_price, currency_code, final_price, snapshot_json))
+
+    # Компактний знімок (коди + числа); snapshot_json лишається порожнім для нових записів
+    cursor = conn.execute("""
+        INSERT INTO valuations (user_id, category_id, base_price, currency_code, final_price, snapshot_json, snapshot, user_report_num)
+        VALUES (?, ?, ?, ?, ?, '', ?, ?)
+    """, (user_id, category_id, base_price, currency_code, final_price, snapshot_codec.encode(snapshot), user_report_num))
     val_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+
+    # Агрегати для аналітики оновлюються в тій самій транзакції
+    rollups.record(conn, category_id, currency_code, base_price, final_price, snapshot)
     return val_id, user_report_num
 
 def get_valuation(val_id: int) -> Optional[Dict[str, Any]]:
-    """Повертає запис про оцінку за ID."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM valuations WHERE id = ?", (val_id,))
+    """
+    Повертає запис про оцінку за ID. Знімок не розкодовується: поле snapshot — сирий BLOB,
+    а розкодувати його (лише коли потрібно) можна через snapshot_codec.load_snapshot.
+    """
+    cursor = get_connection().execute("SELECT * FROM valuations WHERE id = ?", (val_id,))
     row = cursor.fetchone()
-    conn.close()
     return dict(row) if row else None
+
+def get_valuation_page(telegram_id: int, before_id: Optional[int] = None, after_id: Optional[int] = None,
+                       limit: int = 5) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Сторінка історії оцінок користувача (від новіших до старіших) з keyset-пагінацією по (user_id, id).
+
+    before_id — наступна сторінка старіших оцінок (id < before_id), after_id — попередня
+    сторінка новіших (id > after_id); без курсора — найновіші оцінки. Повертає рядки
+    сторінки та ознаку, чи є ще записи в напрямку гортання.
+    Запит читає лише покриваючий індекс idx_valuations_user_history, тож час
+    не залежить ні від довжини історії, ні від номера сторінки (на відміну від OFFSET).
+    """
+    columns = "id, user_report_num, created_at, category_id, final_price, currency_code"
+    user_filter = "user_id = (SELECT id FROM users WHERE telegram_id = ?)"
+    if after_id is not None:
+        query = f"SELECT {columns} FROM valuations WHERE {user_filter} AND id > ? ORDER BY id ASC LIMIT ?"
+        params = (telegram_id, after_id, limit + 1)
+    elif before_id is not None:
+        query = f"SELECT {columns} FROM valuations WHERE {user_filter} AND id < ? ORDER BY id DESC LIMIT ?"
+        params = (telegram_id, before_id, limit + 1)
+    else:
+        query = f"SELECT {columns} FROM valuations WHERE {user_filter} ORDER BY id DESC LIMIT ?"
+        params = (telegram_id, limit + 1)
+
+    rows = [dict(row) for row in get_connection().execute(query, params).fetchall()]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after_id is not None:
+        rows.reverse()
+    return rows, has_more
+
+def set_receipt_file_id(val_id: int, file_id: str) -> None:
+    """Зберігає file_id Telegram для вже надісланого фото-сертифіката оцінки."""
+    with transaction() as conn:
+        conn.execute("UPDATE valuations SET receipt_file_id = ? WHERE id = ?", (file_id, val_id))
@@ -1,13 +1,144 @@
 import sqlite3
 import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import snapshot_codec
 
 logger = logging.getLogger(__name__)
 
 DB_PATH = "resale_helper.db"
 
+# Розмір кешу підготовлених (prepared) запитів на одне з'єднання.
+# Постійні з'єднання дозволяють повторно використовувати скомпільовані SQL-вирази.
+STATEMENT_CACHE_SIZE = 128
+
+# Версія даних у PRAGMA user_version: міграції, що проходять по всій таблиці,
+# виконуються один раз при переході на нову версію, а не при кожному старті.
+#   1 — знімки оцінок перекодовано з snapshot_json у компактний snapshot
+SCHEMA_VERSION = 1
+# Скільки id непридатних знімків перелічувати в лозі міграції
+UNDECODABLE_LOG_LIMIT = 20
+
+# --- Профілі PRAGMA ---
+# Застосовуються до кожного з'єднання (open_connection, init_db, seed_db).
+PRAGMA_PROFILES: Dict[str, Dict[str, Any]] = {
+    # WAL: читачі не блокуються записувачем; synchronous=NORMAL у режимі WAL
+    # не втрачає цілісності БД, а fsync виконується лише на контрольних точках.
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,        # мс очікування блокування замість "database is locked"
+        "cache_size": -16000,        # від'ємне значення — у КіБ (≈16 МБ на з'єднання)
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+    # Налаштування SQLite за замовчуванням (rollback journal, synchronous=FULL)
+    "default": {
+        "busy_timeout": 5000,
+    },
+}
+
+PRAGMA_PROFILE: Dict[str, Any] = dict(PRAGMA_PROFILES["performance"])
+
+def set_pragma_profile(name: str = "performance", **overrides: Any) -> None:
+    """
+    Обирає профіль PRAGMA для всіх нових з'єднань. Окремі значення можна
+    перевизначити: set_pragma_profile("performance", cache_size=-64000).
+    """
+    if name not in PRAGMA_PROFILES:
+        raise ValueError(f"Невідомий профіль PRAGMA: {name}")
+    PRAGMA_PROFILE.clear()
+    PRAGMA_PROFILE.update(PRAGMA_PROFILES[name])
+    PRAGMA_PROFILE.update(overrides)
+    logger.info(f"Профіль PRAGMA SQLite: {name} {PRAGMA_PROFILE}")
+
+def apply_pragmas(conn: sqlite3.Connection) -> None:
+    """Застосовує поточний профіль PRAGMA до з'єднання."""
+    for name, value in PRAGMA_PROFILE.items():
+        conn.execute(f"PRAGMA {name} = {value}").fetchall()
+
+# --- Менеджер з'єднань ---
+# Кожен потік отримує власне постійне з'єднання (sqlite3.Connection не можна
+# безпечно ділити між потоками), яке живе до виклику close_connections().
+_local = threading.local()
+_connections: List[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+_generation = 0  # Збільшується при close_connections(), щоб потоки не використали закриті з'єднання
+
+def open_connection(db_path: str) -> sqlite3.Connection:
+    """Відкриває нове (не кешоване) з'єднання з налаштуваннями, спільними для всіх CRUD-функцій."""
+    conn = sqlite3.connect(db_path, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    apply_pragmas(conn)
+    return conn
+
+def get_connection(db_path: Optional[str] = None) -> sqlite3.Connection:
+    """
+    Повертає постійне з'єднання поточного потоку для db_path (за замовчуванням DB_PATH).
+    З'єднання відкривається один раз і перевикористовується всіма наступними запитами.
+    """
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None or _local.generation != _generation:
+        connections = _local.connections = {}
+        _local.generation = _generation
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = open_connection(db_path)
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+@contextmanager
+def transaction(db_path: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+    """
+    Контекстний менеджер транзакції на з'єднанні поточного потоку.
+    Фіксує зміни при успішному виході з блоку та відкочує їх при винятку.
+    """
+    conn = get_connection(db_path)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def close_thread_connections() -> None:
+    """Закриває з'єднання поточного потоку (перед завершенням фонового потоку)."""
+    connections = getattr(_local, "connections", None)
+    if not connections or _local.generation != _generation:
+        return
+    with _connections_lock:
+        for conn in connections.values():
+            conn.close()
+            _connections.remove(conn)
+    connections.clear()
+
+def close_connections() -> None:
+    """Закриває всі з'єднання, відкриті менеджером (при зупинці бота або в тестах)."""
+    global _generation
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+        _generation += 1
+
+def _add_column_if_missing(cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> bool:
+    """Додає колонку до існуючої таблиці (міграція старих БД). Повертає True, якщо колонку додано."""
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    if column in columns:
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    logger.info(f"Міграція: додано колонку {table}.{column}")
+    return True
+
 def init_db(db_path: str = DB_PATH) -> None:
     """Ініціалізація бази даних та створення таблиць, якщо вони не існують."""
     conn = sqlite3.connect(db_path)
+    apply_pragmas(conn)
     
     # Увімкнення підтримки зовнішніх ключів у SQLite
     conn.execute("PRAGMA foreign_keys = ON;")
@@ -67,17 +198,162 @@ def init_db(db_path: str = DB_PATH) -> None:
             )
         """)
 
+        # 5. Версія довідників (categories + coefficients)
+        # Тригери збільшують версію при будь-якій зміні довідників (у т.ч. скриптами
+        # на кшталт update_db_v3.py), за нею кеш catalog.py визначає, що треба перечитати дані.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS catalog_meta (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO catalog_meta (id, version) VALUES (1, 0)")
+        for table in ("categories", "coefficients"):
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                    AFTER {event} ON {table}
+                    BEGIN
+                        UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+                    END
+                """)
+
+        # 6. Журнал переходів між станами ValuationFSM (лише додавання, пишеться пакетами з funnel.py).
+        # Крок зберігається кодом з funnel.FUNNEL_STEPS, час — Unix-часом у секундах.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_events (
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                telegram_id INTEGER NOT NULL,
+                step INTEGER NOT NULL
+            )
+        """)
+
+        # 7. Агрегати оцінок (rollups.py): оновлюються в транзакції збереження оцінки,
+        # тож аналітика читає O(днів × категорій) рядків замість усієї таблиці valuations
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS valuation_rollups (
+                day TEXT NOT NULL,
+                category_id INTEGER NOT NULL,
+                currency_code TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                sum_base_price REAL NOT NULL DEFAULT 0,
+                sum_final_price REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, category_id, currency_code)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS valuation_price_buckets (
+                day TEXT NOT NULL,
+                category_id INTEGER NOT NULL,
+                currency_code TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, category_id, currency_code, bucket)
+            ) WITHOUT ROWID
+        """)
+        # Перша версія таблиці не мала currency_code у ключі; агрегати похідні,
+        # тож стара таблиця перестворюється і заповнюється через rollups.py --backfill
+        factor_columns = {row[1] for row in cursor.execute("PRAGMA table_info(valuation_factor_rollups)")}
+        if factor_columns and "currency_code" not in factor_columns:
+            cursor.execute("DROP TABLE valuation_factor_rollups")
+            logger.warning("Міграція: valuation_factor_rollups перестворено з валютою в ключі, "
+                           "запустіть python rollups.py --backfill")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS valuation_factor_rollups (
+                day TEXT NOT NULL,
+                category_id INTEGER NOT NULL,
+                currency_code TEXT NOT NULL,
+                factor_type TEXT NOT NULL,
+                code TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, category_id, currency_code, factor_type, code)
+            ) WITHOUT ROWID
+        """)
+
+        # 8. Стани FSM користувачів (bot/fsm_storage.py): ключ — JSON-список полів StorageKey,
+        # data — JSON. Пишеться пакетами у фоні, читається при старті та при промаху кешу.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+
+        # 9. Міграції існуючих таблиць
+        # file_id надісланого фото-сертифіката (повторна відправка без рендерингу та завантаження)
+        _add_column_if_missing(cursor, "valuations", "receipt_file_id", "TEXT")
+
+        # Лічильник оцінок користувача: номер звіту видається атомарним інкрементом
+        # у транзакції збереження замість COUNT(*) по всій історії користувача
+        if _add_column_if_missing(cursor, "users", "valuation_count", "INTEGER NOT NULL DEFAULT 0"):
+            cursor.execute("""
+                UPDATE users SET valuation_count = (
+                    SELECT COUNT(*) FROM valuations WHERE valuations.user_id = users.id
+                )
+            """)
+        if _add_column_if_missing(cursor, "valuations", "user_report_num", "INTEGER"):
+            # Номер, який користувач уже бачив у звіті, зберігався лише у snapshot_json
+            cursor.execute("""
+                UPDATE valuations SET user_report_num = json_extract(snapshot_json, '$.user_report_num')
+                WHERE user_report_num IS NULL
+            """)
+
+        # Компактний знімок оцінки (snapshot_codec) замість повного JSON з назвами.
+        # Старі рядки перекодовуються один раз (user_version < 1), але snapshot_json не чіпається:
+        # його очищає лише явна команда compact_snapshots() після перевірки нового знімка.
+        # Рядки, які не вдалося розібрати, позначаються порожнім snapshot і читаються зі snapshot_json.
+        _add_column_if_missing(cursor, "valuations", "snapshot", "BLOB")
+        data_version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        encoded, undecodable = 0, []
+        if data_version < 1:
+            conn.create_function("evs_encode_snapshot", 1, snapshot_codec.encode_legacy_json, deterministic=True)
+            cursor.execute("""
+                UPDATE valuations SET snapshot = COALESCE(evs_encode_snapshot(snapshot_json), X'')
+                WHERE snapshot IS NULL AND snapshot_json != ''
+            """)
+            encoded = cursor.rowcount
+            undecodable = [row[0] for row in cursor.execute("SELECT id FROM valuations WHERE snapshot = X''")]
+            encoded -= len(undecodable)
+        if data_version < SCHEMA_VERSION:
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        # 10. Індекси
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_valuations_user_created ON valuations (user_id, created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_valuations_category ON valuations (category_id)")
+        # Покриваючий індекс для /history: сторінка читається лише з індексу, без звернень до таблиці
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_valuations_user_history
+            ON valuations (user_id, id, user_report_num, created_at, category_id, final_price, currency_code)
+        """)
+        # Звіт воронки читає лише події за вікно часу
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_fsm_events_ts ON fsm_events (ts)")
+        # Відновлення найсвіжіших станів FSM та видалення застарілих при старті
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated ON fsm_storage (updated_at)")
+
         conn.commit()
+        if encoded:
+            logger.info(f"Перекодовано знімків оцінок у компактний формат: {encoded} "
+                        f"(snapshot_json очищає python database.py compact-snapshots)")
+        if undecodable:
+            ids = ", ".join(map(str, undecodable[:UNDECODABLE_LOG_LIMIT])) + (" ..." if len(undecodable) > UNDECODABLE_LOG_LIMIT else "")
+            logger.warning(f"Знімків оцінок, які не вдалося перекодувати (лишаються у snapshot_json): "
+                           f"{len(undecodable)}, id: {ids}")
         logger.info("Базу даних успішно ініціалізовано.")
     except sqlite3.Error as e:
         logger.error(f"Помилка при ініціалізації бази даних: {e}")
         conn.rollback()
+        # Бот не повинен стартувати на частково створеній схемі
+        raise
     finally:
         conn.close()
 
 def seed_db(db_path: str = DB_PATH) -> None:
     """Наповнення бази даних початковими (seed) даними: категоріями та коефіцієнтами."""
     conn = sqlite3.connect(db_path)
+    apply_pragmas(conn)
     cursor = conn.cursor()
 
     # 1. Базові категорії (Групи амортизації)
@@ -155,8 +431,36 @@ def seed_db(db_path: str = DB_PATH) -> None:
     finally:
         conn.close()
 
+def compact_snapshots(db_path: str = DB_PATH, vacuum: bool = True) -> int:
+    """
+    Обслуговування (не виконується при старті): очищає snapshot_json у рядках, чий компактний
+    знімок розкодовується в ті самі дані, та повертає ОС звільнене місце (VACUUM).
+    Рядки, що не пройшли перевірку, не змінюються. Повертає кількість очищених рядків.
+    """
+    conn = sqlite3.connect(db_path)
+    apply_pragmas(conn)
+    try:
+        rows = conn.execute(
+            "SELECT id, snapshot, snapshot_json FROM valuations WHERE snapshot != X'' AND snapshot_json != ''"
+        ).fetchall()
+        verified = [(val_id,) for val_id, blob, snapshot_json in rows if snapshot_codec.matches_legacy_json(blob, snapshot_json)]
+        with conn:
+            conn.executemany("UPDATE valuations SET snapshot_json = '' WHERE id = ?", verified)
+        if len(verified) < len(rows):
+            logger.warning(f"Знімків, що не пройшли перевірку (snapshot_json збережено): {len(rows) - len(verified)}")
+        if verified and vacuum:
+            conn.execute("VACUUM")
+        logger.info(f"Очищено snapshot_json у {len(verified)} оцінках")
+        return len(verified)
+    finally:
+        conn.close()
+
 if __name__ == "__main__":
     # Налаштування логування для автономного запуску
     logging.basicConfig(level=logging.INFO)
-    init_db()
-    seed_db()
+    import sys
+    if sys.argv[1:] == ["compact-snapshots"]:
+        compact_snapshots()
+    else:
+        init_db()
+        seed_db()
@@ -1,4 +1,28 @@
 import math
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+# NumPy — необов'язкова залежність лише для пакетного розрахунку. Імпортується при першому
+# пакетному виклику (_load_numpy), а не при імпорті модуля: бот рахує поштучно і за нього не платить
+np = None
+_numpy_checked = False
+
+def _load_numpy():
+    """Модуль numpy або None, якщо його не встановлено (тоді пакет рахується циклом)."""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+    return np
+
+class KAgeCurve(NamedTuple):
+    """Попередньо розрахована крива старіння для однієї пари (lifespan, brand)."""
+    floor: float
+    decay_constant: float
+    table: Tuple[float, ...]  # K_age для цілих віків 0..CURVE_TABLE_MONTHS
 
 class ValuationEngine:
     """
@@ -10,6 +34,10 @@ class ValuationEngine:
     BASE_RESIDUAL_VALUE_FLOOR = 0.20
     VINTAGE_MULTIPLIER_THRESHOLD = 1.5
 
+    # Довжина таблиці кешованих кривих K_age (у місяцях, 50 років)
+    CURVE_TABLE_MONTHS = 600
+    _curve_cache: Dict[Tuple[int, float, bool], "KAgeCurve"] = {}
+
     @classmethod
     def calculate_k_age(cls, age_months: int, lifespan_months: int, is_sealed: bool = False, brand_multiplier: float = 1.0) -> float:
         """
@@ -22,30 +50,81 @@ class ValuationEngine:
         if lifespan_months <= 0:
             raise ValueError("lifespan_months повинен бути більше 0")
 
+        # Значення для цілих місяців беруться з попередньо розрахованої кривої
+        curve = cls.get_k_age_curve(lifespan_months, brand_multiplier, is_sealed)
+        if isinstance(age_months, int) and age_months < len(curve.table):
+            return curve.table[age_months]
+
+        return cls._k_age_from_params(age_months, lifespan_months, is_sealed, curve.floor, curve.decay_constant)
+
+    @classmethod
+    def get_k_age_curve(cls, lifespan_months: int, brand_multiplier: float = 1.0, is_sealed: bool = False) -> "KAgeCurve":
+        """
+        Повертає кешовану криву старіння для пари (lifespan, brand) та ознаки sealed:
+        константу згасання k і таблицю K_age для цілих віків 0..CURVE_TABLE_MONTHS.
+        Набір входів замкнений (категорії x бренди), тож крива рахується один раз.
+        """
+        key = (lifespan_months, brand_multiplier, bool(is_sealed))
+        curve = cls._curve_cache.get(key)
+        if curve is None:
+            if lifespan_months <= 0:
+                raise ValueError("lifespan_months повинен бути більше 0")
+            floor = cls._residual_floor(lifespan_months)
+            k = cls._decay_constant(lifespan_months, brand_multiplier, floor)
+            table = (1.0,) + tuple(
+                cls._k_age_from_params(age, lifespan_months, is_sealed, floor, k)
+                for age in range(1, cls.CURVE_TABLE_MONTHS + 1)
+            )
+            curve = cls._curve_cache[key] = KAgeCurve(floor, k, table)
+        return curve
+
+    @classmethod
+    def clear_curve_cache(cls) -> None:
+        """Скидає кеш кривих старіння (викликається при зміні коефіцієнтів у БД)."""
+        cls._curve_cache.clear()
+
+    @classmethod
+    def _k_age_from_params(cls, age_months: int, lifespan_months: int, is_sealed: bool, floor: float, k: float) -> float:
+        """Безпосередній розрахунок K_age (для age_months > 0) за вже відомими floor та k."""
+        # Обробка "Новий у коробці"
+        # Якщо товар запечатаний, він майже не старіє.
+        if is_sealed:
+            return cls._sealed_k_age(age_months, lifespan_months)
+
+        k_age = floor + (1.0 - floor) * math.exp(-k * age_months)
+
+        return max(k_age, floor)
+
+    @classmethod
+    def _residual_floor(cls, lifespan_months: int) -> float:
+        """Мінімальна залишкова вартість (Price Floor) для заданого терміну служби."""
         # Для меблів (lifespan_months >= 360) знецінення відбувається набагато повільніше (floor 40%)
         # Для електроніки (lifespan_months <= 120) floor 20%
-        floor = cls.BASE_RESIDUAL_VALUE_FLOOR
         if lifespan_months >= 360:
-            floor = 0.40
+            return 0.40
         elif lifespan_months >= 240:
-            floor = 0.30
+            return 0.30
+        return cls.BASE_RESIDUAL_VALUE_FLOOR
 
-        # Обробка "Новий у коробці"
-        # Якщо товар запечатаний, він майже не старіє.
-        if is_sealed:
-            # Якщо це ще й вінтаж (дуже старий, але новий)
-            is_vintage = age_months >= (lifespan_months * cls.VINTAGE_MULTIPLIER_THRESHOLD)
-            if is_vintage:
-                return max(1.0 - (age_months * 0.005), 0.8) # Майже не втрачає в ціні
-            else:
-                # Новий товар, якому 1-2 роки, втрачає максимум 5-10% (через вихід нових моделей)
-                return max(1.0 - (age_months / lifespan_months) * 0.15, 0.85)
+    @classmethod
+    def _sealed_k_age(cls, age_months: int, lifespan_months: int) -> float:
+        """K_age для запечатаного товару (New Old Stock)."""
+        # Якщо це ще й вінтаж (дуже старий, але новий)
+        is_vintage = age_months >= (lifespan_months * cls.VINTAGE_MULTIPLIER_THRESHOLD)
+        if is_vintage:
+            return max(1.0 - (age_months * 0.005), 0.8) # Майже не втрачає в ціні
+        # Новий товар, якому 1-2 роки, втрачає максимум 5-10% (через вихід нових моделей)
+        return max(1.0 - (age_months / lifespan_months) * 0.15, 0.85)
 
-        # Динамічний розрахунок темпу старіння (half-life)
-        # Використовуємо формулу K = Floor + (1 - Floor) * e^(-k * t)
-        # Підбираємо k так, щоб на етапі lifespan_months ціна досягала Floor + 5%
+    @classmethod
+    def _decay_constant(cls, lifespan_months: int, brand_multiplier: float, floor: float) -> float:
+        """
+        Динамічний розрахунок темпу старіння (half-life).
+        Використовуємо формулу K = Floor + (1 - Floor) * e^(-k * t)
+        і підбираємо k так, щоб на етапі lifespan_months ціна досягала Floor + 5%.
+        """
         target_value = floor + 0.05
-        
+
         # ВЗАЄМОЗВ'ЯЗОК БРЕНДУ ТА ВІКУ:
         # Чим преміальніший бренд (brand_multiplier > 1.0), тим БІЛЬШИЙ у нього ефективний lifespan.
         # Apple (1.20) старіє на 20% повільніше. Ноунейм (0.75) старіє на 25% швидше.
@@ -55,11 +134,7 @@ class ValuationEngine:
             effective_lifespan = lifespan_months * brand_multiplier
 
         # 1 - d = exp(ln((target - floor) / (1 - floor)) / effective_lifespan)
-        k = -math.log((target_value - floor) / (1.0 - floor)) / effective_lifespan
-        
-        k_age = floor + (1.0 - floor) * math.exp(-k * age_months)
-
-        return max(k_age, floor)
+        return -math.log((target_value - floor) / (1.0 - floor)) / effective_lifespan
 
     @classmethod
     def calculate_price(
@@ -92,11 +167,218 @@ class ValuationEngine:
         # 3. Базова формула
         final_price = base_price * k_age * multipliers_product
 
-        # 4. Абсолютний захист (якщо брухт - дозволяємо впасти до 2%, інакше мінімум 10% від бази * k_urgent)
+        # 4. Абсолютний захист
+        return max(final_price, cls._min_possible_price(base_price, k_tech, k_urgent))
+
+    @staticmethod
+    def _min_possible_price(base_price: float, k_tech: float, k_urgent: float) -> float:
+        """Абсолютний захист: якщо брухт - дозволяємо впасти до 2%, інакше мінімум 10% від бази * k_urgent."""
         if k_tech < 0.5:
-            min_possible_price = base_price * 0.02
+            return base_price * 0.02
+        # Навіть якщо все погано, робоча річ не може коштувати менше 10% (з урахуванням терміновості)
+        return base_price * 0.10 * k_urgent
+
+    # --- Пакетний (векторний) розрахунок ---
+    # Приймає колонки значень: списки, кортежі, масиви NumPy або будь-які інші послідовності.
+    # Скалярне значення замість колонки застосовується до всіх рядків (напр. k_urgent=1.0).
+    # Колонки можна передати й одним словником: calculate_price_batch(**columns).
+    #
+    # Якщо встановлено NumPy (необов'язкова залежність), пакет рахується операціями над
+    # масивами: K_age для цілих віків вибирається з таблиць кешованих кривих одним
+    # індексуванням, решта — за формулою над масивом. Без NumPy — цикл по рядках.
+    # Для цілих віків у межах таблиці результати обох шляхів збігаються з calculate_k_age /
+    # calculate_price біт у біт; для решти — з точністю до останнього розряду exp().
+
+    @classmethod
+    def calculate_k_age_batch(
+        cls,
+        age_months: Union[Sequence[int], int],
+        lifespan_months: Union[Sequence[int], int],
+        is_sealed: Union[Sequence[bool], bool] = False,
+        brand_multiplier: Union[Sequence[float], float] = 1.0
+    ) -> List[float]:
+        """
+        Пакетний розрахунок K_age. Повертає список значень, ідентичних calculate_k_age
+        для кожного рядка. Крива старіння береться з кешу один раз на кожну
+        унікальну трійку (lifespan, brand, sealed), а не для кожного рядка.
+        """
+        size = cls._batch_size(age_months, lifespan_months, is_sealed, brand_multiplier)
+        if _load_numpy() is not None:
+            return cls._k_age_array(age_months, lifespan_months, is_sealed, brand_multiplier, size).tolist()
+
+        ages = cls._column(age_months, size)
+        lifespans = cls._column(lifespan_months, size)
+        sealed = cls._column(is_sealed, size)
+        brands = cls._column(brand_multiplier, size)
+
+        result = []
+        for age, lifespan, seal, brand in zip(ages, lifespans, sealed, brands):
+            if age <= 0:
+                result.append(1.0)
+                continue
+            if lifespan <= 0:
+                raise ValueError("lifespan_months повинен бути більше 0")
+
+            curve = cls.get_k_age_curve(lifespan, brand, seal)
+            if age < len(curve.table) and age == int(age):
+                result.append(curve.table[int(age)])
+            else:
+                result.append(cls._k_age_from_params(age, lifespan, seal, curve.floor, curve.decay_constant))
+        return result
+
+    @classmethod
+    def calculate_price_batch(
+        cls,
+        base_price: Union[Sequence[float], float],
+        age_months: Union[Sequence[int], int],
+        lifespan_months: Union[Sequence[int], int],
+        k_phys: Union[Sequence[float], float],
+        k_tech: Union[Sequence[float], float],
+        k_comp: Union[Sequence[float], float],
+        k_warn: Union[Sequence[float], float],
+        k_brand: Union[Sequence[float], float],
+        k_urgent: Union[Sequence[float], float],
+        phys_code: Union[Sequence[str], str] = "good",
+        k_age: Optional[Sequence[float]] = None
+    ) -> List[float]:
+        """
+        Пакетна версія calculate_price для переоцінки великих списків товарів.
+        Повертає список фінальних вартостей у тому ж порядку, що й вхідні рядки.
+        k_age — уже розраховані calculate_k_age_batch значення (щоб не рахувати їх двічі).
+        """
+        size = cls._batch_size(
+            base_price, age_months, lifespan_months, k_phys, k_tech,
+            k_comp, k_warn, k_brand, k_urgent, phys_code, *(() if k_age is None else (k_age,))
+        )
+        if _load_numpy() is not None:
+            return cls._price_array(
+                base_price, age_months, lifespan_months, k_phys, k_tech,
+                k_comp, k_warn, k_brand, k_urgent, phys_code, k_age, size
+            ).tolist()
+
+        base_prices = cls._column(base_price, size)
+        brands = cls._column(k_brand, size)
+        techs = cls._column(k_tech, size)
+        urgents = cls._column(k_urgent, size)
+
+        for i, price in enumerate(base_prices):
+            if price <= 0:
+                raise ValueError(f"base_price повинен бути більшим за 0 (рядок {i})")
+
+        if k_age is None:
+            k_age = cls.calculate_k_age_batch(
+                age_months, lifespan_months,
+                is_sealed=[code == "sealed" for code in cls._column(phys_code, size)],
+                brand_multiplier=brands
+            )
+
+        result = []
+        for price, age_k, phys, tech, comp, warn, brand, urgent in zip(
+            base_prices, k_age, cls._column(k_phys, size), techs,
+            cls._column(k_comp, size), cls._column(k_warn, size), brands, urgents
+        ):
+            final_price = price * age_k * (phys * tech * comp * warn * brand * urgent)
+            result.append(max(final_price, cls._min_possible_price(price, tech, urgent)))
+        return result
+
+    @classmethod
+    def _k_age_array(cls, age_months, lifespan_months, is_sealed, brand_multiplier, size: int) -> "np.ndarray":
+        """Векторний K_age (NumPy): індексування таблиць кривих + формула для решти віків."""
+        ages = cls._array(age_months, size, float)
+        lifespans = cls._array(lifespan_months, size, np.int64)
+        sealed = cls._array(is_sealed, size, bool)
+        brands = cls._array(brand_multiplier, size, float)
+
+        aged = ages > 0
+        if (aged & (lifespans <= 0)).any():
+            raise ValueError("lifespan_months повинен бути більше 0")
+
+        # Номер кривої рядка: унікальні lifespan і brand нумеруються окремо, а трійка
+        # (lifespan, brand, sealed) кодується одним цілим — без сортування рядків пакета
+        lifespan_values, lifespan_idx = cls._codes(lifespans)
+        brand_values, brand_idx = cls._codes(brands)
+        curve_idx = (lifespan_idx * len(brand_values) + brand_idx) * 2 + sealed
+
+        used = np.unique(curve_idx[aged])
+        tables = np.ones((len(lifespan_values) * len(brand_values) * 2, cls.CURVE_TABLE_MONTHS + 1))
+        floors = np.zeros(len(tables))
+        decay = np.zeros(len(tables))
+        for idx in used.tolist():
+            pair, seal = divmod(idx, 2)
+            lifespan_i, brand_i = divmod(pair, len(brand_values))
+            curve = cls.get_k_age_curve(int(lifespan_values[lifespan_i]), float(brand_values[brand_i]), bool(seal))
+            tables[idx] = curve.table
+            floors[idx] = curve.floor
+            decay[idx] = curve.decay_constant
+
+        whole = np.floor(ages)
+        in_table = (ages == whole) & (ages <= cls.CURVE_TABLE_MONTHS)
+        result = tables[curve_idx, np.where(in_table & aged, whole, 0).astype(np.int64)]
+
+        # Дробові віки та віки поза таблицею — за формулою _k_age_from_params над масивом
+        rest = np.flatnonzero(aged & ~in_table)
+        if rest.size:
+            age, lifespan = ages[rest], lifespans[rest]
+            floor, k = floors[curve_idx[rest]], decay[curve_idx[rest]]
+            regular = np.maximum(floor + (1.0 - floor) * np.exp(-k * age), floor)
+            vintage = age >= lifespan * cls.VINTAGE_MULTIPLIER_THRESHOLD
+            sealed_k = np.where(
+                vintage,
+                np.maximum(1.0 - (age * 0.005), 0.8),
+                np.maximum(1.0 - (age / lifespan) * 0.15, 0.85),
+            )
+            result[rest] = np.where(sealed[rest], sealed_k, regular)
+        return result
+
+    @classmethod
+    def _price_array(cls, base_price, age_months, lifespan_months, k_phys, k_tech, k_comp,
+                     k_warn, k_brand, k_urgent, phys_code, k_age, size: int) -> "np.ndarray":
+        """Векторна calculate_price (NumPy) з тим самим порядком множень, що й поштучна."""
+        prices = cls._array(base_price, size, float)
+        invalid = np.flatnonzero(prices <= 0)
+        if invalid.size:
+            raise ValueError(f"base_price повинен бути більшим за 0 (рядок {int(invalid[0])})")
+
+        brands = cls._array(k_brand, size, float)
+        techs = cls._array(k_tech, size, float)
+        urgents = cls._array(k_urgent, size, float)
+        if k_age is None:
+            sealed = cls._array(phys_code, size, object) == "sealed"
+            k_ages = cls._k_age_array(age_months, lifespan_months, sealed, brands, size)
         else:
-            # Навіть якщо все погано, робоча річ не може коштувати менше 10% (з урахуванням терміновості)
-            min_possible_price = base_price * 0.10 * k_urgent
-        
-        return max(final_price, min_possible_price)
+            k_ages = cls._array(k_age, size, float)
+
+        multipliers = (cls._array(k_phys, size, float) * techs * cls._array(k_comp, size, float)
+                       * cls._array(k_warn, size, float) * brands * urgents)
+        final_prices = prices * k_ages * multipliers
+        min_prices = np.where(techs < 0.5, prices * 0.02, prices * 0.10 * urgents)
+        return np.maximum(final_prices, min_prices)
+
+    @staticmethod
+    def _array(values, size: int, dtype) -> "np.ndarray":
+        """Колонка як масив NumPy довжини size (скаляр розширюється без копіювання)."""
+        return np.broadcast_to(np.asarray(values, dtype=dtype), (size,))
+
+    @staticmethod
+    def _codes(column: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        """Унікальні значення колонки та номер значення для кожного рядка."""
+        if column.strides == (0,):
+            # Скаляр, розширений _array: одне значення на весь пакет
+            return column[:1], np.broadcast_to(np.intp(0), column.shape)
+        values = np.unique(column)
+        return values, np.searchsorted(values, column)
+
+    @staticmethod
+    def _batch_size(*columns) -> int:
+        """Визначає кількість рядків пакета та перевіряє, що всі колонки однакової довжини."""
+        sizes = {len(col) for col in columns if not isinstance(col, (str, bytes)) and hasattr(col, "__len__")}
+        if len(sizes) > 1:
+            raise ValueError(f"Колонки пакета мають різну довжину: {sorted(sizes)}")
+        return sizes.pop() if sizes else 1
+
+    @staticmethod
+    def _column(values, size: int) -> Sequence:
+        """Повертає колонку як послідовність; скалярне значення розширюється до size рядків."""
+        if isinstance(values, (str, bytes)) or not hasattr(values, "__len__"):
+            return [values] * size
+        return values
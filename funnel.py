@@ -0,0 +1,234 @@
+import atexit
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Кроки воронки у порядку сценарію; код кроку — індекс у кортежі.
+# Коди зберігаються в БД, тому нові стани додаються лише в кінець.
+# "idle" — стан очищено (оцінку завершено, /start або /evaluate з нуля).
+# "failed" — розрахунок на останньому кроці завершився помилкою; обробник фіксує
+# його перед очищенням стану, тож така оцінка не рахується завершеною.
+FUNNEL_STEPS = (
+    "idle",
+    "choosing_category",
+    "entering_item_name",
+    "choosing_currency",
+    "entering_base_price",
+    "entering_age",
+    "choosing_phys",
+    "choosing_tech",
+    "choosing_comp",
+    "choosing_warn",
+    "choosing_brand",
+    "choosing_urgent",
+    "failed",
+)
+STEP_CODES = {name: code for code, name in enumerate(FUNNEL_STEPS)}
+IDLE = STEP_CODES["idle"]
+FIRST_STEP = STEP_CODES["choosing_category"]
+LAST_STEP = STEP_CODES["choosing_urgent"]
+FAILED = STEP_CODES["failed"]
+
+# Буфер скидається в БД, щойно набрано FLUSH_ROWS подій або минуло FLUSH_INTERVAL_SECONDS
+FLUSH_ROWS = 500
+FLUSH_INTERVAL_SECONDS = 1.0
+
+# Користувач вважається таким, що покинув оцінку, якщо після останнього кроку
+# минуло стільки часу без жодного переходу
+ABANDON_AFTER_SECONDS = 30 * 60
+
+# Події старші за RETENTION_SECONDS видаляються фоновим потоком раз на PRUNE_INTERVAL_SECONDS
+RETENTION_SECONDS = 90 * 24 * 3600
+PRUNE_INTERVAL_SECONDS = 3600
+
+def step_name(state: Optional[str]) -> str:
+    """'ValuationFSM:entering_age' -> 'entering_age'; None -> 'idle'."""
+    return state.rsplit(":", 1)[-1] if state else "idle"
+
+class FunnelRecorder:
+    """
+    Запис переходів між станами FSM у таблицю fsm_events.
+
+    record() лише додає подію до буфера в пам'яті (без звернень до БД),
+    а фоновий потік записує буфер пакетами однією транзакцією.
+    Події — телеметрія, тому при помилці запису пакет відкидається з записом у лог.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, flush_rows: int = FLUSH_ROWS, flush_interval: float = FLUSH_INTERVAL_SECONDS,
+                 retention: float = RETENTION_SECONDS):
+        self.db_path = db_path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self._buffer: List[tuple] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.flushed_rows = 0
+        self.dropped_rows = 0
+        self.pruned_rows = 0
+
+    def start(self) -> None:
+        """Запускає фоновий потік запису (повторний виклик нічого не робить)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="funnel-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def record(self, telegram_id: int, step: str, ts: Optional[float] = None) -> None:
+        """Додає перехід користувача на крок step до буфера."""
+        code = STEP_CODES.get(step)
+        if code is None:
+            return
+        if self._thread is None:
+            self.start()
+        with self._lock:
+            self._buffer.append((ts if ts is not None else time.time(), telegram_id, code))
+            pending = len(self._buffer)
+        if pending >= self.flush_rows:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Записує накопичені події в БД. Повертає кількість записаних подій."""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+        try:
+            with database.transaction(self.db_path) as conn:
+                conn.executemany("INSERT INTO fsm_events (ts, telegram_id, step) VALUES (?, ?, ?)", batch)
+        except Exception as e:
+            self.dropped_rows += len(batch)
+            logger.error(f"Не вдалося записати {len(batch)} подій воронки FSM: {e}")
+            return 0
+        self.flushed_rows += len(batch)
+        return len(batch)
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Видаляє події, старші за retention секунд. Повертає кількість видалених подій."""
+        cutoff = (now if now is not None else time.time()) - self.retention
+        try:
+            with database.transaction(self.db_path) as conn:
+                deleted = conn.execute("DELETE FROM fsm_events WHERE ts < ?", (cutoff,)).rowcount
+        except Exception as e:
+            logger.error(f"Не вдалося видалити застарілі події воронки FSM: {e}")
+            return 0
+        self.pruned_rows += deleted
+        if deleted:
+            logger.info(f"Видалено застарілих подій воронки FSM: {deleted}")
+        return deleted
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Дописує буфер та зупиняє фоновий потік."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+        if thread is None:
+            return
+        self._wakeup.set()
+        thread.join(timeout)
+        atexit.unregister(self.stop)
+
+    def _run(self) -> None:
+        next_prune = 0.0
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if self._stopping:
+                break
+            if time.monotonic() >= next_prune:
+                self.prune()
+                next_prune = time.monotonic() + PRUNE_INTERVAL_SECONDS
+        self.flush()
+        database.close_thread_connections()
+
+recorder = FunnelRecorder()
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """Перцентиль методом найближчого рангу."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def build_report(since: float, now: Optional[float] = None, db_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Звіт воронки за вікно [since, now]: для кожного кроку — кількість входів,
+    перцентилі часу перебування (p50/p90), повернення кнопкою «Назад» та відмови.
+
+    Читаються лише події вікна (діапазон по індексу idx_fsm_events_ts);
+    наступний перехід кожного користувача знаходить віконна функція LEAD.
+    Відмова на кроці — якщо після нього користувач ABANDON_AFTER_SECONDS нічого
+    не робив або почав оцінку заново (/evaluate). Оцінки, перервані помилкою
+    (крок failed), рахуються окремо і не входять до завершених.
+    """
+    now = now if now is not None else time.time()
+    rows = database.get_connection(db_path).execute("""
+        SELECT step, ts,
+               LEAD(step) OVER w AS next_step,
+               LEAD(ts) OVER w AS next_ts
+        FROM fsm_events
+        WHERE ts >= ? AND ts <= ?
+        WINDOW w AS (PARTITION BY telegram_id ORDER BY ts, id)
+    """, (since, now)).fetchall()
+
+    steps = {code: {"entered": 0, "dwell": [], "backs": 0, "abandoned": 0} for code in range(FIRST_STEP, LAST_STEP + 1)}
+    completed = failed = 0
+    for step, ts, next_step, next_ts in rows:
+        if step == IDLE or step == FAILED:
+            continue
+        stats = steps[step]
+        stats["entered"] += 1
+
+        if next_step is None:
+            if now - ts >= ABANDON_AFTER_SECONDS:
+                stats["abandoned"] += 1
+            continue
+
+        stats["dwell"].append(next_ts - ts)
+        if next_step == FAILED:
+            failed += 1
+        elif next_step == IDLE:
+            if step == LAST_STEP:
+                completed += 1
+            else:
+                stats["abandoned"] += 1
+        elif next_step == FIRST_STEP and step != FIRST_STEP:
+            stats["abandoned"] += 1
+        elif next_step < step:
+            stats["backs"] += 1
+
+    report_steps = []
+    for code, stats in steps.items():
+        dwell = sorted(stats["dwell"])
+        entered = stats["entered"]
+        report_steps.append({
+            "step": FUNNEL_STEPS[code],
+            "entered": entered,
+            "p50_s": _percentile(dwell, 0.5),
+            "p90_s": _percentile(dwell, 0.9),
+            "backs": stats["backs"],
+            "abandoned": stats["abandoned"],
+            "abandon_rate": stats["abandoned"] / entered if entered else 0.0,
+        })
+
+    return {
+        "since": since,
+        "now": now,
+        "events": len(rows),
+        "started": steps[FIRST_STEP]["entered"],
+        "completed": completed,
+        "failed": failed,
+        "steps": report_steps,
+    }
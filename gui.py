@@ -10,6 +10,8 @@ from PySide6.QtWidgets import (
 from PySide6.QtCore import QProcess, Qt
 import subprocess
 
+from startup_profile import READY_MARKER
+
 # Завантажуємо існуючий .env, якщо є
 ENV_PATH = Path(".env")
 load_dotenv(dotenv_path=ENV_PATH)
@@ -27,6 +29,8 @@ class BotControlPanel(QMainWindow):
         self.bot_process.started.connect(self.on_bot_started)
         self.bot_process.finished.connect(self.on_bot_finished)
         self.bot_process.errorOccurred.connect(self.on_bot_error)
+        # Кінець попереднього фрагмента виводу: маркер готовності може прийти розрізаним
+        self._stdout_tail = ""
         
         self.init_ui()
 
@@ -155,6 +159,11 @@ class BotControlPanel(QMainWindow):
         stdout = bytes(data).decode('utf-8', errors='replace')
         self.append_log(stdout.strip())
 
+        # Бот стає «Працює» лише після прогріву, коли в лозі з'являється маркер готовності
+        if READY_MARKER in self._stdout_tail + stdout:
+            self.on_bot_ready()
+        self._stdout_tail = stdout[-len(READY_MARKER):]
+
     def append_log(self, text):
         if text:
             self.log_area.appendPlainText(text)
@@ -168,13 +177,20 @@ class BotControlPanel(QMainWindow):
         QMessageBox.information(self, "Успіх", "Логи скопійовано в буфер обміну!")
 
     def on_bot_started(self):
-        self.status_indicator.setText("🟢 Працює")
-        self.status_indicator.setStyleSheet("color: green; font-weight: bold;")
+        # Процес запущено, але бот ще імпортує модулі та прогрівається — апдейти поки не обробляються
+        self._stdout_tail = ""
+        self.status_indicator.setText("🟡 Запуск...")
+        self.status_indicator.setStyleSheet("color: orange; font-weight: bold;")
         self.start_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
         self.token_input.setEnabled(False)
         self.save_token_btn.setEnabled(False)
-        self.append_log("Система: Процес бота успішно стартував.")
+        self.append_log("Система: Процес бота стартував, очікуємо завершення прогріву...")
+
+    def on_bot_ready(self):
+        self.status_indicator.setText("🟢 Працює")
+        self.status_indicator.setStyleSheet("color: green; font-weight: bold;")
+        self.append_log("Система: Бот прогрітий і обробляє повідомлення.")
 
     def on_bot_finished(self, exit_code, exit_status):
         self.status_indicator.setText("🔴 Зупинено")
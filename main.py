@@ -1,10 +1,24 @@
+# Перший імпорт: від нього відраховуються фази старту (python startup_profile.py — вартість імпортів)
+from startup_profile import first_update_middleware, timer as startup_timer
 import asyncio
 import logging
 import os
+import sys
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
 from bot.handlers import router
-from database import init_db
+from bot.fsm_storage import SQLiteStorage
+from bot.middlewares import setup_funnel, setup_metrics, setup_throttling
+from bot.outbound import setup_outbound
+from bot.warmup import emit_ready, warm_up
+from bot.webhook import run_webhook
+from database import init_db, set_pragma_profile
+import async_crud
+import metrics
+
+startup_timer.mark("imports")
 
 # Завантаження змінних оточення
 load_dotenv()
@@ -13,9 +27,25 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def create_fsm_storage() -> BaseStorage:
+    """
+    Сховище станів FSM за змінною FSM_STORAGE:
+    sqlite (за замовчуванням) — стани переживають перезапуск бота; memory — лише в пам'яті.
+    """
+    kind = os.getenv("FSM_STORAGE", "sqlite").lower()
+    if kind == "memory":
+        return MemoryStorage()
+    if kind != "sqlite":
+        logger.warning(f"Невідоме FSM_STORAGE={kind!r}, використовується sqlite")
+    storage = SQLiteStorage()
+    await storage.restore()
+    return storage
+
 async def main():
     # Перевірка та ініціалізація БД при старті
+    set_pragma_profile(os.getenv("DB_PROFILE", "performance"))
     init_db()
+    startup_timer.mark("init_db")
     
     # Отримання токена Telegram-бота
     token = os.getenv("BOT_TOKEN")
@@ -25,15 +55,63 @@ async def main():
 
     # Ініціалізація бота та диспетчера
     bot = Bot(token=token)
-    dp = Dispatcher()
+    # Вихідні запити розподіляються в межах лімітів Telegram, 429 повторюються
+    setup_outbound(bot, global_rate=float(os.getenv("OUTBOUND_GLOBAL_RATE", "30")), chat_rate=float(os.getenv("OUTBOUND_CHAT_RATE", "1")))
+    storage = await create_fsm_storage()
+    dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(first_update_middleware)
     
-    # Реєстрація роутерів
+    # Реєстрація роутерів, ліміту частоти подій, збору метрик обробників та журналу переходів FSM
+    setup_throttling(router, float(os.getenv("THROTTLE_RATE", "2")), int(os.getenv("THROTTLE_BURST", "5")))
+    setup_metrics(router)
+    setup_funnel(router)
     dp.include_router(router)
+
+    # Локальний HTTP-ендпоінт з метриками у форматі Prometheus (якщо задано порт)
+    metrics_runner = None
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        metrics_runner = await metrics.start_http_server(os.getenv("METRICS_HOST", "127.0.0.1"), int(metrics_port))
     
-    logger.info("Бот EVS успішно запущений та готовий до роботи.")
-    
-    # Запуск polling
-    await dp.start_polling(bot)
+    startup_timer.mark("setup")
+
+    try:
+        # Прогрів до прийому апдейтів: з'єднання з БД, довідники, клавіатури, шаблон чека, курси НБУ.
+        # Лише після нього — сигнал готовності (рядок у лозі для gui.py та GET /ready)
+        timings = await warm_up()
+        startup_timer.mark("warmup")
+        emit_ready(timings)
+
+        # Запуск у режимі BOT_MODE: polling (за замовчуванням) або webhook
+        if os.getenv("BOT_MODE", "polling").lower() == "webhook":
+            await run_webhook(
+                dp, bot,
+                url=os.environ["WEBHOOK_URL"],
+                host=os.getenv("WEBHOOK_HOST", "127.0.0.1"),
+                port=int(os.getenv("WEBHOOK_PORT", "8080")),
+                path=os.getenv("WEBHOOK_PATH", "/webhook"),
+                secret_token=os.getenv("WEBHOOK_SECRET") or None,
+                max_in_flight=int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "32")),
+                queue_size=int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000")),
+                drain_timeout=float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30")),
+            )
+        else:
+            # Після роботи у режимі webhook getUpdates недоступний, доки webhook не видалено
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        metrics.registry.set_gauge("evs_ready", 0)
+        # Дописуємо незбережені стани FSM до зупинки потоків БД
+        await storage.close()
+        # Дочікуємося незавершених запитів до БД перед виходом
+        async_crud.shutdown()
+        # Клієнт НБУ та рендеринг чеків імпортуються ліниво — закриваємо, лише якщо їх завантажено
+        if "bot.currency" in sys.modules:
+            await sys.modules["bot.currency"].close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        if "bot.receipt" in sys.modules:
+            sys.modules["bot.receipt"].shutdown()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,228 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Межі кошиків гістограм затримки (у секундах), як у клієнтах Prometheus
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Опис метрик для експорту: ім'я -> (тип, довідка)
+METRICS_HELP: Dict[str, Tuple[str, str]] = {
+    "evs_handler_calls_total": ("counter", "Кількість викликів обробників aiogram"),
+    "evs_handler_errors_total": ("counter", "Кількість винятків в обробниках aiogram"),
+    "evs_handler_latency_seconds": ("histogram", "Тривалість виконання обробників"),
+    "evs_span_latency_seconds": ("histogram", "Тривалість підзапитів (БД, НБУ, рендеринг)"),
+    "evs_span_errors_total": ("counter", "Кількість винятків у підзапитах"),
+    "evs_fsm_storage_cache_total": ("counter", "Звернення до кешу станів FSM (result=hit|miss)"),
+    "evs_fsm_storage_flushes_total": ("counter", "Кількість пакетних записів станів FSM у БД"),
+    "evs_fsm_storage_rows_total": ("counter", "Кількість ключів FSM, записаних у БД"),
+    "evs_webhook_requests_total": ("counter", "Запити webhook (result=accepted|rejected|invalid|unauthorized)"),
+    "evs_webhook_queue_depth": ("gauge", "Апдейти webhook, що чекають у черзі"),
+    "evs_webhook_in_flight": ("gauge", "Апдейти webhook, що обробляються зараз"),
+    "evs_webhook_queue_wait_seconds": ("histogram", "Час очікування апдейту webhook у черзі"),
+    "evs_throttle_dropped_total": ("counter", "Події, відкинуті лімітом частоти (event=message|callback_query)"),
+    "evs_throttle_active_users": ("gauge", "Користувачі з активним відром ліміту частоти"),
+    "evs_outbound_wait_seconds": ("histogram", "Очікування слоту вихідним запитом до Telegram (ліміти чату та бота)"),
+    "evs_outbound_waiting": ("gauge", "Вихідні запити до Telegram, що чекають слоту"),
+    "evs_outbound_coalesced_total": ("counter", "Редагування, замінені новішим редагуванням того ж повідомлення"),
+    "evs_outbound_retries_total": ("counter", "Повтори вихідних запитів після 429 retry_after"),
+    "evs_startup_seconds": ("gauge", "Тривалість фаз старту бота (phase=imports|init_db|...|first_update)"),
+    "evs_warmup_seconds": ("gauge", "Тривалість кроків прогріву перед прийомом апдейтів (step=db|catalog|...)"),
+    "evs_ready": ("gauge", "1 — прогрів завершено і бот приймає апдейти"),
+    "evs_receipt_cache_total": ("counter", "Кеш чеків (event=file_id_hits|disk_hits|misses|evictions)"),
+    "evs_receipt_cache_entries": ("gauge", "Кількість PNG-чеків у дисковому кеші"),
+    "evs_receipt_cache_bytes": ("gauge", "Розмір дискового кешу чеків у байтах"),
+    "evs_keyboard_rebuilds_total": ("counter", "Перебудови реєстру інлайн-клавіатур (при зміні довідників)"),
+    "evs_keyboard_catalog_version": ("gauge", "Версія довідників, для якої побудовано клавіатури"),
+    "evs_keyboard_build_seconds": ("gauge", "Час останньої побудови клавіатури (keyboard=categories|factor:phys|...)"),
+}
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Кумулятивна гістограма з фіксованими межами кошиків."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # останній кошик — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оцінка квантиля за верхньою межею кошика (як histogram_quantile без інтерполяції)."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class MetricsRegistry:
+    """Потокобезпечне сховище лічильників, гістограм та показників (gauge) процесу."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelsKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelsKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelsKey, Histogram]] = {}
+
+    @staticmethod
+    def _key(labels: Optional[Dict[str, str]]) -> LabelsKey:
+        return tuple(sorted((labels or {}).items()))
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            self._gauges.setdefault(name, {})[self._key(labels)] = value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def counter_value(self, name: str, labels: Optional[Dict[str, str]] = None) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(self._key(labels), 0)
+
+    def gauge_value(self, name: str, labels: Optional[Dict[str, str]] = None) -> Optional[float]:
+        with self._lock:
+            return self._gauges.get(name, {}).get(self._key(labels))
+
+    def histogram(self, name: str, labels: Optional[Dict[str, str]] = None) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(self._key(labels))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self) -> str:
+        """Усі метрики у текстовому форматі експозиції Prometheus."""
+        lines: List[str] = []
+
+        def header(name: str, default_type: str) -> None:
+            metric_type, help_text = METRICS_HELP.get(name, (default_type, name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                header(name, "counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for name, series in sorted(self._gauges.items()):
+                header(name, "gauge")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for name, series in sorted(self._histograms.items()):
+                header(name, "histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum!r}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def handler_summary(self) -> List[Dict[str, Any]]:
+        """Зведення по обробниках для команди /stats (відсортовано за кількістю викликів)."""
+        return self._latency_summary("evs_handler_latency_seconds", "evs_handler_errors_total", "handler")
+
+    def span_summary(self) -> List[Dict[str, Any]]:
+        """Зведення по підзапитах (db, nbu, render) для команди /stats."""
+        return self._latency_summary("evs_span_latency_seconds", "evs_span_errors_total", "span")
+
+    def _latency_summary(self, histogram_name: str, errors_name: str, label: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            errors = dict(self._counters.get(errors_name, {}))
+            latencies = dict(self._histograms.get(histogram_name, {}))
+
+        rows = []
+        for key, histogram in latencies.items():
+            rows.append({
+                label: dict(key).get(label, "?"),
+                "calls": histogram.count,
+                "errors": int(errors.get(key, 0)),
+                "avg_ms": histogram.sum / histogram.count * 1000 if histogram.count else 0.0,
+                "p95_ms": histogram.quantile(0.95) * 1000,
+            })
+        return sorted(rows, key=lambda row: row["calls"], reverse=True)
+
+def _format_labels(key: LabelsKey) -> str:
+    if not key:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for name, value in key)
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+registry = MetricsRegistry()
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Вимірює тривалість підзапиту (БД, НБУ, рендеринг) у гістограмі evs_span_latency_seconds.
+    Працює і навколо await: with metrics.span("db"): await async_crud.get_valuation(...)
+    Скасування (CancelledError) та KeyboardInterrupt не рахуються помилками, але тривалість пишеться.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.inc("evs_span_errors_total", {"span": name})
+        raise
+    finally:
+        registry.observe("evs_span_latency_seconds", time.perf_counter() - start, {"span": name})
+
+async def start_http_server(host: str = "127.0.0.1", port: int = 9108):
+    """
+    Запускає локальний HTTP-сервер з метриками Prometheus (GET /metrics) та
+    перевіркою готовності (GET /ready: 200 після прогріву бота, інакше 503).
+    Повертає aiohttp AppRunner; для зупинки викличте await runner.cleanup().
+    """
+    from aiohttp import web
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    async def handle_ready(request: web.Request) -> web.Response:
+        ready = registry.gauge_value("evs_ready") == 1
+        return web.Response(status=200 if ready else 503, text="ready" if ready else "warming up")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/ready", handle_ready)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики Prometheus доступні на http://{host}:{port}/metrics")
+    return runner
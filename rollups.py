@@ -0,0 +1,193 @@
+"""
+Агрегати оцінок для аналітики (таблиці valuation_rollups, valuation_price_buckets,
+valuation_factor_rollups) у розрізі день × категорія × валюта.
+
+record() викликається з crud.insert_valuation у тій самій транзакції, що й вставка
+оцінки, тож агрегати завжди узгоджені з таблицею valuations. Звіти читають лише
+агрегати: O(днів × категорій) рядків незалежно від кількості оцінок.
+
+Одноразове заповнення агрегатів для наявних оцінок (краще при зупиненому боті,
+бо на час перерахунку запис оцінок блокується):
+    python rollups.py --backfill
+"""
+import argparse
+import datetime
+import logging
+import math
+import sqlite3
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import database
+import snapshot_codec
+
+logger = logging.getLogger(__name__)
+
+# Гістограма фінальних цін у логарифмічній шкалі: 4 кошики на порядок
+# (1000–1778, 1778–3162, 3162–5623, 5623–10000, ...)
+BUCKETS_PER_DECADE = 4
+
+FACTORS = snapshot_codec.FACTORS
+
+def price_bucket(price: float) -> int:
+    """Номер кошика гістограми для ціни (ціни <= 1 потрапляють у кошик 0)."""
+    return int(math.floor(math.log10(price) * BUCKETS_PER_DECADE)) if price > 1 else 0
+
+def bucket_bounds(bucket: int) -> tuple:
+    """Межі [нижня, верхня) ціни для кошика гістограми."""
+    return 10 ** (bucket / BUCKETS_PER_DECADE), 10 ** ((bucket + 1) / BUCKETS_PER_DECADE)
+
+def record(conn: sqlite3.Connection, category_id: int, currency_code: str, base_price: float,
+           final_price: float, snapshot: Dict[str, Any], day: Optional[str] = None) -> None:
+    """
+    Додає оцінку до агрегатів у межах уже відкритої транзакції (без commit).
+    day — дата у форматі YYYY-MM-DD (UTC); за замовчуванням — поточна, як у valuations.created_at.
+    """
+    day = day or datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d")
+    conn.execute("""
+        INSERT INTO valuation_rollups (day, category_id, currency_code, count, sum_base_price, sum_final_price)
+        VALUES (?, ?, ?, 1, ?, ?)
+        ON CONFLICT (day, category_id, currency_code) DO UPDATE SET
+            count = count + 1,
+            sum_base_price = sum_base_price + excluded.sum_base_price,
+            sum_final_price = sum_final_price + excluded.sum_final_price
+    """, (day, category_id, currency_code, base_price, final_price))
+    conn.execute("""
+        INSERT INTO valuation_price_buckets (day, category_id, currency_code, bucket, count)
+        VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT (day, category_id, currency_code, bucket) DO UPDATE SET count = count + 1
+    """, (day, category_id, currency_code, price_bucket(final_price)))
+    factor_rows = [(day, category_id, currency_code, factor, snapshot[f"{factor}_code"])
+                   for factor in FACTORS if snapshot.get(f"{factor}_code")]
+    if factor_rows:
+        conn.executemany("""
+            INSERT INTO valuation_factor_rollups (day, category_id, currency_code, factor_type, code, count)
+            VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT (day, category_id, currency_code, factor_type, code) DO UPDATE SET count = count + 1
+        """, factor_rows)
+
+def backfill(db_path: Optional[str] = None) -> int:
+    """
+    Перераховує всі агрегати з таблиці valuations (одноразово, після оновлення).
+    Агрегати накопичуються в пам'яті (їх O(днів × категорій)) і записуються однією транзакцією.
+    Повертає кількість врахованих оцінок.
+    """
+    totals: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+    buckets: Dict[tuple, int] = defaultdict(int)
+    factors: Dict[tuple, int] = defaultdict(int)
+    processed = 0
+
+    with database.transaction(db_path) as conn:
+        # Спершу очищаємо агрегати: це бере блокування запису, тож нові оцінки
+        # не потраплять у вже прочитану частину таблиці
+        for table in ("valuation_rollups", "valuation_price_buckets", "valuation_factor_rollups"):
+            conn.execute(f"DELETE FROM {table}")
+
+        cursor = conn.execute("""
+            SELECT date(created_at) AS day, category_id, currency_code, base_price, final_price, snapshot, snapshot_json
+            FROM valuations
+        """)
+        for row in cursor:
+            key = (row["day"], row["category_id"], row["currency_code"])
+            total = totals[key]
+            total[0] += 1
+            total[1] += row["base_price"]
+            total[2] += row["final_price"]
+            buckets[key + (price_bucket(row["final_price"]),)] += 1
+
+            snapshot = snapshot_codec.load_snapshot(dict(row))
+            for factor in FACTORS:
+                code = snapshot.get(f"{factor}_code")
+                if code:
+                    factors[key + (factor, code)] += 1
+            processed += 1
+
+        conn.executemany(
+            "INSERT INTO valuation_rollups (day, category_id, currency_code, count, sum_base_price, sum_final_price) VALUES (?, ?, ?, ?, ?, ?)",
+            (key + tuple(total) for key, total in totals.items())
+        )
+        conn.executemany(
+            "INSERT INTO valuation_price_buckets (day, category_id, currency_code, bucket, count) VALUES (?, ?, ?, ?, ?)",
+            (key + (count,) for key, count in buckets.items())
+        )
+        conn.executemany(
+            "INSERT INTO valuation_factor_rollups (day, category_id, currency_code, factor_type, code, count) VALUES (?, ?, ?, ?, ?, ?)",
+            (key + (count,) for key, count in factors.items())
+        )
+
+    logger.info(f"Агрегати перераховано: {processed} оцінок, {len(totals)} рядків день × категорія × валюта.")
+    return processed
+
+def _median_from_buckets(bucket_counts: Dict[int, int]) -> float:
+    """Оцінка медіани за гістограмою (середина кошика в логарифмічній шкалі)."""
+    total = sum(bucket_counts.values())
+    seen = 0
+    for bucket in sorted(bucket_counts):
+        seen += bucket_counts[bucket]
+        if seen * 2 >= total:
+            low, high = bucket_bounds(bucket)
+            return math.sqrt(low * high)
+    return 0.0
+
+def report(since_day: str, db_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Зведення з агрегатів з дня since_day (YYYY-MM-DD) по категоріях і валютах:
+    кількість, середні ціни, медіана фінальної ціни за гістограмою та частка
+    термінових продажів (urgent != normal). Таблиця valuations не читається.
+    """
+    conn = database.get_connection(db_path)
+    rows = conn.execute("""
+        SELECT category_id, currency_code, SUM(count) AS count,
+               SUM(sum_base_price) AS sum_base_price, SUM(sum_final_price) AS sum_final_price
+        FROM valuation_rollups WHERE day >= ?
+        GROUP BY category_id, currency_code
+        ORDER BY count DESC
+    """, (since_day,)).fetchall()
+
+    bucket_counts: Dict[tuple, Dict[int, int]] = defaultdict(dict)
+    for row in conn.execute("""
+        SELECT category_id, currency_code, bucket, SUM(count) AS count
+        FROM valuation_price_buckets WHERE day >= ?
+        GROUP BY category_id, currency_code, bucket
+    """, (since_day,)):
+        bucket_counts[(row["category_id"], row["currency_code"])][row["bucket"]] = row["count"]
+
+    urgent: Dict[tuple, List[int]] = {}
+    for row in conn.execute("""
+        SELECT category_id, currency_code, SUM(count) AS total,
+               SUM(CASE WHEN code != 'normal' THEN count ELSE 0 END) AS urgent
+        FROM valuation_factor_rollups WHERE day >= ? AND factor_type = 'urgent'
+        GROUP BY category_id, currency_code
+    """, (since_day,)):
+        urgent[(row["category_id"], row["currency_code"])] = [row["urgent"], row["total"]]
+
+    result = []
+    for row in rows:
+        urgent_count, urgent_total = urgent.get((row["category_id"], row["currency_code"]), (0, 0))
+        result.append({
+            "category_id": row["category_id"],
+            "currency_code": row["currency_code"],
+            "count": row["count"],
+            "avg_base_price": row["sum_base_price"] / row["count"],
+            "avg_final_price": row["sum_final_price"] / row["count"],
+            "median_final_price": _median_from_buckets(bucket_counts[(row["category_id"], row["currency_code"])]),
+            "urgent_share": urgent_count / urgent_total if urgent_total else 0.0,
+        })
+    return result
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backfill", action="store_true", help="перерахувати агрегати з усіх наявних оцінок")
+    parser.add_argument("--db", default=database.DB_PATH, help="шлях до БД")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    database.DB_PATH = args.db
+    database.init_db(args.db)
+    if args.backfill:
+        backfill()
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import json
+import zlib
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+if TYPE_CHECKING:
+    from catalog import Catalog
+
+# Компактний формат знімка оцінки (valuations.snapshot).
+#
+# Замість повного state.get_data() з усіма українськими назвами зберігаються
+# лише коди та числа: id категорії, коди коефіцієнтів з множниками на момент
+# оцінки, ціна, вік тощо. Назви категорії та коефіцієнтів підставляються
+# з довідника (catalog) під час читання.
+#
+# Байт 0 — версія формату, байт 1 — спосіб кодування тіла (ENCODING_*).
+# Тіло — компактний JSON, за потреби стиснутий zlib зі словником ZDICT
+# (короткі знімки стискаються лише завдяки спільному словнику).
+# Зміна ключів, порядку FACTORS або ZDICT вимагає нової версії формату.
+FORMAT_VERSION = 1
+ENCODING_JSON = 0
+ENCODING_ZLIB = 1
+
+FACTORS = ("phys", "tech", "comp", "warn", "brand", "urgent")
+
+# Скорочені ключі для простих полів знімка
+FIELD_KEYS = {
+    "category_id": "c",
+    "lifespan_months": "l",
+    "currency": "$",
+    "base_price": "b",
+    "age_months": "a",
+    "age_multiplier": "k",
+    "user_report_num": "r",
+}
+
+ZDICT = (
+    b'"x":{"pending_age_num":'
+    b'["not_applicable",1.0],["budget",0.75],["mid",0.9],["premium",1.0],["apple",1.15],'
+    b'["none",0.95],["valid",1.1],["device_only",0.8],["partial",0.9],'
+    b'["broken",0.3],["partial_defect",0.6],["minor_issues",0.85],'
+    b'["poor",0.5],["fair",0.7],["sealed",1.2],["now",0.7],["fast",0.85],["normal",1.0]'
+    b'"$":"USD","$":"EUR","$":"UAH","b":"a":"k":0."r":"i":0,'
+    b'"f":[["good",0.85],["perfect",1.0],["full",1.0],["expired",1.0],'
+    b'{"c":1,"l":60,"l":120,"l":84,"l":180,"l":240,"l":360,"i":"'
+)
+
+class SnapshotFormatError(ValueError):
+    """Знімок пошкоджено або записано невідомою версією формату."""
+
+def encode(snapshot: Dict[str, Any]) -> bytes:
+    """Кодує знімок оцінки у компактний версіонований BLOB (назви з довідника відкидаються)."""
+    payload: Dict[str, Any] = {}
+    for field, key in FIELD_KEYS.items():
+        if field in snapshot:
+            payload[key] = snapshot[field]
+
+    if "item_name" in snapshot:
+        # Назва предмета зберігається як є, навіть якщо збігається з назвою категорії
+        payload["i"] = snapshot["item_name"]
+
+    factors = []
+    for factor in FACTORS:
+        code = snapshot.get(f"{factor}_code")
+        factors.append(None if code is None else [code, snapshot.get(f"{factor}_multiplier")])
+    if any(factors):
+        payload["f"] = factors
+
+    known = set(FIELD_KEYS) | {"item_name", "category_name"}
+    known.update(f"{factor}_{suffix}" for factor in FACTORS for suffix in ("code", "multiplier", "name"))
+    extra = {key: value for key, value in snapshot.items() if key not in known}
+    if extra:
+        payload["x"] = extra
+
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=ZDICT)
+    compressed = compressor.compress(body) + compressor.flush()
+    if len(compressed) < len(body):
+        return bytes((FORMAT_VERSION, ENCODING_ZLIB)) + compressed
+    return bytes((FORMAT_VERSION, ENCODING_JSON)) + body
+
+def decode(blob: bytes, catalog: Optional["Catalog"] = None) -> Dict[str, Any]:
+    """
+    Відновлює знімок у вигляді, у якому його зберігав обробник (ключі *_code, *_name тощо).
+    Назви беруться з catalog; якщо код зник з довідника, замість назви повертається код.
+    """
+    if len(blob) < 2 or blob[0] != FORMAT_VERSION:
+        raise SnapshotFormatError(f"Невідома версія формату знімка: {blob[:1]!r}")
+    body = blob[2:]
+    try:
+        if blob[1] == ENCODING_ZLIB:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=ZDICT)
+            body = decompressor.decompress(body) + decompressor.flush()
+        elif blob[1] != ENCODING_JSON:
+            raise SnapshotFormatError(f"Невідоме кодування знімка: {blob[1]}")
+        payload = json.loads(body)
+    except (zlib.error, ValueError) as e:
+        raise SnapshotFormatError(f"Пошкоджений знімок оцінки: {e}") from e
+
+    snapshot: Dict[str, Any] = {}
+    for field, key in FIELD_KEYS.items():
+        if key in payload:
+            snapshot[field] = payload[key]
+
+    category_id = payload.get("c")
+    category = catalog.categories_by_id.get(category_id) if catalog is not None else None
+    if category is not None:
+        snapshot["category_name"] = category["name_ua"]
+
+    if "i" in payload:
+        snapshot["item_name"] = payload["i"]
+
+    for factor, entry in zip(FACTORS, payload.get("f") or ()):
+        if entry is None:
+            continue
+        code, multiplier = entry
+        coeff = catalog.coefficients_by_code.get((factor, code)) if catalog is not None else None
+        snapshot[f"{factor}_code"] = code
+        snapshot[f"{factor}_multiplier"] = multiplier
+        snapshot[f"{factor}_name"] = coeff["name_ua"] if coeff is not None else code
+
+    snapshot.update(payload.get("x", {}))
+    return snapshot
+
+def load_snapshot(valuation: Dict[str, Any], catalog: Optional["Catalog"] = None) -> Dict[str, Any]:
+    """
+    Знімок з рядка valuations: компактний BLOB, а для рядків без нього (NULL — ще не мігровано,
+    порожній — міграція не змогла розібрати snapshot_json) — snapshot_json.
+    """
+    if valuation.get("snapshot"):
+        return decode(valuation["snapshot"], catalog)
+    return json.loads(valuation["snapshot_json"] or "{}")
+
+def encode_legacy_json(snapshot_json: Optional[str]) -> Optional[bytes]:
+    """
+    SQL-функція міграції: snapshot_json -> компактний BLOB. None для порожніх і пошкоджених
+    рядків — вони пропускаються поштучно, не зриваючи міграцію всієї таблиці.
+    """
+    if not snapshot_json:
+        return None
+    try:
+        snapshot = json.loads(snapshot_json)
+        if not isinstance(snapshot, dict):
+            return None
+        return encode(snapshot)
+    except (TypeError, ValueError):
+        return None
+
+def matches_legacy_json(blob: bytes, snapshot_json: str) -> bool:
+    """Чи розкодовується BLOB у ті самі дані, що й snapshot_json (назви з довідника не порівнюються)."""
+    def without_names(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in snapshot.items() if key == "item_name" or not key.endswith("_name")}
+    try:
+        return without_names(decode(blob)) == without_names(json.loads(snapshot_json))
+    except (SnapshotFormatError, TypeError, ValueError, AttributeError):
+        return False
@@ -0,0 +1,183 @@
+"""
+Профілювання холодного старту бота.
+
+1. Вартість імпортів: модуль імпортується в окремому процесі з `-X importtime`,
+   а звіт зводиться по пакетах верхнього рівня та найдорожчих модулях:
+       python startup_profile.py [--module main] [--top 15]
+
+2. Регресійна перевірка (для CI / перед деплоєм; її ж виконує
+   tests/test_startup_profile.py): код виходу 1, якщо
+   - сумарний час імпорту перевищує бюджет (IMPORT_BUDGET_MS, змінна
+     STARTUP_IMPORT_BUDGET_MS або --budget-ms);
+   - власні модулі проєкту займають більшу частку часу імпорту, ніж
+     OWN_IMPORT_SHARE (відносний бюджет, не залежить від швидкості машини);
+   - при старті завантажено модуль, що має імпортуватися ліниво (LAZY_MODULES):
+       python startup_profile.py --budget-ms 8000
+   STARTUP_IMPORT_BUDGET_MS і STARTUP_OWN_IMPORT_SHARE — змінні оточення процесу тестів/CI,
+   а не налаштування бота: .env тут не читається, тож задавати їх там марно:
+       STARTUP_IMPORT_BUDGET_MS=15000 python -m pytest tests/test_startup_profile.py
+
+3. Фази старту в самому боті (імпорти, БД, довідники, ..., перший апдейт) фіксує
+   timer: main.py позначає фази, а first_update_middleware — перший оброблений
+   апдейт. Підсумок пишеться в лог і в метрику evs_startup_seconds{phase}.
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Рядок у лозі, яким бот повідомляє про готовність після прогріву (його чекає gui.py)
+READY_MARKER = "EVS_READY"
+
+# Модулі, які не повинні завантажуватися під час старту бота (див. bot/receipt_cache.py,
+# bot/handlers.py, engine.py)
+LAZY_MODULES = ("PIL", "bot.receipt", "bot.currency", "numpy")
+
+# Бюджет сумарного часу імпорту main (мс). Майже весь час — aiogram, тож бюджет
+# із запасом; на повільних машинах CI його можна підняти змінною оточення
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "10000"))
+# Максимальна частка власного часу імпорту модулів проєкту (зараз близько 1%)
+OWN_IMPORT_SHARE = float(os.getenv("STARTUP_OWN_IMPORT_SHARE", "0.05"))
+
+class ImportRecord(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+def parse_importtime(stderr: str) -> List[ImportRecord]:
+    """Розбирає рядки `import time: self | cumulative | module` з виводу `-X importtime`."""
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            records.append(ImportRecord(
+                module=name.strip(), self_us=int(self_us), cumulative_us=int(cumulative_us),
+                depth=(len(name) - len(name.lstrip()) - 1) // 2,
+            ))
+        except ValueError:
+            continue # рядок-заголовок "self [us] | cumulative | imported package"
+    return records
+
+def profile_imports(module: str = "main") -> List[ImportRecord]:
+    """Імпортує module в окремому процесі з -X importtime (холодний старт інтерпретатора)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    return parse_importtime(result.stderr)
+
+def summarize(records: List[ImportRecord], top: int = 15) -> Dict[str, Any]:
+    """Сумарний час, власний час по пакетах верхнього рівня та найдорожчі модулі (за власним часом)."""
+    by_package: Dict[str, int] = defaultdict(int)
+    for record in records:
+        by_package[record.module.split(".")[0]] += record.self_us
+    return {
+        "total_us": sum(record.self_us for record in records),
+        "modules": len(records),
+        "packages": sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top],
+        "slowest": sorted(records, key=lambda record: record.self_us, reverse=True)[:top],
+    }
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    lines = [f"Імпорт: {summary['total_us'] / 1000:.0f} мс, модулів: {summary['modules']}", "", "Пакети (власний час):"]
+    lines += [f"  {package:30} {us / 1000:8.1f} мс" for package, us in summary["packages"]]
+    lines += ["", "Найдорожчі модулі (власний / сумарний час):"]
+    lines += [f"  {r.module:45} {r.self_us / 1000:8.1f} / {r.cumulative_us / 1000:8.1f} мс" for r in summary["slowest"]]
+    return "\n".join(lines)
+
+def project_modules() -> set:
+    """Імена модулів і пакетів верхнього рівня цього проєкту (поруч із startup_profile.py)."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    names = set()
+    for entry in os.scandir(root):
+        if entry.is_file() and entry.name.endswith(".py"):
+            names.add(entry.name[:-3])
+        elif entry.is_dir() and os.path.exists(os.path.join(entry.path, "__init__.py")):
+            names.add(entry.name)
+    return names
+
+def check(records: List[ImportRecord], budget_ms: Optional[float] = None,
+          lazy_modules: tuple = LAZY_MODULES, max_own_share: Optional[float] = None) -> List[str]:
+    """Порушення бюджету холодного старту (порожній список — перевірку пройдено)."""
+    problems = []
+    imported = {record.module for record in records}
+    for module in lazy_modules:
+        if module in imported:
+            problems.append(f"{module} імпортується під час старту, хоча має завантажуватися ліниво")
+    total_us = sum(record.self_us for record in records)
+    total_ms = total_us / 1000
+    if budget_ms is not None and total_ms > budget_ms:
+        problems.append(f"Імпорт триває {total_ms:.0f} мс при бюджеті {budget_ms:.0f} мс")
+    if max_own_share is not None and total_us:
+        own = project_modules()
+        own_us = sum(record.self_us for record in records if record.module.split(".")[0] in own)
+        if own_us / total_us > max_own_share:
+            problems.append(f"Модулі проєкту займають {own_us / total_us:.1%} часу імпорту "
+                            f"({own_us / 1000:.0f} мс) при бюджеті {max_own_share:.0%}")
+    return problems
+
+class StartupTimer:
+    """Тривалість фаз старту від імпорту цього модуля (першого рядка main.py) до першого апдейту."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases: Dict[str, float] = {}
+        self.first_update: Optional[float] = None
+
+    def mark(self, phase: str) -> None:
+        """Завершує фазу phase (від попередньої позначки до зараз)."""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+        self._export(phase, self.phases[phase])
+
+    def mark_first_update(self) -> bool:
+        """Фіксує перший апдейт; True лише для першого виклику."""
+        if self.first_update is not None:
+            return False
+        self.first_update = time.perf_counter() - self.started
+        self._export("first_update", self.first_update)
+        phases = ", ".join(f"{phase} {seconds:.2f} с" for phase, seconds in self.phases.items())
+        logger.info(f"Перший апдейт через {self.first_update:.2f} с після старту ({phases})")
+        return True
+
+    @staticmethod
+    def _export(phase: str, seconds: float) -> None:
+        import metrics
+        metrics.registry.set_gauge("evs_startup_seconds", seconds, {"phase": phase})
+
+timer = StartupTimer()
+
+async def first_update_middleware(handler: Callable[..., Awaitable[Any]], event: Any, data: Dict[str, Any]) -> Any:
+    """Outer-middleware dp.update: фіксує час до першого апдейту (далі — одна перевірка на апдейт)."""
+    timer.mark_first_update()
+    return await handler(event, data)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="модуль, старт якого профілюється")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS, help="допустимий сумарний час імпорту")
+    parser.add_argument("--max-own-share", type=float, default=OWN_IMPORT_SHARE,
+                        help="допустима частка часу імпорту модулів проєкту")
+    args = parser.parse_args()
+
+    records = profile_imports(args.module)
+    print(format_summary(summarize(records, args.top)))
+    problems = check(records, args.budget_ms, max_own_share=args.max_own_share)
+    for problem in problems:
+        print(f"ПОМИЛКА: {problem}", file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+
+import catalog
+import database
+
+class TempDBMixin:
+    """
+    Окрема БД у тимчасовій теці на кожен тест: init_db (+ seed_db, якщо SEED),
+    database.DB_PATH вказує на неї до кінця тесту. Підкласи, що перевизначають
+    setUp/tearDown, викликають super(); власні ресурси звільняють до super().tearDown().
+    """
+
+    SEED = True
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "test.db")
+        database.init_db(self.db_path)
+        if self.SEED:
+            database.seed_db(self.db_path)
+        self._orig_db_path = database.DB_PATH
+        database.DB_PATH = self.db_path
+
+    def tearDown(self):
+        # Кеш довідника прочитано з тимчасової БД — наступний тест перечитає його зі своєї
+        catalog.invalidate()
+        database.close_connections()
+        database.DB_PATH = self._orig_db_path
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+class TempDBTestCase(TempDBMixin, unittest.TestCase):
+    pass
+
+class AsyncTempDBTestCase(TempDBMixin, unittest.IsolatedAsyncioTestCase):
+    pass
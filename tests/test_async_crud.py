@@ -0,0 +1,61 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import unittest
+
+import async_crud
+from helpers import AsyncTempDBTestCase
+
+class TestAsyncCrud(AsyncTempDBTestCase):
+
+    def tearDown(self):
+        async_crud.shutdown()
+        super().tearDown()
+
+    async def test_round_trip(self):
+        user_id = await async_crud.get_or_create_user(1, "tester")
+        val_id, report_num = await async_crud.save_valuation(user_id, 1, 1000.0, "UAH", 250.0, {})
+        self.assertEqual(report_num, 1)
+        valuation = await async_crud.get_valuation(val_id)
+        self.assertEqual(valuation["user_id"], user_id)
+
+    async def test_event_loop_not_blocked_by_locked_db(self):
+        user_id = await async_crud.get_or_create_user(1, "tester")
+
+        # Стороннє з'єднання тримає блокування на запис 0.5 с
+        lock_held = threading.Event()
+        def hold_write_lock():
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("BEGIN IMMEDIATE")
+            lock_held.set()
+            time.sleep(0.5)
+            conn.rollback()
+            conn.close()
+        locker = threading.Thread(target=hold_write_lock)
+        locker.start()
+        lock_held.wait()
+
+        # Поки записи чекають на блокування, вимірюємо затримку циклу подій
+        max_lag = 0.0
+        async def heartbeat(stop: asyncio.Event):
+            nonlocal max_lag
+            while not stop.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.01)
+                max_lag = max(max_lag, time.perf_counter() - start - 0.01)
+
+        stop = asyncio.Event()
+        beat = asyncio.create_task(heartbeat(stop))
+        results = await asyncio.gather(*(
+            async_crud.save_valuation(user_id, 1, 1000.0, "UAH", 250.0, {}) for _ in range(20)
+        ))
+        stop.set()
+        await beat
+        locker.join()
+
+        self.assertEqual(sorted(num for _, num in results), list(range(1, 21)))
+        self.assertLess(max_lag, 0.1)
+
+if __name__ == '__main__':
+    unittest.main()
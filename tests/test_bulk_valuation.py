@@ -0,0 +1,103 @@
+import csv
+import io
+import json
+import os
+import unittest
+
+import bulk_valuation
+import catalog
+from engine import ValuationEngine
+from helpers import TempDBTestCase
+
+FIELDS = ["sku", "category", "base_price", "age_months", "phys", "tech", "comp", "warn", "brand", "urgent"]
+
+class TestBulkValuation(TempDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.category = catalog.load().categories[0]
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.tmp_dir.name, name)
+
+    def _write_csv(self, rows: list) -> str:
+        path = self._path("input.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            writer.writerows(rows)
+        return path
+
+    def _expected_price(self, base_price: float, age: int, phys: str) -> float:
+        coeff = lambda factor, code: catalog.get_coefficient_by_code(factor, code)["multiplier"]
+        return round(ValuationEngine.calculate_price(
+            base_price, age, self.category["lifespan_months"],
+            coeff("phys", phys), coeff("tech", "perfect"), coeff("comp", "full"),
+            coeff("warn", "expired"), coeff("brand", "premium"), coeff("urgent", "normal"), phys
+        ), 2)
+
+    def test_values_rows_and_reports_errors(self):
+        name = self.category["name_ua"].split(" ", 1)[1].upper()  # без емодзі та в іншому регістрі
+        rows = []
+        for i in range(50):
+            rows.append([f"A{i}", name, 10000 + i, i % 36, "sealed" if i % 5 == 0 else "good", "perfect", "full", "expired", "premium", "normal"])
+        rows.insert(10, ["BAD1", "Неіснуюча", 1000, 12, "good", "perfect", "full", "expired", "premium", "normal"])
+        rows.insert(20, ["BAD2", self.category["id"], "abc", 12, "good", "perfect", "full", "expired", "premium", "normal"])
+        rows.insert(30, ["BAD3", self.category["id"], 1000, 12, "good", "perfect", "full", "expired", "nonexistent", "normal"])
+        input_path = self._write_csv(rows)
+
+        for workers in (0, 2):
+            output_path = self._path(f"out{workers}.jsonl")
+            stats = bulk_valuation.run(input_path, output_path, workers=workers, chunk_size=7, progress=io.StringIO())
+            self.assertEqual((stats["rows"], stats["valued"], stats["errors"]), (53, 50, 3))
+
+            with open(output_path, encoding="utf-8") as f:
+                results = [json.loads(line) for line in f]
+            self.assertEqual([r["sku"] for r in results], [f"A{i}" for i in range(50)])
+            for i, result in enumerate(results):
+                phys = "sealed" if i % 5 == 0 else "good"
+                self.assertEqual(result["final_price"], self._expected_price(10000 + i, i % 36, phys))
+                self.assertEqual(result["category_id"], self.category["id"])
+
+            with open(stats["errors_path"], encoding="utf-8") as f:
+                errors = list(csv.DictReader(f))
+            self.assertEqual([e["column"] for e in errors], ["category", "base_price", "brand"])
+            self.assertEqual([int(e["line"]) for e in errors], [12, 22, 32])
+
+    def test_jsonl_input_with_broken_line(self):
+        input_path = self._path("input.jsonl")
+        with open(input_path, "w", encoding="utf-8") as f:
+            row = dict(zip(FIELDS, ["X", self.category["id"], 5000, 6, "good", "perfect", "full", "expired", "premium", "normal"]))
+            f.write(json.dumps(row) + "\n")
+            f.write("{not json\n")
+        output_path = self._path("out.csv")
+        stats = bulk_valuation.run(input_path, output_path, workers=0, progress=None)
+
+        self.assertEqual((stats["valued"], stats["errors"]), (1, 1))
+        with open(output_path, encoding="utf-8") as f:
+            result = next(csv.DictReader(f))
+        self.assertEqual(float(result["final_price"]), self._expected_price(5000, 6, "good"))
+        self.assertEqual(result["currency"], "UAH")
+
+    def test_non_finite_prices_are_row_errors(self):
+        valid = [self.category["id"], 5000, 6, "good", "perfect", "full", "expired", "premium", "normal"]
+        rows = [["OK"] + valid]
+        for sku, price in (("INF", "inf"), ("NINF", "-Infinity"), ("NAN", "nan")):
+            rows.append([sku, self.category["id"], price] + valid[2:])
+        input_path = self._write_csv(rows)
+
+        for output_name in ("out.jsonl", "out.csv"):
+            output_path = self._path(output_name)
+            stats = bulk_valuation.run(input_path, output_path, workers=0, progress=None)
+            self.assertEqual((stats["valued"], stats["errors"]), (1, 3))
+            with open(output_path, encoding="utf-8") as f:
+                content = f.read()
+            self.assertNotIn("inf", content.lower())
+            self.assertNotIn("nan", content.lower())
+            with open(stats["errors_path"], encoding="utf-8") as f:
+                self.assertEqual([e["column"] for e in csv.DictReader(f)], ["base_price"] * 3)
+        with open(self._path("out.jsonl"), encoding="utf-8") as f:
+            self.assertEqual(json.loads(f.readline())["sku"], "OK")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import sqlite3
+import unittest
+
+import catalog
+from engine import ValuationEngine
+from helpers import TempDBTestCase
+
+class TestCatalog(TempDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._orig_interval = catalog.CHECK_INTERVAL
+        catalog.CHECK_INTERVAL = 0
+        catalog.load()
+
+    def tearDown(self):
+        catalog.CHECK_INTERVAL = self._orig_interval
+        super().tearDown()
+
+    def _external_update(self, sql, params=()):
+        # Імітація зовнішнього скрипта (напр. update_db_v3.py) з окремим з'єднанням
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(sql, params)
+        conn.commit()
+        conn.close()
+
+    def test_lookups(self):
+        self.assertEqual(len(catalog.get_categories()), 9)
+        first = catalog.get_categories()[0]
+        self.assertEqual(catalog.get_category_by_id(first["id"]), first)
+        self.assertIsNone(catalog.get_category_by_id(999))
+        self.assertEqual(catalog.get_coefficient_by_code("urgent", "now")["multiplier"], 0.70)
+        self.assertIsNone(catalog.get_coefficient_by_code("urgent", "missing"))
+        self.assertEqual([c["code"] for c in catalog.get_coefficients("warn")], ["valid", "expired", "none"])
+
+    def test_reload_on_catalog_change(self):
+        snapshot = catalog.get_catalog()
+        ValuationEngine.get_k_age_curve(60, 1.0)
+
+        self._external_update("UPDATE coefficients SET multiplier = 0.65 WHERE factor_type = 'urgent' AND code = 'now'")
+
+        self.assertEqual(catalog.get_coefficient_by_code("urgent", "now")["multiplier"], 0.65)
+        self.assertGreater(catalog.version(), snapshot.version)
+        self.assertEqual(ValuationEngine._curve_cache, {})
+
+    def test_no_reload_on_unrelated_writes(self):
+        snapshot = catalog.get_catalog()
+        self._external_update("INSERT INTO users (telegram_id, username) VALUES (?, ?)", (1, "user"))
+        self.assertIs(catalog.get_catalog(), snapshot)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+
+import crud
+import database
+from helpers import TempDBTestCase
+
+class TestConcurrentAccess(TempDBTestCase):
+    """Стрес-тест: одночасні читачі та записувачі з профілем PRAGMA "performance"."""
+
+    DURATION = 1.5
+    WRITERS = 4
+    READERS = 8
+
+    def setUp(self):
+        database.set_pragma_profile("performance")
+        super().setUp()
+
+    def test_profile_applied(self):
+        conn = database.get_connection()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1) # NORMAL
+        self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+        self.assertEqual(conn.execute("PRAGMA temp_store").fetchone()[0], 2) # MEMORY
+
+    def test_readers_and_writers_without_lock_errors(self):
+        errors = []
+        counts = {"writes": 0, "reads": 0}
+        counts_lock = threading.Lock()
+        stop_at = time.monotonic() + self.DURATION
+
+        def writer(telegram_id: int):
+            try:
+                user_id = crud.get_or_create_user(telegram_id, f"user{telegram_id}")
+                while time.monotonic() < stop_at:
+                    crud.save_valuation(user_id, 1, 1000.0, "UAH", 250.0, {"item_name": "Телефон"})
+                    with counts_lock:
+                        counts["writes"] += 1
+            except Exception as e:
+                # Перевірки виконуються в головному потоці: виняток тут лише фіксується
+                errors.append(e)
+
+        def reader():
+            try:
+                while time.monotonic() < stop_at:
+                    # Вибірка останньої оцінки — як при запиті фото-сертифіката під час запису
+                    row = database.get_connection().execute("SELECT MAX(id) FROM valuations").fetchone()
+                    if row[0] and crud.get_valuation(row[0]) is None:
+                        errors.append(f"Оцінку {row[0]} не знайдено після MAX(id)")
+                    crud.get_categories()
+                    with counts_lock:
+                        counts["reads"] += 1
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(self.WRITERS)]
+        threads += [threading.Thread(target=reader) for _ in range(self.READERS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertGreater(counts["writes"], 0)
+        self.assertGreater(counts["reads"], 0)
+
+        # Номери звітів кожного користувача йдуть без пропусків і дублікатів
+        rows = database.get_connection().execute(
+            "SELECT user_id, COUNT(*), COUNT(DISTINCT user_report_num), MAX(user_report_num) FROM valuations GROUP BY user_id"
+        ).fetchall()
+        for _, total, distinct, max_num in rows:
+            self.assertEqual(total, distinct)
+            self.assertEqual(total, max_num)
+
+if __name__ == '__main__':
+    unittest.main()
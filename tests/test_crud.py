@@ -0,0 +1,112 @@
+import threading
+import unittest
+
+import crud
+import database
+import snapshot_codec
+from helpers import TempDBTestCase
+
+class TestCrud(TempDBTestCase):
+
+    def test_catalog_reads(self):
+        categories = crud.get_categories()
+        self.assertEqual(len(categories), 9)
+        self.assertEqual(crud.get_category_by_id(categories[0]["id"]), categories[0])
+        self.assertIsNone(crud.get_category_by_id(999))
+
+        coeff = crud.get_coefficient_by_code("tech", "minor_issues")
+        self.assertEqual(coeff["multiplier"], 0.85)
+        self.assertEqual([c["code"] for c in crud.get_coefficients("comp")], ["full", "partial", "device_only"])
+
+    def test_save_and_get_valuation(self):
+        user_id = crud.get_or_create_user(42, "tester")
+        self.assertEqual(crud.get_or_create_user(42, "tester"), user_id)
+
+        val_id, report_num = crud.save_valuation(user_id, 1, 1000.0, "UAH", 250.0, {"item_name": "Телефон"})
+        self.assertEqual(report_num, 1)
+        _, report_num = crud.save_valuation(user_id, 1, 500.0, "USD", 100.0, {})
+        self.assertEqual(report_num, 2)
+
+        valuation = crud.get_valuation(val_id)
+        self.assertEqual(valuation["final_price"], 250.0)
+        self.assertEqual(snapshot_codec.load_snapshot(valuation)["item_name"], "Телефон")
+        self.assertIsNone(crud.get_valuation(999))
+
+    def test_valuation_page_keyset(self):
+        user_id = crud.get_or_create_user(42, "tester")
+        other_id = crud.get_or_create_user(43, "other")
+        ids = []
+        for i in range(12):
+            ids.append(crud.save_valuation(user_id, 1, 1000.0 + i, "UAH", 100.0 + i, {})[0])
+            crud.save_valuation(other_id, 1, 1.0, "UAH", 1.0, {})
+        newest_first = ids[::-1]
+
+        page, has_more = crud.get_valuation_page(42, limit=5)
+        self.assertEqual([row["id"] for row in page], newest_first[:5])
+        self.assertTrue(has_more)
+        self.assertEqual(page[0]["user_report_num"], 12)
+
+        page, _ = crud.get_valuation_page(42, before_id=page[-1]["id"], limit=5)
+        self.assertEqual([row["id"] for row in page], newest_first[5:10])
+        last, has_more = crud.get_valuation_page(42, before_id=page[-1]["id"], limit=5)
+        self.assertEqual([row["id"] for row in last], newest_first[10:])
+        self.assertFalse(has_more)
+
+        back, has_more = crud.get_valuation_page(42, after_id=last[0]["id"], limit=5)
+        self.assertEqual(back, page)
+        self.assertTrue(has_more)
+        self.assertEqual(crud.get_valuation_page(999), ([], False))
+
+    def test_valuation_page_uses_covering_index(self):
+        plan = database.get_connection().execute(
+            "EXPLAIN QUERY PLAN SELECT id, user_report_num, created_at, category_id, final_price, currency_code "
+            "FROM valuations WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT 6", (1, 100)
+        ).fetchall()
+        details = " ".join(row["detail"] for row in plan)
+        self.assertIn("COVERING INDEX idx_valuations_user_history", details)
+        self.assertNotIn("TEMP B-TREE", details)
+
+    def test_report_counter_migration(self):
+        # Стара БД без лічильника: номери звітів мають продовжитись після міграції
+        conn = database.get_connection()
+        conn.execute("INSERT INTO users (telegram_id, username) VALUES (5, 'old')")
+        user_id = conn.execute("SELECT id FROM users WHERE telegram_id = 5").fetchone()[0]
+        for num in (1, 2, 3):
+            conn.execute(
+                "INSERT INTO valuations (user_id, category_id, base_price, currency_code, final_price, snapshot_json) VALUES (?, 1, 1, 'UAH', 1, ?)",
+                (user_id, f'{{"user_report_num": {num}}}')
+            )
+        conn.execute("UPDATE valuations SET user_report_num = NULL")
+        conn.execute("ALTER TABLE users DROP COLUMN valuation_count")
+        conn.execute("DROP INDEX idx_valuations_user_history")
+        conn.execute("ALTER TABLE valuations DROP COLUMN user_report_num")
+        conn.commit()
+        database.close_connections()
+
+        database.init_db(self.db_path)
+
+        rows = database.get_connection().execute("SELECT user_report_num FROM valuations ORDER BY id").fetchall()
+        self.assertEqual([row[0] for row in rows], [1, 2, 3])
+        _, report_num = crud.save_valuation(user_id, 1, 1.0, "UAH", 1.0, {})
+        self.assertEqual(report_num, 4)
+
+    def test_connection_reused_per_thread(self):
+        conn = database.get_connection()
+        self.assertIs(database.get_connection(), conn)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(database.get_connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+
+    def test_transaction_rollback(self):
+        with self.assertRaises(RuntimeError):
+            with database.transaction() as conn:
+                conn.execute("INSERT INTO users (telegram_id, username) VALUES (?, ?)", (7, "rollback"))
+                raise RuntimeError("boom")
+        row = database.get_connection().execute("SELECT COUNT(*) FROM users").fetchone()
+        self.assertEqual(row[0], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    from bot import currency
+except ImportError:
+    currency = None
+
+@unittest.skipIf(currency is None, "aiohttp не встановлено")
+class TestRateCache(unittest.IsolatedAsyncioTestCase):
+    """Перевірка кешу курсів на локальному stub-сервері замість API НБУ."""
+
+    async def asyncSetUp(self):
+        self.requests = 0
+        self.fail = False
+
+        async def exchange(request):
+            self.requests += 1
+            await asyncio.sleep(0.05)
+            if self.fail:
+                return web.Response(status=503)
+            rate = {"USD": 41.5, "EUR": 44.0}[request.query["valcode"]]
+            return web.json_response([{"cc": request.query["valcode"], "rate": rate}])
+
+        app = web.Application()
+        app.router.add_get("/exchange", exchange)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        url = str(self.server.make_url("/exchange")) + "?valcode={currency_code}&json"
+        self.cache = currency.RateCache(ttl=60, url_template=url)
+
+    async def asyncTearDown(self):
+        await self.cache.close()
+        await self.server.close()
+
+    async def test_single_flight(self):
+        rates = await asyncio.gather(*(self.cache.get_rate("USD") for _ in range(500)))
+        self.assertEqual(set(rates), {41.5})
+        self.assertEqual(self.requests, 1)
+
+        # Повторні запити обслуговуються з кешу
+        self.assertEqual(await self.cache.get_rate("USD"), 41.5)
+        self.assertEqual(self.requests, 1)
+        self.assertEqual(await self.cache.get_rate("UAH"), 1.0)
+
+    async def test_stale_while_revalidate(self):
+        await self.cache.get_rate("EUR")
+        self.cache.ttl = 0
+
+        # Прострочений курс віддається миттєво, оновлення йде у фоні
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self.assertEqual(await self.cache.get_rate("EUR"), 44.0)
+        self.assertLess(loop.time() - start, 0.04)
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.requests, 2)
+
+    async def test_fallback_when_upstream_fails(self):
+        self.fail = True
+        self.assertEqual(await self.cache.get_rate("USD"), currency.FALLBACK_RATES["USD"])
+
+        # Запасний курс кешується: наступні запити не чекають на недоступне API
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self.assertEqual(await self.cache.get_rate("USD"), currency.FALLBACK_RATES["USD"])
+        self.assertLess(loop.time() - start, 0.04)
+        self.assertEqual(self.requests, 1)
+
+        # Після failure_ttl запасний курс віддається одразу, а справжній оновлюється у фоні
+        self.fail = False
+        self.cache.failure_ttl = 0
+        self.cache._rates["USD"] = (currency.FALLBACK_RATES["USD"], loop.time() - self.cache.ttl)
+        self.assertEqual(await self.cache.get_rate("USD"), currency.FALLBACK_RATES["USD"])
+        await asyncio.sleep(0.1)
+        self.assertEqual(await self.cache.get_rate("USD"), 41.5)
+
+if __name__ == '__main__':
+    unittest.main()
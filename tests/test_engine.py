@@ -1,4 +1,7 @@
 import unittest
+from unittest import mock
+
+import engine
 from engine import ValuationEngine
 
 class TestValuationEngine(unittest.TestCase):
@@ -44,5 +47,88 @@ class TestValuationEngine(unittest.TestCase):
         price = ValuationEngine.calculate_price(1000, 60, 60, 0.5, 0.3, 1.0, 1.0, 1.0, 1.0, phys_code="poor")
         self.assertAlmostEqual(price, 37.5, places=1)
 
+    def test_k_age_batch_matches_scalar(self):
+        # Пакетний розрахунок повинен давати ті самі значення, що й поштучний,
+        # включно з гілками sealed/vintage та різними floor (0.20/0.30/0.40)
+        rows = [
+            (0, 60, False, 1.0),
+            (30, 60, False, 1.2),
+            (120, 60, False, 0.75),
+            (180, 60, True, 1.0),
+            (12, 60, True, 1.0),
+            (100, 240, False, 0.9),
+            (200, 360, False, 1.2),
+        ]
+        ages, lifespans, sealed, brands = (list(col) for col in zip(*rows))
+        batch = ValuationEngine.calculate_k_age_batch(ages, lifespans, sealed, brands)
+        expected = [ValuationEngine.calculate_k_age(*row) for row in rows]
+        self.assertEqual(batch, expected)
+
+    def test_calculate_price_batch_matches_scalar(self):
+        rows = [
+            (1000, 60, 60, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, "perfect"),
+            (1000, 60, 60, 0.5, 0.3, 1.0, 1.0, 1.0, 1.0, "poor"),
+            (500, 180, 60, 1.2, 1.0, 1.0, 1.0, 1.0, 0.7, "sealed"),
+            (2000, 400, 360, 0.5, 0.6, 0.8, 0.95, 0.75, 0.7, "fair"),
+        ]
+        columns = dict(zip(
+            ["base_price", "age_months", "lifespan_months", "k_phys", "k_tech",
+             "k_comp", "k_warn", "k_brand", "k_urgent", "phys_code"],
+            (list(col) for col in zip(*rows))
+        ))
+        batch = ValuationEngine.calculate_price_batch(**columns)
+        expected = [ValuationEngine.calculate_price(*row) for row in rows]
+        self.assertEqual(batch, expected)
+
+    def test_calculate_price_batch_scalar_broadcast(self):
+        # Скалярні значення застосовуються до всіх рядків
+        batch = ValuationEngine.calculate_price_batch([1000, 2000], [60, 0], 60, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, "perfect")
+        self.assertEqual(len(batch), 2)
+        self.assertAlmostEqual(batch[0], 250.0, places=0)
+        self.assertAlmostEqual(batch[1], 2000.0, places=2)
+
+    def test_calculate_price_batch_invalid_rows(self):
+        with self.assertRaises(ValueError):
+            ValuationEngine.calculate_price_batch([1000, 0], 12, 60, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0)
+        with self.assertRaises(ValueError):
+            ValuationEngine.calculate_price_batch([1000, 500], [12, 6, 1], 60, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0)
+
+    def test_batch_without_numpy_matches_vectorised(self):
+        # Без NumPy пакет рахується циклом; для цілих віків обидва шляхи дають ті самі значення,
+        # для дробових і поза таблицею кривої — з точністю до похибки exp()
+        rows = dict(
+            base_price=[1000, 500, 2000, 750], age_months=[12, 700, 30.5, 0], lifespan_months=[60, 60, 360, 84],
+            k_phys=1.0, k_tech=[1.0, 0.3, 0.6, 1.0], k_comp=0.9, k_warn=1.0, k_brand=[1.15, 1.0, 0.75, 1.0],
+            k_urgent=0.85, phys_code=["good", "sealed", "fair", "good"],
+        )
+        with mock.patch.object(engine, "_load_numpy", return_value=None):
+            looped = ValuationEngine.calculate_price_batch(**rows)
+        vectorised = ValuationEngine.calculate_price_batch(**rows)
+        for a, b in zip(looped, vectorised):
+            self.assertAlmostEqual(a, b, places=9)
+
+        # Уже розраховані K_age не перераховуються
+        k_ages = ValuationEngine.calculate_k_age_batch([12, 24], 60)
+        self.assertEqual(
+            ValuationEngine.calculate_price_batch([1000, 1000], [12, 24], 60, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, k_age=k_ages),
+            ValuationEngine.calculate_price_batch([1000, 1000], [12, 24], 60, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0),
+        )
+
+    def test_k_age_curve_cache(self):
+        # Табличні значення кривої збігаються з прямим розрахунком за формулою
+        ValuationEngine.clear_curve_cache()
+        curve = ValuationEngine.get_k_age_curve(84, 0.9)
+        self.assertEqual(len(curve.table), ValuationEngine.CURVE_TABLE_MONTHS + 1)
+        for age in (1, 12, 84, 300, ValuationEngine.CURVE_TABLE_MONTHS):
+            direct = ValuationEngine._k_age_from_params(age, 84, False, curve.floor, curve.decay_constant)
+            self.assertEqual(ValuationEngine.calculate_k_age(age, 84, brand_multiplier=0.9), direct)
+
+        # Вік поза таблицею рахується за формулою
+        self.assertAlmostEqual(ValuationEngine.calculate_k_age(5000, 84, brand_multiplier=0.9), 0.20, places=2)
+
+        self.assertIs(ValuationEngine.get_k_age_curve(84, 0.9), curve)
+        ValuationEngine.clear_curve_cache()
+        self.assertIsNot(ValuationEngine.get_k_age_curve(84, 0.9), curve)
+
 if __name__ == '__main__':
     unittest.main()
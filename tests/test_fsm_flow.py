@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+
+import async_crud
+import catalog
+import database
+import snapshot_codec
+from helpers import AsyncTempDBTestCase
+
+try:
+    from aiogram import Bot, Dispatcher
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from benchmarks.fake_telegram import FakeSession, callback_update, message_update
+    from bot.handlers import router
+except ImportError:
+    router = None
+
+@unittest.skipIf(router is None, "aiogram не встановлено")
+class TestValuationFlow(AsyncTempDBTestCase):
+    """Повний сценарій /evaluate -> терміновість через справжній router з фейковою сесією Bot API."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Router з bot.handlers можна підключити лише до одного батьківського роутера,
+        # тож диспетчер один на клас, а стан FSM кожного тесту — у власному сховищі
+        cls.dp = Dispatcher()
+        cls.dp.include_router(router)
+
+    def setUp(self):
+        super().setUp()
+        catalog.load()
+
+    def tearDown(self):
+        async_crud.shutdown()
+        super().tearDown()
+
+    async def test_full_flow(self):
+        session = FakeSession()
+        bot = Bot(token="123456:TEST", session=session)
+        dp = self.dp
+        dp.fsm.storage = MemoryStorage()
+        try:
+            steps = [
+                message_update(1, 77, "/evaluate"),
+                callback_update(2, 77, f"cat_{catalog.get_categories()[0]['id']}"),
+                message_update(3, 77, "iPhone 13"),
+                callback_update(4, 77, "curr_UAH"),
+                message_update(5, 77, "30 000"),
+                message_update(6, 77, "2 роки"),
+                callback_update(7, 77, "factor_phys_good"),
+                callback_update(8, 77, "back_to_phys"),
+                callback_update(9, 77, "factor_phys_perfect"),
+                callback_update(10, 77, "factor_tech_perfect"),
+                callback_update(11, 77, "factor_comp_full"),
+                callback_update(12, 77, "factor_warn_expired"),
+                callback_update(13, 77, "factor_brand_premium"),
+                callback_update(14, 77, "factor_urgent_normal"),
+            ]
+            for update in steps:
+                await dp.feed_update(bot, update)
+
+            self.assertEqual(session.count_text("Звіт про оцінку #1"), 1)
+            row = dict(database.get_connection().execute("SELECT * FROM valuations").fetchone())
+            snapshot = snapshot_codec.load_snapshot(row, catalog.get_catalog())
+            self.assertEqual(snapshot["item_name"], "iPhone 13")
+            self.assertIn("Ідеальний", snapshot["phys_name"])
+            self.assertGreater(row["final_price"], 0)
+
+            await dp.feed_update(bot, message_update(15, 77, "/history"))
+            self.assertEqual(session.count_text("Історія оцінок"), 1)
+            self.assertEqual(session.count_text("<b>#1</b>"), 1)
+        finally:
+            await dp.fsm.storage.close()
+
+if __name__ == '__main__':
+    unittest.main()
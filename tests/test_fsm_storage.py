@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import unittest
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.storage.base import StorageKey
+
+import database
+from bot.fsm_storage import SQLiteStorage
+from bot.states import ValuationFSM
+from helpers import TempDBTestCase
+
+def _key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+class TestSQLiteStorage(TempDBTestCase):
+
+    SEED = False
+
+    def _rows(self) -> int:
+        return database.get_connection(self.db_path).execute("SELECT COUNT(*) FROM fsm_storage").fetchone()[0]
+
+    def test_state_survives_restart(self):
+        async def scenario():
+            storage = SQLiteStorage(self.db_path, flush_interval=60)
+            await storage.set_state(_key(1), ValuationFSM.choosing_currency)
+            await storage.update_data(_key(1), {"category_id": 3, "item_name": "Ноутбук"})
+            await storage.set_state(_key(2), ValuationFSM.choosing_category)
+            await storage.set_state(_key(2), None)
+            # Натискання кнопок не пишуть у БД синхронно
+            self.assertEqual(self._rows(), 0)
+            await storage.close()
+
+            restored = SQLiteStorage(self.db_path)
+            self.assertEqual(await restored.restore(), 1)
+            self.assertEqual(await restored.get_state(_key(1)), ValuationFSM.choosing_currency.state)
+            self.assertEqual(await restored.get_data(_key(1)), {"category_id": 3, "item_name": "Ноутбук"})
+            self.assertIsNone(await restored.get_state(_key(2)))
+            await restored.close()
+
+        asyncio.run(scenario())
+
+    def test_evicted_keys_reload_and_batch_is_coalesced(self):
+        async def scenario():
+            storage = SQLiteStorage(self.db_path, cache_size=2, flush_interval=60)
+            for user_id in range(1, 6):
+                for step in (ValuationFSM.choosing_category, ValuationFSM.entering_item_name, ValuationFSM.choosing_currency):
+                    await storage.set_state(_key(user_id), step)
+            # Витіснений ключ до запису береться з черги змін
+            self.assertEqual(await storage.get_state(_key(1)), ValuationFSM.choosing_currency.state)
+            # 15 змін станів п'яти користувачів — один пакет з п'яти рядків
+            self.assertEqual(await storage.flush(), 5)
+            self.assertEqual(self._rows(), 5)
+            # Після запису витіснений ключ читається з БД
+            self.assertEqual(await storage.get_state(_key(2)), ValuationFSM.choosing_currency.state)
+            await storage.set_data(_key(3), {})
+            await storage.set_state(_key(3), None)
+            await storage.close()
+            self.assertEqual(self._rows(), 4)
+
+        asyncio.run(scenario())
+
+    def test_concurrent_updates_of_evicted_key_are_not_lost(self):
+        async def scenario():
+            storage = SQLiteStorage(self.db_path, cache_size=1, flush_interval=60)
+            await storage.set_state(_key(1), ValuationFSM.choosing_category)
+            await storage.flush()
+            await storage.set_state(_key(2), ValuationFSM.choosing_category)  # витісняє ключ 1
+
+            # Друге читання з БД (якщо воно буде) чекає, доки його не відпустять
+            release = threading.Event()
+            loads = []
+            load_one = storage._load_one
+            def gated_load(raw_key):
+                loads.append(raw_key)
+                if len(loads) == 2:
+                    release.wait(5)
+                return load_one(raw_key)
+            storage._load_one = gated_load
+
+            reader = asyncio.create_task(storage.get_state(_key(1)))
+            writer = asyncio.create_task(storage.set_data(_key(1), {"item_name": "Ноутбук"}))
+            await reader
+            # Поки set_data чекає на БД, інший апдейт змінює стан; ключ витісняється і скидається
+            await storage.set_state(_key(1), ValuationFSM.choosing_currency)
+            await storage.set_state(_key(2), ValuationFSM.entering_item_name)
+            flushing = asyncio.create_task(storage.flush())
+            await asyncio.sleep(0)
+            release.set()
+            await asyncio.gather(writer, flushing)
+
+            self.assertEqual(await storage.get_state(_key(1)), ValuationFSM.choosing_currency.state)
+            self.assertEqual(await storage.get_data(_key(1)), {"item_name": "Ноутбук"})
+            self.assertEqual(storage._misses, {})
+            await storage.close()
+
+        asyncio.run(scenario())
+
+    def test_stale_load_is_retried(self):
+        async def scenario():
+            storage = SQLiteStorage(self.db_path, cache_size=1, flush_interval=60)
+            await storage.set_state(_key(1), ValuationFSM.choosing_category)
+            await storage.flush()
+            await storage.set_state(_key(2), ValuationFSM.choosing_category)
+
+            release = threading.Event()
+            load_one = storage._load_one
+            def gated_load(raw_key):
+                release.wait(5)
+                return load_one(raw_key)
+            storage._load_one = gated_load
+
+            writer = asyncio.create_task(storage.set_data(_key(1), {"item_name": "Ноутбук"}))
+            await asyncio.sleep(0.01)
+            # Під час читання ключ змінюється, витісняється і передається на запис
+            storage._put(_key(1), (ValuationFSM.choosing_currency.state, {}))
+            await storage.set_state(_key(2), ValuationFSM.entering_item_name)
+            flushing = asyncio.create_task(storage.flush())
+            await asyncio.sleep(0)
+            release.set()
+            await asyncio.gather(writer, flushing)
+
+            self.assertEqual(await storage.get_state(_key(1)), ValuationFSM.choosing_currency.state)
+            self.assertEqual(await storage.get_data(_key(1)), {"item_name": "Ноутбук"})
+            await storage.close()
+
+        asyncio.run(scenario())
+
+    def test_data_is_copied_and_validated(self):
+        async def scenario():
+            storage = SQLiteStorage(self.db_path)
+            data = {"items": 1}
+            await storage.set_data(_key(1), data)
+            data["items"] = 2
+            (await storage.get_data(_key(1)))["items"] = 3
+            self.assertEqual(await storage.get_data(_key(1)), {"items": 1})
+            with self.assertRaises(DataNotDictLikeError):
+                await storage.set_data(_key(1), [("items", 1)])
+            await storage.close()
+
+        asyncio.run(scenario())
+
+if __name__ == '__main__':
+    unittest.main()
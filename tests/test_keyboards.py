@@ -0,0 +1,64 @@
+import sqlite3
+import unittest
+
+import catalog
+import metrics
+from helpers import TempDBTestCase
+
+try:
+    from bot import keyboards
+except ImportError:
+    keyboards = None
+
+@unittest.skipIf(keyboards is None, "aiogram не встановлено")
+class TestKeyboardRegistry(TempDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._orig_interval = catalog.CHECK_INTERVAL
+        catalog.CHECK_INTERVAL = 0
+        catalog.load()
+        metrics.registry.reset()
+        self.registry = keyboards.KeyboardRegistry()
+
+    def tearDown(self):
+        catalog.CHECK_INTERVAL = self._orig_interval
+        super().tearDown()
+
+    def test_markups_are_reused_until_catalog_changes(self):
+        first = self.registry.get(("categories",))
+        self.assertIs(self.registry.get(("categories",)), first)
+        self.assertIs(self.registry.get(("currency",)), self.registry.get(("currency",)))
+        self.assertEqual(self.registry.rebuilds, 1)
+
+        # Зміна довідника іншим з'єднанням (як update_db_v3.py) -> новий набір клавіатур
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE categories SET name_ua = 'Нова категорія' WHERE id = 1")
+        conn.commit()
+        conn.close()
+
+        rebuilt = self.registry.get(("categories",))
+        self.assertIsNot(rebuilt, first)
+        self.assertEqual(rebuilt.inline_keyboard[0][0].text, "Нова категорія")
+        self.assertEqual(self.registry.rebuilds, 2)
+
+        stats = self.registry.build_stats()
+        self.assertEqual(stats["catalog_version"], catalog.version())
+        self.assertEqual(metrics.registry.counter_value("evs_keyboard_rebuilds_total"), 2)
+        self.assertEqual(metrics.registry.gauge_value("evs_keyboard_catalog_version"), catalog.version())
+        self.assertIsNotNone(metrics.registry.gauge_value("evs_keyboard_build_seconds", {"keyboard": "factor:phys"}))
+
+    def test_back_buttons_follow_factor_order(self):
+        self.assertEqual(keyboards.BACK_TARGETS, {
+            "tech": "phys", "comp": "tech", "warn": "comp", "brand": "warn", "urgent": "brand",
+        })
+        for factor, previous in keyboards.BACK_TARGETS.items():
+            last_row = self.registry.get(("factor", factor, previous)).inline_keyboard[-1]
+            self.assertEqual(last_row[0].callback_data, f"back_to_{previous}")
+        first_step = self.registry.get(("factor", "phys", None)).inline_keyboard
+        self.assertFalse(any(button.callback_data.startswith("back_to_") for row in first_step for button in row))
+        with self.assertRaises(KeyError):
+            self.registry.get(("factor", "phys", "urgent"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+
+import metrics
+
+try:
+    from aiogram import Bot, Dispatcher, Router
+    from aiogram.filters import Command
+    from aiohttp import ClientSession
+    from benchmarks.fake_telegram import FakeSession, message_update
+    from bot.middlewares import setup_metrics
+except ImportError:
+    Router = None
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.MetricsRegistry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        for value in (0.0005, 0.003, 0.003, 20.0):
+            self.registry.observe("evs_span_latency_seconds", value, {"span": "db"})
+        text = self.registry.render_prometheus()
+
+        self.assertIn("# TYPE evs_span_latency_seconds histogram", text)
+        self.assertIn('evs_span_latency_seconds_bucket{span="db",le="0.001"} 1', text)
+        self.assertIn('evs_span_latency_seconds_bucket{span="db",le="0.005"} 3', text)
+        self.assertIn('evs_span_latency_seconds_bucket{span="db",le="+Inf"} 4', text)
+        self.assertIn('evs_span_latency_seconds_count{span="db"} 4', text)
+
+    def test_quantile_uses_bucket_upper_bound(self):
+        histogram = metrics.Histogram()
+        for _ in range(95):
+            histogram.observe(0.002)
+        for _ in range(5):
+            histogram.observe(0.2)
+        self.assertEqual(histogram.quantile(0.5), 0.0025)
+        self.assertEqual(histogram.quantile(0.95), 0.0025)
+        self.assertEqual(histogram.quantile(0.99), 0.25)
+
+    def test_span_counts_errors(self):
+        metrics.registry.reset()
+        with self.assertRaises(ValueError):
+            with metrics.span("nbu"):
+                raise ValueError("boom")
+        self.assertEqual(metrics.registry.counter_value("evs_span_errors_total", {"span": "nbu"}), 1)
+        self.assertEqual(metrics.registry.span_summary()[0]["calls"], 1)
+
+    def test_span_cancellation_is_not_an_error(self):
+        metrics.registry.reset()
+        for exc in (asyncio.CancelledError, KeyboardInterrupt):
+            with self.assertRaises(exc):
+                with metrics.span("nbu"):
+                    raise exc()
+        self.assertEqual(metrics.registry.counter_value("evs_span_errors_total", {"span": "nbu"}), 0)
+        self.assertEqual(metrics.registry.histogram("evs_span_latency_seconds", {"span": "nbu"}).count, 2)
+
+@unittest.skipIf(Router is None, "aiogram/aiohttp не встановлено")
+class TestMetricsMiddleware(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        metrics.registry.reset()
+        router = Router()
+
+        @router.message(Command("ok"))
+        async def handle_ok(message):
+            await message.answer("ok")
+
+        @router.message(Command("fail"))
+        async def handle_fail(message):
+            raise RuntimeError("fail")
+
+        setup_metrics(router)
+        self.dp = Dispatcher()
+        self.dp.include_router(router)
+        self.bot = Bot(token="123456:TEST", session=FakeSession())
+
+    async def test_counts_calls_errors_and_unhandled(self):
+        await self.dp.feed_update(self.bot, message_update(1, 5, "/ok"))
+        await self.dp.feed_update(self.bot, message_update(2, 5, "/ok"))
+        with self.assertRaises(RuntimeError):
+            await self.dp.feed_update(self.bot, message_update(3, 5, "/fail"))
+        await self.dp.feed_update(self.bot, message_update(4, 5, "hello"))
+
+        registry = metrics.registry
+        self.assertEqual(registry.counter_value("evs_handler_calls_total", {"handler": "handle_ok"}), 2)
+        self.assertEqual(registry.counter_value("evs_handler_errors_total", {"handler": "handle_fail"}), 1)
+        self.assertEqual(registry.counter_value("evs_handler_calls_total", {"handler": "unhandled"}), 1)
+        self.assertEqual(registry.histogram("evs_handler_latency_seconds", {"handler": "handle_ok"}).count, 2)
+
+    async def test_http_endpoint_serves_prometheus_text(self):
+        await self.dp.feed_update(self.bot, message_update(1, 5, "/ok"))
+        runner = await metrics.start_http_server("127.0.0.1", 0)
+        try:
+            port = runner.addresses[0][1]
+            async with ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    self.assertEqual(response.status, 200)
+                    body = await response.text()
+        finally:
+            await runner.cleanup()
+        self.assertIn('evs_handler_calls_total{handler="handle_ok"} 1', body)
+
+if __name__ == '__main__':
+    unittest.main()
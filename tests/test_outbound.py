@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+
+import metrics
+
+try:
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from benchmarks.fake_telegram import FakeTelegramServer
+    from bot.outbound import setup_outbound
+except ImportError:
+    setup_outbound = None
+
+@unittest.skipIf(setup_outbound is None, "aiogram/aiohttp не встановлено")
+class TestOutboundScheduler(unittest.IsolatedAsyncioTestCase):
+    """Планувальник перевіряється через справжню AiohttpSession і локальний фейковий Bot API."""
+
+    async def asyncSetUp(self):
+        metrics.registry.reset()
+        self.server = FakeTelegramServer()
+        await self.server.start()
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.server.base_url))
+        self.bot = Bot(token="123456:TEST", session=session)
+
+    async def asyncTearDown(self):
+        await self.bot.session.close()
+        await self.server.stop()
+
+    async def test_global_and_chat_limits(self):
+        setup_outbound(self.bot, global_rate=50, global_burst=1, chat_rate=10, chat_burst=1)
+        await asyncio.gather(
+            *(self.bot.send_message(chat_id, "hi") for chat_id in range(1, 11)),
+            *(self.bot.send_message(99, f"chat {i}") for i in range(5)),
+            self.bot.answer_callback_query("cb"),
+        )
+        sends = sorted(ts for ts, _ in self.server.calls_to("sendMessage"))
+        self.assertEqual(len(sends), 15)
+        # 15 повідомлень при 50/с без пачки — не швидше ніж 14 інтервалів по 20 мс
+        self.assertGreaterEqual(sends[-1] - sends[0], 14 * 0.02 * 0.9)
+        chat = sorted(ts for ts, fields in self.server.calls_to("sendMessage") if fields["chat_id"] == "99")
+        self.assertGreaterEqual(chat[-1] - chat[0], 4 * 0.1 * 0.9)
+        self.assertEqual(len(self.server.calls_to("answerCallbackQuery")), 1)
+        self.assertEqual(metrics.registry.histogram("evs_outbound_wait_seconds", {"method": "SendMessage"}).count, 15)
+
+    async def test_superseded_edits_are_coalesced(self):
+        setup_outbound(self.bot, chat_rate=5, chat_burst=1)
+        await self.bot.send_message(7, "start")
+        results = await asyncio.gather(*(
+            self.bot.edit_message_text(f"крок {i}", chat_id=7, message_id=1) for i in range(5)
+        ))
+        edits = [fields["text"] for _, fields in self.server.calls_to("editMessageText")]
+        self.assertEqual(edits, ["крок 4"])
+        self.assertEqual([message.text for message in results], ["крок 4"] * 5)
+        self.assertEqual(metrics.registry.counter_value("evs_outbound_coalesced_total", {"method": "EditMessageText"}), 4)
+
+    async def test_retry_after_is_honored(self):
+        setup_outbound(self.bot, retry_jitter=0.05)
+        self.server.flood_chats["5"] = 1
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        message = await self.bot.send_message(5, "after flood")
+        self.assertGreaterEqual(loop.time() - start, 1.0)
+        self.assertEqual(message.text, "after flood")
+        self.assertEqual(len(self.server.calls_to("sendMessage")), 1)
+        self.assertEqual(metrics.registry.counter_value("evs_outbound_retries_total", {"method": "SendMessage"}), 1)
+
+    async def test_cancelled_edit_releases_waiters(self):
+        scheduler = setup_outbound(self.bot, chat_rate=1, chat_burst=1)
+        await self.bot.send_message(7, "start")
+        waiters = [asyncio.ensure_future(self.bot.edit_message_text(f"крок {i}", chat_id=7, message_id=1))
+                   for i in range(3)]
+        await asyncio.sleep(0.05)
+        # Спільне редагування чекає слоту чату; його завдання скасовують
+        self.assertEqual(len(scheduler._tasks), 1)
+        for task in list(scheduler._tasks):
+            task.cancel()
+        done, pending = await asyncio.wait(waiters, timeout=1)
+        self.assertEqual(pending, set())
+        self.assertTrue(all(waiter.cancelled() for waiter in done))
+        self.assertEqual(self.server.calls_to("editMessageText"), [])
+        # Нові редагування того ж повідомлення ставляться в чергу заново
+        message = await self.bot.edit_message_text("знову", chat_id=7, message_id=1)
+        self.assertEqual(message.text, "знову")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import metrics
+from bot import receipt
+from bot.receipt_cache import ReceiptCache
+
+class TestReceiptCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.snapshot = {"item_name": "Телефон", "currency": "UAH", "base_price": 1000.0, "user_report_num": 1}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_render_once_then_disk_hit(self):
+        cache = ReceiptCache(self.tmp_dir.name)
+        first = cache.get_or_render(self.snapshot, 250.0)
+        self.assertTrue(first.startswith(b"\x89PNG"))
+
+        with mock.patch.object(receipt, "generate_receipt_image") as render:
+            self.assertEqual(cache.get_or_render(self.snapshot, 250.0), first)
+            render.assert_not_called()
+
+        # Новий екземпляр відновлює індекс з диску
+        restored = ReceiptCache(self.tmp_dir.name)
+        self.assertEqual(restored.get_or_render(self.snapshot, 250.0), first)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+        self.assertEqual(restored.stats()["disk_hits"], 1)
+
+    def test_key_depends_on_content(self):
+        key = ReceiptCache.make_key(self.snapshot, 250.0)
+        self.assertEqual(key, ReceiptCache.make_key(dict(reversed(list(self.snapshot.items()))), 250.0))
+        self.assertNotEqual(key, ReceiptCache.make_key(self.snapshot, 251.0))
+
+    def test_lru_eviction(self):
+        metrics.registry.reset()
+        cache = ReceiptCache(self.tmp_dir.name, max_bytes=25)
+        with mock.patch.object(receipt, "generate_receipt_image") as render:
+            for i in range(3):
+                render.return_value.getvalue.return_value = bytes([i]) * 10
+                cache.get_or_render({"n": i}, 1.0)
+
+        stats = cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["entries"], 2)
+        # Ті самі лічильники — у реєстрі метрик (/metrics)
+        self.assertEqual(metrics.registry.counter_value("evs_receipt_cache_total", {"event": "evictions"}), 1)
+        self.assertEqual(metrics.registry.counter_value("evs_receipt_cache_total", {"event": "misses"}), 3)
+        self.assertEqual(metrics.registry.gauge_value("evs_receipt_cache_bytes"), 20)
+        self.assertEqual(len(os.listdir(self.tmp_dir.name)), 2)
+        self.assertFalse(os.path.exists(cache._path(ReceiptCache.make_key({"n": 0}, 1.0))))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+import crud
+import database
+import rollups
+from helpers import TempDBTestCase
+
+def _snapshot(urgent: str) -> dict:
+    return {"phys_code": "good", "tech_code": "perfect", "urgent_code": urgent}
+
+class TestRollups(TempDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user_id = crud.get_or_create_user(42, "tester")
+
+    def _dump(self) -> dict:
+        conn = database.get_connection()
+        return {
+            table: sorted(tuple(row) for row in conn.execute(f"SELECT * FROM {table}"))
+            for table in ("valuation_rollups", "valuation_price_buckets", "valuation_factor_rollups")
+        }
+
+    def test_incremental_matches_backfill_and_report(self):
+        for final_price, urgent in ((1000.0, "normal"), (2000.0, "fast"), (3000.0, "now"), (900.0, "normal")):
+            crud.save_valuation(self.user_id, 1, final_price * 2, "UAH", final_price, _snapshot(urgent))
+        crud.save_valuation(self.user_id, 2, 100.0, "USD", 50.0, _snapshot("normal"))
+
+        incremental = self._dump()
+        self.assertEqual(rollups.backfill(), 5)
+        self.assertEqual(self._dump(), incremental)
+
+        report = {(row["category_id"], row["currency_code"]): row for row in rollups.report("2000-01-01")}
+        gadgets = report[(1, "UAH")]
+        self.assertEqual(gadgets["count"], 4)
+        self.assertAlmostEqual(gadgets["avg_final_price"], 1725.0)
+        self.assertAlmostEqual(gadgets["avg_base_price"], 3450.0)
+        self.assertAlmostEqual(gadgets["urgent_share"], 0.5)
+        low, high = rollups.bucket_bounds(rollups.price_bucket(1000.0))
+        self.assertTrue(low <= gadgets["median_final_price"] < high)
+        self.assertEqual(report[(2, "USD")]["count"], 1)
+        self.assertEqual(rollups.report("2999-01-01"), [])
+
+    def test_urgent_share_is_per_currency(self):
+        for _ in range(2):
+            crud.save_valuation(self.user_id, 1, 200.0, "UAH", 100.0, _snapshot("now"))
+            crud.save_valuation(self.user_id, 1, 20.0, "USD", 10.0, _snapshot("normal"))
+
+        report = {row["currency_code"]: row["urgent_share"] for row in rollups.report("2000-01-01")}
+        self.assertEqual(report, {"UAH": 1.0, "USD": 0.0})
+        rollups.backfill()
+        report = {row["currency_code"]: row["urgent_share"] for row in rollups.report("2000-01-01")}
+        self.assertEqual(report, {"UAH": 1.0, "USD": 0.0})
+
+    def test_rollups_roll_back_with_valuation(self):
+        with self.assertRaises(RuntimeError):
+            with database.transaction() as conn:
+                crud.insert_valuation(conn, self.user_id, 1, 10.0, "UAH", 5.0, _snapshot("normal"))
+                raise RuntimeError("boom")
+        self.assertEqual(self._dump(), {"valuation_rollups": [], "valuation_price_buckets": [], "valuation_factor_rollups": []})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import json
+import unittest
+
+import catalog
+import crud
+import database
+import snapshot_codec
+from helpers import TempDBTestCase
+
+class TestSnapshotCodec(TempDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.catalog = catalog.load()
+
+        category = self.catalog.categories[0]
+        self.snapshot = {
+            "category_id": category["id"], "category_name": category["name_ua"],
+            "lifespan_months": category["lifespan_months"], "item_name": "iPhone 13 Pro",
+            "currency": "USD", "base_price": 999.0, "age_months": 24, "pending_age_num": 2,
+            "age_multiplier": 0.6143928, "user_report_num": 7,
+        }
+        for factor, code in zip(snapshot_codec.FACTORS, ("good", "perfect", "full", "expired", "apple", "fast")):
+            coeff = self.catalog.coefficients_by_code[(factor, code)]
+            self.snapshot.update({f"{factor}_code": code, f"{factor}_multiplier": coeff["multiplier"], f"{factor}_name": coeff["name_ua"]})
+
+    def test_round_trip_resolves_names_from_catalog(self):
+        blob = snapshot_codec.encode(self.snapshot)
+        self.assertEqual(blob[0], snapshot_codec.FORMAT_VERSION)
+        self.assertLess(len(blob), len(json.dumps(self.snapshot, ensure_ascii=False).encode("utf-8")) / 4)
+        self.assertEqual(snapshot_codec.decode(blob, self.catalog), self.snapshot)
+
+    def test_skipped_item_name_and_missing_codes(self):
+        self.snapshot["item_name"] = self.snapshot["category_name"]
+        decoded = snapshot_codec.decode(snapshot_codec.encode(self.snapshot), self.catalog)
+        self.assertEqual(decoded["item_name"], self.snapshot["category_name"])
+
+        # Без довідника назви замінюються кодами, числа зберігаються
+        bare = snapshot_codec.decode(snapshot_codec.encode(self.snapshot))
+        self.assertEqual(bare["brand_name"], "apple")
+        self.assertEqual(bare["brand_multiplier"], self.snapshot["brand_multiplier"])
+        self.assertEqual(snapshot_codec.decode(snapshot_codec.encode({})), {})
+
+    def test_rejects_unknown_version(self):
+        with self.assertRaises(snapshot_codec.SnapshotFormatError):
+            snapshot_codec.decode(b"\x63\x00{}")
+
+    def _insert_legacy(self, snapshot_jsons: list, data_version: int = 0) -> None:
+        """Рядки у форматі до міграції; data_version=0 — БД, створена до компактних знімків."""
+        conn = database.get_connection()
+        conn.executemany(
+            "INSERT INTO valuations (user_id, category_id, base_price, currency_code, final_price, snapshot_json) VALUES (1, ?, 999, 'USD', 500, ?)",
+            [(self.snapshot["category_id"], snapshot_json) for snapshot_json in snapshot_jsons]
+        )
+        conn.execute(f"PRAGMA user_version = {data_version}")
+        conn.commit()
+        database.close_connections()
+
+    def test_migrates_legacy_json_rows(self):
+        self._insert_legacy([json.dumps(self.snapshot, ensure_ascii=False)])
+
+        database.init_db(self.db_path)
+
+        # Міграція при старті не знищує snapshot_json: його очищає лише явна команда
+        valuation = crud.get_valuation(1)
+        self.assertNotEqual(valuation["snapshot_json"], "")
+        self.assertEqual(snapshot_codec.load_snapshot(valuation, self.catalog), self.snapshot)
+
+        self.assertEqual(database.compact_snapshots(self.db_path), 1)
+        valuation = crud.get_valuation(1)
+        self.assertEqual(valuation["snapshot_json"], "")
+        self.assertEqual(snapshot_codec.load_snapshot(valuation, self.catalog), self.snapshot)
+
+    def test_malformed_legacy_row_does_not_abort_migration(self):
+        legacy = json.dumps(self.snapshot, ensure_ascii=False)
+        self._insert_legacy(["{не json", legacy])
+
+        with self.assertLogs("database", "WARNING") as logs:
+            database.init_db(self.db_path)
+        self.assertIn("1, id: 1", "\n".join(logs.output))
+
+        broken, migrated = crud.get_valuation(1), crud.get_valuation(2)
+        self.assertEqual(broken["snapshot"], b"")
+        self.assertEqual(broken["snapshot_json"], "{не json")
+        self.assertEqual(snapshot_codec.load_snapshot(migrated, self.catalog), self.snapshot)
+        self.assertEqual(database.compact_snapshots(self.db_path, vacuum=False), 1)
+        self.assertEqual(crud.get_valuation(1)["snapshot_json"], "{не json")
+
+    def test_migration_runs_once(self):
+        self.assertEqual(database.get_connection().execute("PRAGMA user_version").fetchone()[0], database.SCHEMA_VERSION)
+        # Рядок, що з'явився після міграції, повторний старт уже не сканує й не перекодовує
+        self._insert_legacy([json.dumps(self.snapshot, ensure_ascii=False)], data_version=database.SCHEMA_VERSION)
+
+        database.init_db(self.db_path)
+        self.assertIsNone(crud.get_valuation(1)["snapshot"])
+
+    def test_item_name_survives_category_rename(self):
+        self.snapshot["item_name"] = self.snapshot["category_name"]
+        blob = snapshot_codec.encode(self.snapshot)
+        conn = database.get_connection()
+        conn.execute("UPDATE categories SET name_ua = 'Нова назва' WHERE id = ?", (self.snapshot["category_id"],))
+        conn.commit()
+        renamed = catalog.load()
+
+        decoded = snapshot_codec.decode(blob, renamed)
+        self.assertEqual(decoded["item_name"], self.snapshot["item_name"])
+        self.assertEqual(snapshot_codec.decode(blob)["item_name"], self.snapshot["item_name"])
+
+if __name__ == '__main__':
+    unittest.main()
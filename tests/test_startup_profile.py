@@ -0,0 +1,53 @@
+import unittest
+
+import metrics
+import startup_profile
+
+IMPORTTIME_OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |        900 |     aiogram.types
+import time:       200 |       1100 |   aiogram
+import time:        50 |       1250 | main
+"""
+
+class TestStartupProfile(unittest.TestCase):
+
+    def test_parse_and_summarize(self):
+        records = startup_profile.parse_importtime(IMPORTTIME_OUTPUT)
+        self.assertEqual([r.module for r in records], ["_io", "aiogram.types", "aiogram", "main"])
+        self.assertEqual([r.depth for r in records], [1, 2, 1, 0])
+
+        summary = startup_profile.summarize(records, top=2)
+        self.assertEqual(summary["total_us"], 670)
+        self.assertEqual(summary["packages"], [("aiogram", 500), ("_io", 120)])
+        self.assertEqual([r.module for r in summary["slowest"]], ["aiogram.types", "aiogram"])
+
+        self.assertEqual(startup_profile.check(records, budget_ms=1), [])
+        self.assertEqual(len(startup_profile.check(records, budget_ms=0.5, lazy_modules=("aiogram.types",))), 2)
+        # main — модуль проєкту: 50 із 670 мкс (7%)
+        self.assertEqual(startup_profile.check(records, max_own_share=0.1), [])
+        self.assertEqual(len(startup_profile.check(records, max_own_share=0.05)), 1)
+
+    def test_cold_start_within_budget(self):
+        """
+        Регресія холодного старту: PIL, NumPy і клієнт НБУ не завантажуються під час імпорту main,
+        сумарний час імпорту — в межах IMPORT_BUDGET_MS, а частка модулів проєкту — OWN_IMPORT_SHARE.
+        """
+        records = startup_profile.profile_imports("main")
+        self.assertIn("bot.handlers", {record.module for record in records})
+        problems = startup_profile.check(
+            records, budget_ms=startup_profile.IMPORT_BUDGET_MS, max_own_share=startup_profile.OWN_IMPORT_SHARE
+        )
+        self.assertEqual(problems, [], startup_profile.format_summary(startup_profile.summarize(records)))
+
+    def test_timer_reports_first_update_once(self):
+        timer = startup_profile.StartupTimer()
+        timer.mark("imports")
+        self.assertTrue(timer.mark_first_update())
+        self.assertFalse(timer.mark_first_update())
+        self.assertEqual(list(timer.phases), ["imports"])
+        self.assertIn('evs_startup_seconds{phase="first_update"}', metrics.registry.render_prometheus())
+
+if __name__ == '__main__':
+    unittest.main()
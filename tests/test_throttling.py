@@ -0,0 +1,75 @@
+import unittest
+
+import metrics
+
+try:
+    from aiogram import Bot, Dispatcher, Router
+    from aiogram.methods import AnswerCallbackQuery
+    from benchmarks.fake_telegram import FakeSession, callback_update, message_update
+    from bot.middlewares import ThrottlingMiddleware, setup_throttling
+except ImportError:
+    ThrottlingMiddleware = None
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@unittest.skipIf(ThrottlingMiddleware is None, "aiogram не встановлено")
+class TestTokenBucket(unittest.TestCase):
+
+    def test_burst_refill_and_eviction(self):
+        clock = FakeClock()
+        throttling = ThrottlingMiddleware(rate=2, burst=3, idle_seconds=60, clock=clock)
+        self.assertEqual([throttling.allow(1) for _ in range(5)], [True, True, True, False, None])
+        # Інший користувач має власне відро
+        self.assertTrue(throttling.allow(2))
+
+        clock.now += 0.5  # +1 токен
+        self.assertEqual([throttling.allow(1), throttling.allow(1)], [True, False])
+
+        clock.now += 30
+        throttling.allow(2)
+        self.assertEqual(throttling.active_users, 2)
+        clock.now += 40  # відро користувача 1 простоює 70 с, користувача 2 — 40 с
+        throttling.allow(3)
+        self.assertEqual(throttling.active_users, 2)
+        self.assertNotIn(1, throttling._buckets)
+
+@unittest.skipIf(ThrottlingMiddleware is None, "aiogram не встановлено")
+class TestThrottlingMiddleware(unittest.IsolatedAsyncioTestCase):
+
+    async def test_excess_events_skip_handlers(self):
+        metrics.registry.reset()
+        handled = []
+        router = Router()
+
+        @router.message()
+        async def on_message(message):
+            handled.append(message.from_user.id)
+
+        @router.callback_query()
+        async def on_callback(callback):
+            handled.append(callback.from_user.id)
+
+        setup_throttling(router, rate=0.001, burst=2)
+        dp = Dispatcher()
+        dp.include_router(router)
+        session = FakeSession()
+        bot = Bot(token="123456:TEST", session=session)
+
+        for i in range(1, 11):
+            await dp.feed_update(bot, callback_update(i, 77, "factor_phys_good"))
+        await dp.feed_update(bot, message_update(11, 77, "30 000"))
+        await dp.feed_update(bot, message_update(12, 88, "/evaluate"))
+
+        self.assertEqual(handled, [77, 77, 88])
+        # Лише одна відповідь на всю серію відкинутих натискань
+        self.assertEqual(sum(isinstance(method, AnswerCallbackQuery) for method in session.requests), 1)
+        self.assertEqual(metrics.registry.counter_value("evs_throttle_dropped_total", {"event": "callback_query"}), 8)
+        self.assertEqual(metrics.registry.counter_value("evs_throttle_dropped_total", {"event": "message"}), 1)
+
+if __name__ == '__main__':
+    unittest.main()
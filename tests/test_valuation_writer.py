@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import unittest
+
+import crud
+import database
+from valuation_writer import ValuationWriter
+from helpers import TempDBTestCase
+
+class TestValuationWriter(TempDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user_id = crud.get_or_create_user(1, "tester")
+        self.writer = ValuationWriter(max_batch_rows=50, max_delay_ms=20)
+
+    def tearDown(self):
+        self.writer.stop()
+        super().tearDown()
+
+    def _count(self) -> int:
+        return database.get_connection().execute("SELECT COUNT(*) FROM valuations").fetchone()[0]
+
+    def test_concurrent_submits_are_batched(self):
+        futures = []
+        def submit_many():
+            for _ in range(50):
+                futures.append(self.writer.submit(self.user_id, 1, 1000.0, "UAH", 250.0, {}))
+        threads = [threading.Thread(target=submit_many) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        results = [f.result(timeout=5) for f in futures]
+        self.assertEqual(sorted(num for _, num in results), list(range(1, 201)))
+        self.assertEqual(len({val_id for val_id, _ in results}), 200)
+        self.assertLess(self.writer.batches, 200)
+        self.assertEqual(self._count(), 200)
+
+    def test_stop_flushes_pending(self):
+        futures = [self.writer.submit(self.user_id, 1, 1000.0, "UAH", 250.0, {}) for _ in range(30)]
+        self.writer.stop()
+        self.assertTrue(all(f.done() for f in futures))
+        self.assertEqual(self._count(), 30)
+
+    def test_bad_row_does_not_fail_batch(self):
+        good = self.writer.submit(self.user_id, 1, 1000.0, "UAH", 250.0, {})
+        bad = self.writer.submit(self.user_id, 1, None, "UAH", 250.0, {}) # base_price NOT NULL
+        good_after = self.writer.submit(self.user_id, 1, 1000.0, "UAH", 250.0, {})
+
+        self.assertEqual(good.result(timeout=5)[1], 1)
+        with self.assertRaises(Exception):
+            bad.result(timeout=5)
+        self.assertEqual(good_after.result(timeout=5)[1], 2)
+        self.assertEqual(self._count(), 2)
+
+    def test_cancelled_waiter_does_not_kill_writer(self):
+        """Скасована задача-очікувач не повинна зупиняти потік записувача."""
+        async def scenario():
+            tasks = [asyncio.create_task(self.writer.save_valuation(self.user_id, 1, 1000.0, "UAH", 250.0, {})) for _ in range(20)]
+            await asyncio.sleep(0)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Окремо — Future, скасований до того, як записувач його забрав
+            self.writer.submit(self.user_id, 1, 1000.0, "UAH", 250.0, {}).cancel()
+            return await asyncio.wait_for(self.writer.save_valuation(self.user_id, 1, 1000.0, "UAH", 250.0, {}), timeout=5)
+
+        val_id, _ = asyncio.run(scenario())
+        self.assertIsNotNone(val_id)
+        self.assertTrue(self.writer._thread.is_alive())
+
+    def test_submit_during_stop_is_resolved(self):
+        futures = []
+        stopper = threading.Thread(target=self.writer.stop)
+        self.writer.submit(self.user_id, 1, 1000.0, "UAH", 250.0, {})
+        stopper.start()
+        for _ in range(20):
+            futures.append(self.writer.submit(self.user_id, 1, 1000.0, "UAH", 250.0, {}))
+        stopper.join()
+        self.assertEqual(len([f.result(timeout=5) for f in futures]), 20)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+import async_crud
+import catalog
+import metrics
+from helpers import AsyncTempDBTestCase
+
+try:
+    import aiohttp
+    from bot import keyboards, receipt, warmup
+except ImportError:
+    warmup = None
+
+@unittest.skipIf(warmup is None, "aiogram/aiohttp/Pillow не встановлено")
+class TestWarmUp(AsyncTempDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        catalog.invalidate()
+        receipt.get_template.cache_clear()
+        metrics.registry.reset()
+
+    def tearDown(self):
+        async_crud.shutdown()
+        receipt.shutdown()
+        super().tearDown()
+
+    async def test_warm_up_then_ready(self):
+        runner = await metrics.start_http_server("127.0.0.1", 0)
+        url = f"http://127.0.0.1:{runner.addresses[0][1]}/ready"
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url) as response:
+                    self.assertEqual(response.status, 503)
+
+                # Без курсів: тест не ходить у мережу
+                timings = await warmup.warm_up(currencies=())
+                self.assertEqual(list(timings), ["db", "catalog", "keyboards", "receipt", "rates"])
+                self.assertEqual(len(async_crud._read_executor._threads), async_crud.READ_WORKERS)
+                self.assertEqual(keyboards.registry.build_stats()["catalog_version"], catalog.version())
+                self.assertEqual(receipt.get_template.cache_info().currsize, 2)
+
+                with self.assertLogs("bot.warmup", "INFO") as logs:
+                    warmup.emit_ready(timings)
+                self.assertIn("EVS_READY", logs.output[0])
+                async with session.get(url) as response:
+                    self.assertEqual(response.status, 200)
+        finally:
+            await runner.cleanup()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+
+import metrics
+
+try:
+    import aiohttp
+    from aiogram import Bot, Dispatcher, Router
+    from aiogram.types import Message
+    from benchmarks.fake_telegram import FakeSession, message_update
+    from bot.webhook import SECRET_HEADER, WebhookServer
+except ImportError:
+    WebhookServer = None
+
+@unittest.skipIf(WebhookServer is None, "aiogram/aiohttp не встановлено")
+class TestWebhookServer(unittest.IsolatedAsyncioTestCase):
+    """Записані апдейти надсилаються POST-запитами на локальний webhook-сервер."""
+
+    def setUp(self):
+        metrics.registry.reset()
+        self.release = asyncio.Event()
+        self.active = 0
+        self.max_active = 0
+        self.handled = []
+
+        router = Router()
+
+        @router.message()
+        async def slow_handler(message: Message):
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            await self.release.wait()
+            self.active -= 1
+            self.handled.append(message.text)
+
+        self.dp = Dispatcher()
+        self.dp.include_router(router)
+        self.bot = Bot(token="123456:TEST", session=FakeSession())
+
+    async def _start(self, **kwargs) -> WebhookServer:
+        server = WebhookServer(self.dp, self.bot, secret_token="s3cret", **kwargs)
+        await server.start("127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{server.port}/webhook"
+        return server
+
+    async def _post(self, session, update_id: int, secret: str = "s3cret") -> int:
+        update = message_update(update_id, 77, f"msg {update_id}").model_dump(mode="json", exclude_none=True)
+        async with session.post(self.url, json=update, headers={SECRET_HEADER: secret}) as response:
+            return response.status
+
+    async def _wait_for(self, condition) -> None:
+        for _ in range(200):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail("умова не виконалась")
+
+    async def test_concurrency_limit_and_backpressure(self):
+        server = await self._start(max_in_flight=2, queue_size=2, enqueue_timeout=0.1)
+        async with aiohttp.ClientSession() as session:
+            # Відповідь приходить до завершення обробки: повільні обробники не блокують прийом
+            statuses = [await self._post(session, i) for i in range(1, 5)]
+            self.assertEqual(statuses, [200] * 4)
+            await self._wait_for(lambda: server.in_flight == 2)
+            self.assertEqual(server.queue_depth, 2)
+            self.assertEqual(metrics.registry.counter_value("evs_webhook_requests_total", {"result": "accepted"}), 4)
+
+            # Черга заповнена — після очікування запит отримує 503
+            self.assertEqual(await self._post(session, 5), 503)
+            self.assertEqual(metrics.registry.counter_value("evs_webhook_requests_total", {"result": "rejected"}), 1)
+            self.assertEqual(await self._post(session, 6, secret="wrong"), 401)
+
+            self.release.set()
+            await self._wait_for(lambda: len(self.handled) == 4)
+
+        await server.stop()
+        self.assertEqual(self.max_active, 2)
+        self.assertEqual(sorted(self.handled), [f"msg {i}" for i in range(1, 5)])
+        self.assertEqual(metrics.registry.histogram("evs_webhook_queue_wait_seconds").count, 4)
+        self.assertIn("evs_webhook_queue_depth 0", metrics.registry.render_prometheus())
+
+    async def test_stop_drains_queue(self):
+        server = await self._start(max_in_flight=1, queue_size=10)
+        async with aiohttp.ClientSession() as session:
+            for i in range(1, 4):
+                self.assertEqual(await self._post(session, i), 200)
+        self.release.set()
+        await server.stop()
+        self.assertEqual(len(self.handled), 3)
+
+    async def test_stop_cancels_stuck_handlers_after_timeout(self):
+        server = await self._start(max_in_flight=1, queue_size=10, drain_timeout=0.2)
+        async with aiohttp.ClientSession() as session:
+            for i in range(1, 4):
+                self.assertEqual(await self._post(session, i), 200)
+        await self._wait_for(lambda: server.in_flight == 1)
+        # Обробник завис (release не встановлено) — зупинка все одно завершується
+        await asyncio.wait_for(server.stop(), timeout=2)
+        self.assertEqual(self.handled, [])
+        self.assertEqual(server.in_flight, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+import crud
+import database
+
+logger = logging.getLogger(__name__)
+
+# Пакет фіксується, щойно набрано MAX_BATCH_ROWS оцінок або минуло MAX_DELAY_MS
+# з моменту надходження першої оцінки пакета
+MAX_BATCH_ROWS = 200
+MAX_DELAY_MS = 2
+
+_STOP = object()
+
+class ValuationWriter:
+    """
+    Write-behind записувач оцінок із груповою фіксацією (group commit).
+
+    Оцінки з усіх обробників складаються в чергу, а окремий потік записує їх
+    пакетами — одна транзакція (і один fsync) на пакет замість одного на оцінку.
+    Кожна оцінка отримує Future з (val_id, user_report_num), який завершується
+    після фіксації пакета, тож обробник отримує номер звіту як і раніше.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_batch_rows: int = MAX_BATCH_ROWS, max_delay_ms: float = MAX_DELAY_MS):
+        self.db_path = db_path
+        self.max_batch_rows = max_batch_rows
+        self.max_delay = max_delay_ms / 1000
+        self._queue: Optional["queue.Queue"] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+
+    def start(self) -> None:
+        """Запускає фоновий потік записувача (повторний виклик нічого не робить)."""
+        with self._lock:
+            self._ensure_running()
+
+    def _ensure_running(self) -> None:
+        # Викликається під self._lock. Кожен потік має власну чергу: оцінки, подані
+        # під час stop(), потрапляють уже до нового потоку, а не губляться після _STOP
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self._thread is not None:
+            # Потік аварійно завершився: невиконані оцінки з його черги завершуємо помилкою
+            logger.error("Потік записувача оцінок неочікувано зупинився, перезапуск")
+            self._fail_pending(self._queue, RuntimeError("Потік записувача оцінок зупинився"))
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, args=(self._queue,), name="valuation-writer", daemon=True)
+        self._thread.start()
+        # Страховка на випадок, якщо stop() не буде викликано явно
+        atexit.register(self.stop)
+
+    def submit(self, user_id: int, category_id: int, base_price: float, currency_code: str, final_price: float, snapshot: dict) -> "Future[Tuple[int, int]]":
+        """Ставить оцінку в чергу запису. Повертає Future з (val_id, user_report_num)."""
+        future: "Future[Tuple[int, int]]" = Future()
+        with self._lock:
+            self._ensure_running()
+            self._queue.put((future, (user_id, category_id, base_price, currency_code, final_price, snapshot)))
+        return future
+
+    async def save_valuation(self, user_id: int, category_id: int, base_price: float, currency_code: str, final_price: float, snapshot: dict) -> Tuple[int, int]:
+        """Асинхронне збереження: чекає на фіксацію пакета, не блокуючи цикл подій."""
+        return await asyncio.wrap_future(self.submit(user_id, category_id, base_price, currency_code, final_price, snapshot))
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Записує всі оцінки, що залишились у черзі, та зупиняє потік."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            jobs = self._queue
+            jobs.put(_STOP)
+        thread.join(timeout)
+        if not thread.is_alive():
+            # Потік міг завершитися раніше за _STOP — ніхто не повинен чекати вічно
+            self._fail_pending(jobs, RuntimeError("Записувач оцінок зупинено"))
+        atexit.unregister(self.stop)
+        logger.info(f"Записувач оцінок зупинено: {self.rows} оцінок у {self.batches} пакетах.")
+
+    def _run(self, jobs: "queue.Queue") -> None:
+        stopping = False
+        try:
+            while not stopping:
+                item = jobs.get()
+                if item is _STOP:
+                    break
+                batch = self._take([], item)
+
+                # Добираємо пакет, поки не вичерпано ліміт рядків або часу
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_batch_rows:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = jobs.get(timeout=remaining) if remaining > 0 else jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    self._take(batch, item)
+
+                self._write_safely(batch)
+
+            # Після сигналу зупинки дописуємо все, що встигло потрапити в чергу
+            leftovers = []
+            while True:
+                try:
+                    item = jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    self._take(leftovers, item)
+            self._write_safely(leftovers)
+        finally:
+            database.close_thread_connections()
+
+    @staticmethod
+    def _take(batch: List[tuple], item: tuple) -> List[tuple]:
+        # Оцінку, на яку вже ніхто не чекає (задачу скасовано), не записуємо;
+        # після set_running_or_notify_cancel() Future скасувати вже не можна
+        if item[0].set_running_or_notify_cancel():
+            batch.append(item)
+        return batch
+
+    def _write_safely(self, batch: List[tuple]) -> None:
+        """Помилка одного пакета не повинна зупиняти потік: його оцінки завершуються з помилкою."""
+        if not batch:
+            return
+        try:
+            self._write_batch(batch)
+        except Exception as e:
+            logger.exception(f"Непередбачена помилка запису пакета з {len(batch)} оцінок")
+            for future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    @staticmethod
+    def _fail_pending(jobs: "queue.Queue", error: Exception) -> None:
+        while True:
+            try:
+                item = jobs.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP and item[0].set_running_or_notify_cancel():
+                item[0].set_exception(error)
+
+    def _write_batch(self, batch: List[tuple]) -> None:
+        try:
+            with database.transaction(self.db_path) as conn:
+                results = [crud.insert_valuation(conn, *args) for _, args in batch]
+        except Exception as e:
+            # Пакет відкочено: записуємо оцінки поштучно, щоб помилка однієї не зачепила інші
+            logger.error(f"Помилка пакетного запису {len(batch)} оцінок, повтор поштучно: {e}")
+            for future, args in batch:
+                try:
+                    with database.transaction(self.db_path) as conn:
+                        result = crud.insert_valuation(conn, *args)
+                except Exception as row_error:
+                    future.set_exception(row_error)
+                else:
+                    future.set_result(result)
+            return
+
+        self.batches += 1
+        self.rows += len(batch)
+        for (future, _), result in zip(batch, results):
+            future.set_result(result)